@@ -0,0 +1,108 @@
+import random
+
+import chess
+import numpy as np
+
+from ..planning.board import PhysicalBoard
+from ..planning.graph import Circle
+
+# The piece counts of the board positions
+PIECE_COUNTS = [2, 4, 8, 12, 16, 20, 24, 28, 32]
+
+# The (columns, rows) of the circle grids, like the grids of the astar and graph tests
+GRID_SIZES = [(4, 4), (8, 4), (8, 8), (16, 8)]
+GRID_RADIUS = 0.2
+
+# Seed of the random positions, changing it changes the baseline
+SEED = 0
+
+
+class BenchmarkCase():
+    """
+    A path query around a set of obstacle circles.
+    """
+
+    def __init__(self, name, obstacles, start, goal, description=""):
+        self.name = name
+        self.description = description
+        self.obstacles = obstacles
+        self.start = np.asarray(start, dtype=float)
+        self.goal = np.asarray(goal, dtype=float)
+
+    def get_name(self):
+        return self.name
+
+    def get_description(self):
+        return self.description
+
+    def get_obstacles(self):
+        return self.obstacles
+
+    def get_start(self):
+        return self.start
+
+    def get_goal(self):
+        return self.goal
+
+
+def random_position(piece_count, rng):
+    """
+    Get a board with the two kings and piece_count - 2 other pieces on random squares.
+    """
+    board = chess.BaseBoard(None)
+
+    squares = rng.sample(chess.SQUARES, piece_count)
+    board.set_piece_at(squares[0], chess.Piece(chess.KING, chess.WHITE))
+    board.set_piece_at(squares[1], chess.Piece(chess.KING, chess.BLACK))
+
+    # The other pieces are drawn from the pieces of the starting position
+    pieces = [piece for square, piece in chess.BaseBoard().piece_map().items() if piece.piece_type != chess.KING]
+    for square, piece in zip(squares[2:], rng.sample(pieces, piece_count - 2)):
+        board.set_piece_at(square, piece)
+
+    return board
+
+
+def board_case(piece_count, rng, board=None):
+    """
+    Get the query of moving a random piece of a random position to a random empty square.
+    The moved piece is not an obstacle of its own path.
+    """
+    if board is None:
+        board = PhysicalBoard(400, 400, 22, 1, [np.array([375, 200])] * 4)
+
+    position = random_position(piece_count, rng)
+    board.board.set_board_fen(position.board_fen())
+
+    occupied = board.get_piece_positions()
+
+    start_square = rng.choice(sorted(occupied.keys()))
+    goal_square = rng.choice(sorted(set(chess.SQUARE_NAMES) - set(occupied.keys())))
+
+    obstacles = [Circle(board.get_clearance_radius(), square_position) for square, square_position in occupied.items() if square != start_square]
+
+    name = "board/{:02d}".format(piece_count)
+    description = "{} {}{}".format(position.board_fen(), start_square, goal_square)
+
+    return BenchmarkCase(name, obstacles, occupied[start_square], board.get_square_position(goal_square), description)
+
+
+def grid_case(columns, rows, radius=GRID_RADIUS):
+    """
+    Get the query across a grid of circles with a spacing of 1, between the gaps of the opposite corners.
+    """
+    obstacles = [Circle(radius, np.array([i, j], dtype=float)) for i in range(columns) for j in range(rows)]
+
+    return BenchmarkCase("grid/{}x{}".format(columns, rows), obstacles, [0.5, 0.5], [columns - 1.5, rows - 1.5])
+
+
+def get_corpus(piece_counts=PIECE_COUNTS, grid_sizes=GRID_SIZES, seed=SEED):
+    """
+    Get the benchmark cases, the board positions are the same for the same seed.
+    """
+    rng = random.Random(seed)
+
+    cases = [board_case(piece_count, rng) for piece_count in piece_counts]
+    cases += [grid_case(columns, rows) for columns, rows in grid_sizes]
+
+    return cases
@@ -0,0 +1,260 @@
+import argparse
+from contextlib import redirect_stdout
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from ..planning.astar import Astar
+from ..planning.graph import Graph
+from ..planning.planner import search
+from .corpus import get_corpus
+
+# The baseline stored with the suite
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A stage regresses if it is this much slower than the baseline
+# NOTE: Single stages vary by up to 30% between runs on a shared machine
+REGRESSION_THRESHOLD = 0.5
+
+# A stage also has to be this much slower (seconds) to regress, small differences of fast stages are noise
+NOISE_FLOOR = 0.005
+
+# Number of runs of each case, the fastest run is kept
+REPEAT = 5
+
+# The timed stages in the order they run
+STAGES = ["construct", "clean_surfing_edges", "prepare", "search", "add_point", "calculate_path"]
+
+# The counts that must match the baseline
+# NOTE: The expansions of Astar are not compared, its frontier breaks ties between nodes of equal priority differently between runs
+COMPARED_COUNTS = ["circles", "nodes", "surfing_edges", "hugging_edges", "tangent_edges", "search_expansions", "search_path_nodes", "astar_path_nodes"]
+
+
+def run_case(case):
+    """
+    Runs the planning stages of a case once.
+    Returns the time of each stage and the counts of the graph and searches.
+
+    """
+    obstacles = case.get_obstacles()
+    times = {}
+
+    # Building the bitangents of all circle pairs
+    start_time = time.perf_counter()
+    graph = Graph(obstacles)
+    times["construct"] = time.perf_counter() - start_time
+
+    # Removing the bitangents that cross a circle, the first step of prepare
+    start_time = time.perf_counter()
+    graph.clean_surfing_edges()
+    times["clean_surfing_edges"] = time.perf_counter() - start_time
+
+    # A full preparation on a new graph
+    graph = Graph(obstacles)
+
+    start_time = time.perf_counter()
+    graph.prepare()
+    times["prepare"] = time.perf_counter() - start_time
+
+    counts = {
+        "circles": len(graph.get_circles()),
+        "nodes": len(graph.get_nodes()),
+        "surfing_edges": len(graph.surfing_edges),
+        "hugging_edges": len(graph.hugging_edges),
+    }
+
+    # The planner query on the prepared graph, it doesn't change the graph
+    start_time = time.perf_counter()
+    result = search(graph, case.get_start(), case.get_goal())
+    times["search"] = time.perf_counter() - start_time
+
+    counts["search_expansions"] = result.get_expansions()
+    counts["search_path_nodes"] = len(result.get_path()) if result.is_found() else 0
+
+    # The Astar query inserts the start and goal into the graph
+    astar = Astar(graph)
+
+    start_time = time.perf_counter()
+    astar.set_start(case.get_start())
+    astar.set_goal(case.get_goal())
+    times["add_point"] = time.perf_counter() - start_time
+
+    counts["tangent_edges"] = len(graph.tangent_edges)
+
+    # Astar prints its progress
+    with redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        path = astar.calculate_path()
+        times["calculate_path"] = time.perf_counter() - start_time
+
+    counts["astar_expansions"] = astar.get_expansions()
+    counts["astar_path_nodes"] = len(path)
+
+    return times, counts
+
+
+def measure_memory(case):
+    """
+    Get the peak memory in bytes allocated while running a case.
+    NOTE: Tracing slows down the allocations, so the memory is measured in a separate run.
+
+    """
+    tracemalloc.start()
+
+    try:
+        run_case(case)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def format_header():
+    return "{:<10} {:>7} {:>6} {:>10}".format("case", "circles", "edges", "expansions") + "".join(" {:>9}".format(stage[:9]) for stage in STAGES) + " {:>9}".format("peak KiB")
+
+
+def format_row(name, result):
+    """
+    Formats the result of a case as a row of the scaling table, the times are in ms.
+
+    """
+    counts = result["counts"]
+
+    row = "{:<10} {:>7} {:>6} {:>10}".format(name, counts["circles"], counts["surfing_edges"] + counts["hugging_edges"], counts["search_expansions"])
+    row += "".join(" {:>9.2f}".format(result["times"][stage] * 1000) for stage in STAGES)
+
+    return row + " {:>9.1f}".format(result["peak_memory"] / 1024)
+
+
+def run_suite(cases, repeat=REPEAT, log=print):
+    """
+    Runs the cases and returns the results keyed by the case name.
+    The time of each stage is the fastest of the runs, it is the least disturbed by other processes.
+    NOTE: Every round runs all cases once, so a burst of load on the machine slows down one run of a case and not all of them.
+
+    """
+    times = {case.get_name(): {stage: None for stage in STAGES} for case in cases}
+    counts = {}
+
+    for _ in range(repeat):
+        for case in cases:
+            # The collector pauses depend on the garbage of the previous runs, like timeit it is off while timing
+            gc.collect()
+            gc.disable()
+
+            try:
+                run_times, counts[case.get_name()] = run_case(case)
+            finally:
+                gc.enable()
+
+            case_times = times[case.get_name()]
+            for stage in STAGES:
+                if case_times[stage] is None or run_times[stage] < case_times[stage]:
+                    case_times[stage] = run_times[stage]
+
+    results = {}
+
+    log(format_header())
+
+    for case in cases:
+        results[case.get_name()] = {
+            "description": case.get_description(),
+            "times": times[case.get_name()],
+            "counts": counts[case.get_name()],
+            "peak_memory": measure_memory(case),
+        }
+
+        log(format_row(case.get_name(), results[case.get_name()]))
+
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, noise_floor=NOISE_FLOOR):
+    """
+    Compares results to a baseline, a stage regresses if its fastest time is slower by the threshold and by the noise floor.
+    NOTE: The times are absolute, a baseline is only meaningful on the machine it was saved on.
+    Returns a list of messages, one for every stage that regressed and every count that changed.
+
+    """
+    messages = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        expected = baseline[name]
+
+        for stage in STAGES:
+            if stage not in expected["times"]:
+                continue
+
+            current_time, expected_time = result["times"][stage], expected["times"][stage]
+
+            if current_time > expected_time * (1 + threshold) and current_time - expected_time > noise_floor:
+                messages.append("{} {}: {:.2f}ms -> {:.2f}ms (+{:.0f}%)".format(name, stage, expected_time * 1000, current_time * 1000, (current_time / expected_time - 1) * 100))
+
+        # Different counts mean the graph or the search changed, not only its speed
+        for key in COMPARED_COUNTS:
+            if key in expected["counts"] and expected["counts"][key] != result["counts"][key]:
+                messages.append("{} {}: {} -> {}".format(name, key, expected["counts"][key], result["counts"][key]))
+
+        if result["peak_memory"] > expected["peak_memory"] * (1 + threshold):
+            messages.append("{} peak_memory: {:.1f}KiB -> {:.1f}KiB".format(name, expected["peak_memory"] / 1024, result["peak_memory"] / 1024))
+
+    return messages
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as file:
+        return json.load(file)["cases"]
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, "w") as file:
+        json.dump({"python": sys.version.split(" ")[0], "cases": results}, file, indent=2)
+        file.write("\n")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the path planning on board positions and circle grids.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="The baseline JSON to compare to or save")
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="The allowed slowdown, 0.5 is 50%%")
+    parser.add_argument("--noise-floor", type=float, default=NOISE_FLOOR, help="The allowed slowdown in seconds of any stage")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="The number of runs of each case")
+    parser.add_argument("--output", help="Write the results to a JSON file")
+    args = parser.parse_args(args)
+
+    results = run_suite(get_corpus(), args.repeat)
+
+    if args.output is not None:
+        save_baseline(results, args.output)
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print("Baseline saved to " + args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save to create one".format(args.baseline))
+        return 0
+
+    messages = compare(results, load_baseline(args.baseline), args.threshold, args.noise_floor)
+
+    for message in messages:
+        print("Regression: " + message)
+
+    if len(messages) > 0:
+        return 1
+
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
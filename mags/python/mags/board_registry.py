@@ -0,0 +1,380 @@
+import json
+import queue
+from threading import Lock
+
+import numpy as np
+
+from stockfish import Stockfish
+from job_queue import JobQueue, JobRejected
+from geometry_feed import GeometryFeed
+from klipper_interface import Klipper
+from move_manager import MoveManager
+from move_observer import MoveObserver
+from occupancy_feed import OccupancyFeed
+from planning.astar import Astar
+from planning.board import PhysicalBoard
+from planning.graph import Circle
+from planning.raster import get_renderer
+
+STOCKFISH_PATH = "stockfish/stockfish_15.1_linux_x64_avx2/stockfish-ubuntu-20.04-x86-64-avx2"
+
+DEFAULT_BOARD = "default"
+
+
+def get_gpio_errors():
+    """
+    Get the exceptions raised when the reed switches are not available.
+    NOTE: gpiozero is only installed on the robot, so it is imported when the errors are needed.
+    """
+    try:
+        from gpiozero.exc import GPIOZeroError
+    except ImportError:
+        return (ImportError,)
+
+    return (ImportError, GPIOZeroError)
+
+
+class BoardConfig():
+    """
+    The configuration of one table: the board dimensions, the capture slots and the address of its printer.
+    A table without a moonraker address only plans its moves (e.g. for development).
+    """
+
+    def __init__(self, board_id, length=400, width=400, piece_diameter=22, clearance=1, capture_positions=None, moonraker_address=None, http_address=None, observe=False, home_position=None, park_position=None, stream_graph=False):
+        self.board_id = board_id
+
+        self.length = length
+        self.width = width
+        self.piece_diameter = piece_diameter
+        self.clearance = clearance
+
+        if capture_positions is None:
+            capture_positions = [[375, 200]] * 4
+        self.capture_positions = [np.array(position, dtype=float) for position in capture_positions]
+
+        self.moonraker_address = moonraker_address
+        self.http_address = http_address
+
+        # Only one table can use the reed switch matrix of the controller
+        self.observe = observe
+
+        self.home_position = home_position
+        self.park_position = park_position
+
+        # Send the planning graph with the geometry of every plan (for debugging)
+        self.stream_graph = stream_graph
+
+    @classmethod
+    def from_dict(cls, config):
+        return cls(config.pop("id"), **config)
+
+
+class EnginePool():
+    """
+    A fixed number of stockfish processes shared by all tables.
+    A table borrows an engine for the duration of one search, so the number of engines limits the searches running at once and not the number of tables.
+    """
+
+    def __init__(self, size=1, path=STOCKFISH_PATH, parameters=None):
+        self.engines = queue.Queue()
+
+        for _ in range(size):
+            self.engines.put(Stockfish(path=path, parameters=parameters))
+
+    def get_best_move(self, fen):
+        engine = self.engines.get()
+
+        try:
+            engine.set_fen_position(fen)
+            return engine.get_best_move()
+        finally:
+            self.engines.put(engine)
+
+
+class BoardEngine():
+    """
+    The engine of one table, searches on an engine borrowed from the pool.
+    NOTE: This has the interface of Stockfish that the MoveManager uses.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.fen = None
+
+    def set_fen_position(self, fen):
+        self.fen = fen
+
+    def get_best_move(self):
+        return self.pool.get_best_move(self.fen)
+
+
+class BoardSession():
+    """
+    The state of one table: its board, move manager, printer connection, reed switches and job worker.
+    All events of the table are sent to the Socket.IO room named by the board id.
+    """
+
+    def __init__(self, config, engine_pool, socketio):
+        self.config = config
+        self.socketio = socketio
+
+        self.board = PhysicalBoard(config.length, config.width, config.piece_diameter, config.clearance, capture_positions=config.capture_positions)
+        self.board.reset()
+
+        options = {}
+        if config.home_position is not None:
+            options["home_position"] = config.home_position
+
+        self.move_manager = MoveManager(self.board, Astar(), BoardEngine(engine_pool), park_position=config.park_position, **options)
+
+        # Connect in the background so the server starts even if the printer is offline
+        self.klipper = None
+        if config.moonraker_address is not None:
+            self.klipper = Klipper(config.moonraker_address, self.log, self.log, http_address=config.http_address)
+            self.klipper.connect()
+
+        # The occupancy of the reed switches is sent to the clients of the table when it changes
+        self.occupancy_feed = OccupancyFeed(socketio, room=config.board_id)
+
+        # The geometry of every plan is sent to the clients of the table
+        self.geometry_feed = GeometryFeed(socketio, config.width, config.length, room=config.board_id, include_graph=config.stream_graph)
+
+        # The reed switch matrix is only available on the robot
+        self.move_observer = None
+        if config.observe:
+            try:
+                self.move_observer = MoveObserver(self.board, self.log)
+            except get_gpio_errors():
+                print("Reed switches not available, moves are not observed on " + config.board_id)
+
+        if self.move_observer is not None:
+            self.move_observer.add_listener(self.occupancy_feed.publish)
+            self.move_observer.start()
+
+        # The state of the table is only changed by the jobs of its queue, one job at a time
+        self.job_queue = JobQueue(self.publish_job)
+        self.job_queue.add_handler("start", self.run_start)
+        self.job_queue.add_handler("end", self.run_end)
+        self.job_queue.add_handler("move", self.run_move)
+
+    def get_id(self):
+        return self.config.board_id
+
+    def log(self, message):
+        print("[{}] {}".format(self.config.board_id, message))
+
+    def emit(self, event, data, to=None):
+        self.socketio.emit(event, data, to=to if to is not None else self.config.board_id)
+
+    def publish_job(self, event, job):
+        job["board"] = self.config.board_id
+        self.emit(event, job)
+
+        # The client still shows the dropped move, send it the actual position
+        if event == "job_stale":
+            self.update_state()
+
+    def submit(self, kind, payload=None):
+        """
+        Queues a job of the table and returns its id.
+        Starting or ending twice before the job runs only runs it once, a move made on an old position is dropped.
+        """
+        if kind == "move":
+            return self.job_queue.submit(kind, payload, stale=True).get_id()
+
+        return self.job_queue.submit(kind, payload, key=kind).get_id()
+
+    def send_current(self, sid):
+        """
+        Sends the current position and occupancy to a client that joined the table.
+        """
+        self.emit("update", self.board.get_fen(), to=sid)
+        self.occupancy_feed.send_current(sid)
+        self.geometry_feed.send_current(sid)
+
+    def run_start(self, job):
+        self.log("Starting game!")
+
+        obstacles = self.get_obstacles()
+
+        # Set the pieces back up from wherever they ended up, the board is unchanged if it can't be planned
+        try:
+            plan = self.move_manager.plan_setup()
+        except RuntimeError as error:
+            raise JobRejected(str(error)) from error
+
+        self.publish_geometry(plan, obstacles)
+
+        # The reset moves every piece, so it is printed as a file instead of streamed
+        self.send_plan(plan, job, upload=True)
+
+        return self.board.get_fen()
+
+    def run_end(self, job):
+        self.log("Ending game!")
+
+        self.board.clear()
+
+        self.update_state()
+
+        return self.board.get_fen()
+
+    def run_move(self, job):
+        if not self.board.make_move(job.payload):
+            self.update_state()
+            raise JobRejected("Illegal move: " + str(job.payload))
+
+        self.log(self.board.get_fen())
+        job.set_progress(0.1)
+
+        obstacles = self.get_obstacles()
+
+        try:
+            plan = self.move_manager.respond()
+        except Exception as error:
+            # The engine's move can't be made, take the player's move back so the table isn't stuck on the engine's turn
+            self.board.undo_move()
+            self.update_state()
+            raise JobRejected(str(error)) from error
+
+        job.set_progress(0.5)
+
+        self.publish_geometry(plan, obstacles)
+
+        self.send_plan(plan, job)
+
+        return self.board.get_fen()
+
+    def get_obstacles(self):
+        """
+        Get the circles around the pieces on the board, the obstacles of the next plan.
+        """
+        return [Circle(self.board.get_clearance_radius(), position) for position in self.board.get_piece_positions().values()]
+
+    def publish_geometry(self, plan, obstacles):
+        # The visualization must not fail the move
+        try:
+            self.geometry_feed.publish(plan, obstacles, self.move_manager.map)
+        except Exception as error:
+            self.log("Error Publishing Geometry: " + repr(error))
+
+    def send_plan(self, plan, job, upload=False):
+        """
+        Send the gcode of planned actions to klipper and wait until the robot has finished moving.
+        Long plans can be uploaded and printed as a file instead.
+        NOTE: This runs on the job worker, so no other job changes the board while the robot moves.
+        """
+        # The drags restore the acceleration of the printer config instead of the default of the motion profile
+        if self.klipper is not None and self.klipper.get_max_accel() is not None:
+            self.move_manager.set_travel_accel(self.klipper.get_max_accel())
+
+        gcode = "\n".join(self.move_manager.trace_plan(plan))
+
+        if self.klipper is None:
+            self.log("No printer configured, the plan is not executed")
+            self.update_state()
+            return
+
+        # The pieces moved by the robot are not moves of the player
+        if self.move_observer is not None:
+            self.move_observer.set_robot_moving(True)
+
+        try:
+            if upload:
+                future = self.klipper.print_gcode(gcode, lambda progress: job.set_progress(0.5 + progress / 2))
+            else:
+                future = self.klipper.execute_gcode(gcode)
+
+            future.result()
+        finally:
+            self.motion_complete()
+
+    def motion_complete(self):
+        """
+        Called once the robot has finished moving the pieces of a plan.
+        """
+        if self.move_observer is not None:
+            self.move_observer.set_robot_moving(False)
+
+        self.update_state()
+
+    def update_state(self):
+        self.emit("update", self.board.get_fen())
+
+    def get_image(self):
+        """
+        Get the piece placement of the current position and its PNG, the PNGs are cached by the shared renderer.
+        """
+        fen = self.board.get_fen()
+
+        return fen.split(" ")[0], get_renderer().render_png(fen)
+
+    def get_metrics(self):
+        return {
+            "stream": self.klipper.get_stream_metrics() if self.klipper is not None else None,
+            "turns": self.move_manager.get_turn_reports(),
+        }
+
+
+class BoardRegistry():
+    """
+    The tables hosted by the server keyed by their board id.
+    The engines are shared through the engine pool and the square layouts through their geometry cache, every table builds its own planning graphs.
+    """
+
+    def __init__(self, socketio, engine_pool):
+        self.socketio = socketio
+        self.engine_pool = engine_pool
+
+        self.sessions = {}
+        # The ids of the tables whose sessions are being built
+        self.pending = set()
+        self.lock = Lock()
+
+    def add_board(self, config):
+        """
+        Builds and registers the session of a table.
+        NOTE: The id is reserved before the session is built, so a duplicate id never connects to the printer or starts the threads of a session.
+        """
+        with self.lock:
+            if config.board_id in self.sessions or config.board_id in self.pending:
+                raise ValueError("Board already registered: " + config.board_id)
+
+            self.pending.add(config.board_id)
+
+        try:
+            session = BoardSession(config, self.engine_pool, self.socketio)
+        except Exception:
+            with self.lock:
+                self.pending.discard(config.board_id)
+            raise
+
+        with self.lock:
+            self.pending.discard(config.board_id)
+            self.sessions[config.board_id] = session
+
+        return session
+
+    def load(self, path):
+        """
+        Adds the tables of a JSON config file, a list of BoardConfig fields with the board id as "id".
+        """
+        with open(path) as file:
+            configs = json.load(file)
+
+        return [self.add_board(BoardConfig.from_dict(config)) for config in configs]
+
+    def get(self, board_id):
+        """
+        Get the session of a table or None if it doesn't exist.
+        """
+        with self.lock:
+            return self.sessions.get(board_id)
+
+    def get_ids(self):
+        with self.lock:
+            return list(self.sessions.keys())
+
+    def get_sessions(self):
+        with self.lock:
+            return list(self.sessions.values())
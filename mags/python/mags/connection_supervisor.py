@@ -0,0 +1,170 @@
+import asyncio
+
+from moonraker import MoonrakerError
+
+
+class KlippyNotReady(Exception):
+    """
+    Raised when moonraker is reachable but klipper is not ready.
+    """
+
+
+class ConnectionSupervisor():
+    """
+    Keeps the moonraker connection alive in the background.
+
+    1. The websocket is opened and the supervisor waits for klipper to report that it is ready
+    2. The ready callbacks run (e.g. to subscribe to the printer status) and the connection is marked as ready
+    3. The connection is health checked with server.info, a failed check or a closed websocket starts a reconnect
+    4. Failed attempts are retried with an exponential backoff
+
+    The supervisor runs on the event loop of the moonraker client, so nothing blocks the calling thread.
+    """
+
+    def __init__(self, moonraker, initial_backoff=0.5, max_backoff=30.0, health_interval=5.0, health_timeout=2.0):
+        self.moonraker = moonraker
+
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+
+        # Coroutine functions awaited every time the connection becomes ready
+        self.ready_callbacks = []
+
+        # Functions called with True when the connection becomes ready and False when it is lost
+        self.connection_callbacks = []
+
+        self.ready = None
+        self.task = None
+
+    def start(self):
+        """
+        Starts supervising the connection in the background.
+        """
+        if self.task is None:
+            self.task = self.moonraker.run(self.supervise())
+
+    def stop(self):
+        """
+        Stops supervising the connection and closes it.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        self.moonraker.close()
+
+    def is_ready(self):
+        return self.ready is not None and self.ready.is_set()
+
+    def add_ready_callback(self, callback):
+        self.ready_callbacks.append(callback)
+
+    def add_connection_callback(self, callback):
+        self.connection_callbacks.append(callback)
+
+    def set_ready(self, ready):
+        if ready:
+            self.ready.set()
+        else:
+            self.ready.clear()
+
+        for callback in list(self.connection_callbacks):
+            callback(ready)
+
+    async def wait_until_ready(self, timeout=None):
+        """
+        Waits until the connection is ready.
+        Raises a ConnectionError if the connection is not ready within the timeout.
+        """
+        if self.ready is None:
+            self.ready = asyncio.Event()
+
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError("Moonraker connection not ready")
+
+    async def check_klippy(self):
+        """
+        Raises KlippyNotReady if klipper is not ready.
+        """
+        state = await self.moonraker.request("server.info", timeout=self.health_timeout)
+
+        if state["klippy_state"] != "ready":
+            raise KlippyNotReady("Klipper Is Not Ready! State: " + state["klippy_state"])
+
+    async def connect(self):
+        """
+        Opens the connection and waits for klipper to be ready.
+        """
+        if not self.moonraker.is_connected():
+            await self.moonraker.open()
+
+        # Klipper takes a while to start after moonraker, keep checking until it is ready
+        backoff = self.initial_backoff
+        while True:
+            try:
+                await self.check_klippy()
+                break
+            except KlippyNotReady as error:
+                print(error)
+
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        for callback in list(self.ready_callbacks):
+            await callback()
+
+    async def monitor(self):
+        """
+        Health checks the connection until it fails.
+        """
+        while True:
+            done, _ = await asyncio.wait([self.moonraker.reader], timeout=self.health_interval)
+
+            # The websocket was closed
+            if len(done) > 0:
+                return
+
+            await self.check_klippy()
+
+    async def supervise(self):
+        """
+        Connects and reconnects until cancelled.
+        """
+        if self.ready is None:
+            self.ready = asyncio.Event()
+
+        backoff = self.initial_backoff
+
+        try:
+            while True:
+                try:
+                    await self.connect()
+
+                    self.set_ready(True)
+                    backoff = self.initial_backoff
+
+                    await self.monitor()
+
+                    print("Moonraker Connection Lost!")
+                except (OSError, asyncio.TimeoutError, ConnectionError, MoonrakerError, KlippyNotReady) as error:
+                    print("Moonraker Connection Failed: " + str(error))
+                except Exception as error:
+                    # e.g. an invalid handshake, keep retrying instead of stopping the supervisor
+                    print("Moonraker Connection Error: " + repr(error))
+
+                if self.ready.is_set():
+                    self.set_ready(False)
+
+                # Make sure the old websocket is closed before reconnecting
+                await self.moonraker.shutdown()
+
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            if self.ready.is_set():
+                self.set_ready(False)
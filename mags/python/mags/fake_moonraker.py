@@ -0,0 +1,408 @@
+import asyncio
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+from threading import Thread
+import time
+
+import websockets
+
+# Parameters of a gcode command, e.g. X12.5
+GCODE_PARAMETER = re.compile(r"([A-Z])(-?\d*\.?\d+)")
+
+# Motion queued ahead of the estimated print time when the toolhead starts moving from idle
+QUEUE_START_DELAY = 0.1
+
+
+class FakeToolhead():
+    """
+    A simplified klipper toolhead that tracks the queued motion time of the gcode it is given.
+    NOTE: Moves are timed at their feedrate, accelerations are ignored.
+    """
+
+    def __init__(self, position=(0.0, 0.0), max_accel=5000.0):
+        self.start_time = time.monotonic()
+
+        # The max_accel of the printer section of the config and the current limit set by SET_VELOCITY_LIMIT
+        self.config_accel = max_accel
+        self.max_accel = max_accel
+
+        self.position = [float(position[0]), float(position[1]), 0.0, 0.0]
+        self.feedrate = 6000.0
+        self.absolute = True
+
+        self.print_time = 0.0
+
+        # The file being printed from the virtual sdcard and its motion time span
+        self.job = None
+
+    def get_estimated_print_time(self):
+        return time.monotonic() - self.start_time
+
+    def is_printing(self):
+        return self.print_time > self.get_estimated_print_time()
+
+    def queue(self, duration):
+        # Moves queued on an idle toolhead start a little in the future like in klipper
+        self.print_time = max(self.print_time, self.get_estimated_print_time() + QUEUE_START_DELAY) + duration
+
+    def execute(self, script):
+        """
+        Executes a gcode script and returns the number of lines.
+        """
+        lines = [line.split(";")[0].strip().upper() for line in script.splitlines()]
+        lines = [line for line in lines if line != ""]
+
+        for line in lines:
+            command = line.split()[0]
+            parameters = {key: float(value) for key, value in GCODE_PARAMETER.findall(line[len(command):])}
+
+            if command == "G90":
+                self.absolute = True
+            elif command == "G91":
+                self.absolute = False
+            elif command in ("G0", "G1", "G2", "G3"):
+                if "F" in parameters:
+                    self.feedrate = parameters["F"]
+
+                target = list(self.position)
+                for axis, index in (("X", 0), ("Y", 1), ("Z", 2)):
+                    if axis in parameters:
+                        target[index] = parameters[axis] if self.absolute else target[index] + parameters[axis]
+
+                # Arcs are timed by their chord, which is close enough for the short arcs around the pieces
+                distance = ((target[0] - self.position[0])**2 + (target[1] - self.position[1])**2 + (target[2] - self.position[2])**2)**0.5
+                self.queue(distance / (self.feedrate / 60))
+
+                self.position = target
+            elif command == "G4":
+                self.queue(parameters.get("P", 0) / 1000)
+            elif command == "SET_VELOCITY_LIMIT":
+                match = re.search(r"ACCEL=(\d*\.?\d+)", line)
+                if match is not None:
+                    self.max_accel = float(match.group(1))
+            elif command == "SET_KINEMATIC_POSITION":
+                for axis, index in (("X", 0), ("Y", 1), ("Z", 2)):
+                    match = re.search(axis + r"=(-?\d*\.?\d+)", line)
+                    if match is not None:
+                        self.position[index] = float(match.group(1))
+
+        return len(lines)
+
+    def print_file(self, filename, gcode):
+        """
+        Prints a file from the virtual sdcard.
+        NOTE: The whole file is queued at once, the progress follows the queued motion.
+        """
+        self.queue(0)
+        start_time = self.print_time
+
+        self.execute(gcode)
+
+        self.job = {"filename": filename, "size": len(gcode), "start_time": start_time, "end_time": self.print_time}
+
+    def get_status(self):
+        """
+        Returns the status of the emulated klipper objects.
+        """
+        estimated_print_time = self.get_estimated_print_time()
+
+        progress = 0.0
+        active = False
+        if self.job is not None:
+            duration = self.job["end_time"] - self.job["start_time"]
+            progress = 1.0 if duration <= 0 else min(max((estimated_print_time - self.job["start_time"]) / duration, 0.0), 1.0)
+            active = progress < 1.0
+
+        return {
+            "toolhead": {
+                "position": list(self.position),
+                "print_time": self.print_time,
+                "estimated_print_time": estimated_print_time,
+                "homed_axes": "xyz",
+                "max_accel": self.max_accel,
+            },
+            "configfile": {
+                "settings": {"printer": {"max_accel": self.config_accel}},
+            },
+            "idle_timeout": {
+                "state": "Printing" if self.print_time > estimated_print_time else "Ready",
+                "printing_time": 0.0,
+            },
+            "virtual_sdcard": {
+                "progress": progress,
+                "is_active": active,
+                "file_position": 0 if self.job is None else int(progress * self.job["size"]),
+            },
+            "print_stats": {
+                "state": "standby" if self.job is None else ("printing" if active else "complete"),
+                "filename": "" if self.job is None else self.job["filename"],
+                "message": "",
+            },
+        }
+
+
+class FakeFileHandler(BaseHTTPRequestHandler):
+    """
+    Handles gcode uploads to the file API (POST /server/files/upload).
+    """
+
+    def do_POST(self):
+        if self.path != "/server/files/upload":
+            self.send_error(404)
+            return
+
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+
+        # Parse the multipart form with the email parser
+        message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+
+        filename = None
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                filename = part.get_filename()
+                self.server.files[filename] = part.get_payload(decode=True).decode()
+
+        reply = json.dumps({"item": {"path": filename, "root": "gcodes"}, "action": "create_file"}).encode()
+
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeMoonraker():
+    """
+    A local stand-in for moonraker to test and benchmark the motion pipeline without a printer.
+
+    Emulates:
+    1. server.info and printer.info with a settable klippy state
+    2. printer.gcode.script, the gcode is timed by a FakeToolhead
+    3. printer.objects.query and printer.objects.subscribe with notify_status_update every status interval
+    4. File uploads on the http port, printer.print.start and server.files.delete_file, the files are timed by the FakeToolhead
+
+    Every reply is delayed by the latency to emulate the network and klipper.
+    """
+
+    def __init__(self, host="localhost", port=7125, latency=0.0, status_interval=0.25, http_port=None):
+        self.host = host
+        self.port = port
+
+        # The file API is served separately from the websocket
+        self.http_port = http_port if http_port is not None else port + 1
+        self.http_server = None
+
+        self.latency = latency
+        self.status_interval = status_interval
+
+        self.klippy_state = "ready"
+        self.toolhead = FakeToolhead()
+
+        # Every executed script for inspection
+        self.scripts = []
+
+        self.connections = set()
+
+        self.loop = None
+        self.server = None
+
+    def get_address(self):
+        return "{}:{}".format(self.host, self.port)
+
+    def get_http_address(self):
+        return "{}:{}".format(self.host, self.http_port)
+
+    def get_files(self):
+        """
+        Get the uploaded files keyed by their filename.
+        """
+        return self.http_server.files
+
+    def set_klippy_state(self, state):
+        self.klippy_state = state
+
+    def start(self):
+        """
+        Starts the server in a background thread and waits until it is listening.
+        """
+        self.loop = asyncio.new_event_loop()
+
+        Thread(target=self.loop.run_forever, daemon=True).start()
+
+        asyncio.run_coroutine_threadsafe(self.serve(), self.loop).result()
+
+        self.http_server = ThreadingHTTPServer((self.host, self.http_port), FakeFileHandler)
+        self.http_server.files = {}
+
+        Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+    async def serve(self):
+        self.server = await websockets.serve(self.handle_connection, self.host, self.port)
+
+    def stop(self):
+        """
+        Stops the server and closes the connections.
+        """
+        async def shutdown():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def disconnect_clients(self):
+        """
+        Closes the open connections while the server keeps listening (e.g. to test reconnecting).
+        """
+        async def disconnect():
+            for connection in list(self.connections):
+                await connection.close()
+
+        asyncio.run_coroutine_threadsafe(disconnect(), self.loop).result()
+
+    async def handle_connection(self, connection):
+        self.connections.add(connection)
+
+        # The subscribed objects of this connection
+        subscription = {}
+        status_task = asyncio.ensure_future(self.send_status_updates(connection, subscription))
+
+        try:
+            async for message in connection:
+                asyncio.ensure_future(self.handle_request(connection, json.loads(message), subscription))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            status_task.cancel()
+            self.connections.discard(connection)
+
+    async def handle_request(self, connection, request, subscription):
+        await asyncio.sleep(self.latency)
+
+        method = request.get("method")
+        params = request.get("params", {})
+
+        try:
+            result = self.call(method, params, subscription)
+            reply = {"jsonrpc": "2.0", "result": result, "id": request.get("id")}
+        except KeyError as error:
+            reply = {"jsonrpc": "2.0", "error": {"code": 404, "message": "Method not found: " + str(error)}, "id": request.get("id")}
+        except RuntimeError as error:
+            reply = {"jsonrpc": "2.0", "error": {"code": 503, "message": str(error)}, "id": request.get("id")}
+
+        try:
+            await connection.send(json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+
+    def call(self, method, params, subscription):
+        """
+        Runs a JSON-RPC method and returns its result.
+        """
+        if method == "server.info":
+            return {"klippy_connected": True, "klippy_state": self.klippy_state}
+
+        if method == "printer.info":
+            return {"state": self.klippy_state, "state_message": "Printer is " + self.klippy_state}
+
+        if method == "server.files.delete_file":
+            root, _, filename = params["path"].partition("/")
+            if root != "gcodes" or filename not in self.http_server.files:
+                raise RuntimeError("File not found: " + params["path"])
+
+            del self.http_server.files[filename]
+            return {"item": {"path": filename, "root": root}, "action": "delete_file"}
+
+        # The remaining methods need klipper
+        if self.klippy_state != "ready":
+            raise RuntimeError("Klippy Disconnected")
+
+        if method == "printer.gcode.script":
+            self.toolhead.execute(params["script"])
+            self.scripts.append(params["script"])
+            return "ok"
+
+        if method == "printer.print.start":
+            if params["filename"] not in self.http_server.files:
+                raise RuntimeError("File not found: " + params["filename"])
+
+            self.toolhead.print_file(params["filename"], self.http_server.files[params["filename"]])
+            return "ok"
+
+        if method in ("printer.objects.query", "printer.objects.subscribe"):
+            objects = params.get("objects", {})
+
+            if method == "printer.objects.subscribe":
+                subscription.clear()
+                subscription.update(objects)
+
+            return {"eventtime": self.toolhead.get_estimated_print_time(), "status": self.get_status(objects)}
+
+        raise KeyError(method)
+
+    def get_status(self, objects):
+        """
+        Returns the requested fields of the emulated objects.
+        """
+        status = self.toolhead.get_status()
+
+        result = {}
+        for name, fields in objects.items():
+            if name not in status:
+                continue
+
+            result[name] = {field: value for field, value in status[name].items() if fields is None or field in fields}
+
+        return result
+
+    async def send_status_updates(self, connection, subscription):
+        """
+        Sends the changed fields of the subscribed objects every status interval.
+        """
+        previous = {}
+
+        while True:
+            await asyncio.sleep(self.status_interval)
+
+            if len(subscription) == 0 or self.klippy_state != "ready":
+                continue
+
+            status = self.get_status(subscription)
+
+            # Only the changed fields are sent like in moonraker
+            changes = {}
+            for name, fields in status.items():
+                changed = {field: value for field, value in fields.items() if previous.get(name, {}).get(field) != value}
+
+                if len(changed) > 0:
+                    changes[name] = changed
+
+            previous = status
+
+            if len(changes) == 0:
+                continue
+
+            message = {"jsonrpc": "2.0", "method": "notify_status_update", "params": [changes, self.toolhead.get_estimated_print_time()]}
+
+            try:
+                await connection.send(json.dumps(message))
+            except websockets.ConnectionClosed:
+                return
+
+
+if __name__ == "__main__":
+    moonraker = FakeMoonraker(latency=0.005)
+    moonraker.start()
+
+    print("Fake Moonraker listening on " + moonraker.get_address())
+
+    while True:
+        time.sleep(1)
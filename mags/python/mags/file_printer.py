@@ -0,0 +1,152 @@
+import asyncio
+from itertools import count
+import json
+import time
+from urllib import request
+import uuid
+
+# The klipper status fields that track a file being printed from the virtual sdcard
+PRINT_STATUS = {
+    "virtual_sdcard": ["progress", "is_active", "file_position"],
+    "print_stats": ["state", "filename", "message"],
+}
+
+# Print states that end a print
+FINISHED_STATES = ("complete", "error", "cancelled")
+
+
+def encode_multipart(fields, files):
+    """
+    Encodes form fields and files (name -> (filename, bytes)) as multipart/form-data.
+    Returns the body and its content type.
+    """
+    boundary = uuid.uuid4().hex
+
+    body = b""
+    for name, value in fields.items():
+        body += "--{}\r\nContent-Disposition: form-data; name=\"{}\"\r\n\r\n{}\r\n".format(boundary, name, value).encode()
+
+    for name, (filename, content) in files.items():
+        body += "--{}\r\nContent-Disposition: form-data; name=\"{}\"; filename=\"{}\"\r\nContent-Type: application/octet-stream\r\n\r\n".format(boundary, name, filename).encode()
+        body += content + b"\r\n"
+
+    body += "--{}--\r\n".format(boundary).encode()
+
+    return body, "multipart/form-data; boundary=" + boundary
+
+
+class FilePrinter():
+    """
+    Executes long gcode programs as a file printed from klipper's virtual sdcard.
+
+    1. The program is uploaded to the gcodes root with moonraker's file API (POST /server/files/upload)
+    2. The print is started with printer.print.start
+    3. The progress is reported from the virtual_sdcard status until print_stats reaches a finished state
+    4. The program is deleted with server.files.delete_file, so the uploads don't fill the gcodes root
+
+    This avoids pushing thousands of lines through printer.gcode.script (e.g. for a full board reset), but starting a print has more latency than a script call.
+    NOTE: The virtual_sdcard and print_stats fields have to be in the subscribed PrinterStatus.
+    """
+
+    def __init__(self, moonraker, status, http_address, upload_timeout=30.0):
+        self.moonraker = moonraker
+        self.status = status
+
+        self.upload_url = "http://" + http_address + "/server/files/upload"
+        self.upload_timeout = upload_timeout
+
+        self.job_ids = count(1)
+
+        # Futures waiting for a print to finish
+        self.prints = set()
+
+    def upload(self, filename, gcode):
+        """
+        Uploads a gcode program to the gcodes root.
+        NOTE: This blocks, it is run in an executor by print_gcode.
+        """
+        body, content_type = encode_multipart({"root": "gcodes"}, {"file": (filename, gcode.encode())})
+
+        upload_request = request.Request(self.upload_url, data=body, method="POST", headers={"Content-Type": content_type})
+
+        with request.urlopen(upload_request, timeout=self.upload_timeout) as response:
+            return json.loads(response.read())
+
+    async def delete(self, filename):
+        """
+        Deletes an uploaded gcode program from the gcodes root.
+        A failed delete is only reported, the print itself is not affected.
+        """
+        try:
+            await self.moonraker.request("server.files.delete_file", {"path": "gcodes/" + filename})
+        except Exception as error:
+            print("Failed to delete {}: {}".format(filename, error))
+
+    def fail_prints(self, error):
+        """
+        Fails the prints being waited for with the error (e.g. when the connection is lost, their finished state never arrives).
+        """
+        for finished in list(self.prints):
+            if not finished.done():
+                finished.set_exception(error)
+
+    def get_progress(self):
+        """
+        Get the progress [0, 1] of the current print.
+        """
+        return self.status.get("virtual_sdcard", "progress", 0.0)
+
+    async def print_gcode(self, gcode, filename=None, progress_callback=None):
+        """
+        Uploads and prints a gcode program and waits until the print has finished.
+        The progress callback is called with the progress [0, 1] whenever it changes.
+        Raises a RuntimeError if the print does not complete.
+        """
+        if filename is None:
+            filename = "mags_{}_{}.gcode".format(int(time.time()), next(self.job_ids))
+
+        loop = asyncio.get_running_loop()
+
+        await loop.run_in_executor(None, self.upload, filename, gcode)
+
+        finished = loop.create_future()
+        last_progress = None
+
+        def check_print(status):
+            nonlocal last_progress
+
+            # Another file or a previous print
+            if status.get("print_stats", "filename") != filename:
+                return
+
+            progress = self.get_progress()
+            if progress_callback is not None and progress != last_progress:
+                last_progress = progress
+                progress_callback(progress)
+
+            state = status.get("print_stats", "state")
+            if state in FINISHED_STATES and not finished.done():
+                finished.set_result(state)
+
+        self.status.add_listener(check_print)
+        self.prints.add(finished)
+        started = False
+
+        try:
+            await self.moonraker.request("printer.print.start", {"filename": filename})
+            started = True
+
+            # The subscription may not have caught up with the new print yet
+            await self.status.refresh(PRINT_STATUS)
+
+            state = await finished
+        finally:
+            self.status.remove_listener(check_print)
+            self.prints.discard(finished)
+
+            # A file that is still printing can't be deleted
+            if not started or finished.done():
+                await self.delete(filename)
+
+        if state != "complete":
+            raise RuntimeError("Print of {} {}: {}".format(filename, state, self.status.get("print_stats", "message", "")))
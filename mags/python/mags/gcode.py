@@ -0,0 +1,190 @@
+import io
+
+from planning.segments import iter_segments
+
+
+class GcodeBuilder:
+    """
+    Streams the gcode for paths generated by astar.
+
+    Collinear line segments and adjacent arcs on the same circle are merged before they are emitted, so klipper receives fewer, longer moves.
+    All coordinates are formatted with a fixed number of decimal places.
+
+    """
+
+    def __init__(self, precision=3, feedrate=99999999, tolerance=None, max_accel=None):
+        self.precision = precision
+        self.feedrate = feedrate
+
+        # The travel acceleration restored after a profiled path
+        self.max_accel = max_accel
+
+        # By default merge anything that deviates less than half of the last printed digit
+        if tolerance is None:
+            tolerance = 0.5 * 10 ** -precision
+        self.tolerance = tolerance
+
+    def format_number(self, value):
+        """
+        Formats a coordinate with the configured precision.
+
+        """
+        text = "{:.{}f}".format(value, self.precision)
+
+        # Avoid printing negative zeros
+        if float(text) == 0:
+            text = "{:.{}f}".format(0, self.precision)
+
+        return text
+
+    def format_feedrate(self, feedrate):
+        return "{:.0f}".format(feedrate)
+
+    def linear_gcode(self, position, feedrate=None):
+        """
+        Generates the gcode for a linear move to a position.
+
+        """
+        if feedrate is None:
+            feedrate = self.feedrate
+
+        return "G1 X{} Y{} F{}".format(
+            self.format_number(position[0]),
+            self.format_number(position[1]),
+            self.format_feedrate(feedrate)
+        )
+
+    def arc_gcode(self, segment, feedrate=None):
+        """
+        Generates the gcode for an arc move from the start of the segment to its end.
+
+        """
+        if feedrate is None:
+            feedrate = self.feedrate
+
+        start_position = segment.get_start()
+        end_position = segment.get_end()
+        arc_center = segment.get_center()
+
+        # Determine if the arc is clockwise or anticlockwise
+        arc_direction = "G2" if segment.is_clockwise() else "G3"
+
+        # I and J are the offsets from the start position to the arc center
+        arc_I = arc_center[0] - start_position[0]
+        arc_J = arc_center[1] - start_position[1]
+
+        return "{} X{} Y{} I{} J{} F{}".format(
+            arc_direction,
+            self.format_number(end_position[0]),
+            self.format_number(end_position[1]),
+            self.format_number(arc_I),
+            self.format_number(arc_J),
+            self.format_feedrate(feedrate)
+        )
+
+    def segment_gcode(self, segment, feedrate=None):
+        if segment.is_arc():
+            return self.arc_gcode(segment, feedrate)
+        else:
+            return self.linear_gcode(segment.get_end(), feedrate)
+
+    def format_position(self, position):
+        return (self.format_number(position[0]), self.format_number(position[1]))
+
+    def generate_segments(self, segments, start=None):
+        """
+        Yields the gcode lines for a sequence of (segment, feedrate) pairs.
+        Moves that do not change the formatted position are skipped.
+        NOTE: Klipper treats an arc that ends where it starts as a full circle, so these are never emitted.
+
+        """
+        current = self.format_position(start) if start is not None else None
+
+        for segment, feedrate in segments:
+            end = self.format_position(segment.get_end())
+
+            if end == current:
+                continue
+
+            yield self.segment_gcode(segment, feedrate)
+
+            current = end
+
+    def generate_trace(self, start, segments, accel=None, approach_feedrate=None):
+        """
+        Yields the gcode lines to drag a piece from the start along a sequence of (segment, feedrate) pairs.
+        If an acceleration is given it is used while the piece is dragged, then the travel acceleration is restored.
+        Raises a ValueError if an acceleration is given without a travel acceleration to restore.
+
+        """
+        if accel is not None and self.max_accel is None:
+            raise ValueError("The travel acceleration (max_accel) is required to restore it after a drag")
+
+        yield "G90"
+
+        # Move to the start with the electromagnet off
+        yield self.linear_gcode(start, approach_feedrate)
+
+        # Limit the acceleration while the piece is dragged
+        if accel is not None:
+            yield "SET_VELOCITY_LIMIT ACCEL={}".format(self.format_feedrate(accel))
+
+        # Turn on the electromagnet
+        yield "M106 S255"
+
+        yield from self.generate_segments(segments, start)
+
+        # Turn off the electromagnet
+        yield "M106 S0"
+
+        if accel is not None:
+            # Restore the acceleration for travel moves
+            yield "SET_VELOCITY_LIMIT ACCEL={}".format(self.format_feedrate(self.max_accel))
+
+    def generate(self, path, profile=None, approach_feedrate=None):
+        """
+        Yields the gcode lines to trace a path generated by astar.
+        If a motion profile of the path is given its feedrates and acceleration are used.
+
+        """
+        if profile is None:
+            segments = ((segment, None) for segment in iter_segments(path, self.tolerance))
+            accel = None
+        else:
+            segments = iter(profile)
+            accel = profile.get_accel()
+
+        yield from self.generate_trace(path[0].get_position(), segments, accel, approach_feedrate)
+
+    def generate_trajectory(self, trajectory, accel=None, approach_feedrate=None):
+        """
+        Yields the gcode lines to follow an optimized trajectory.
+
+        """
+        yield from self.generate_trace(trajectory.get_start(), trajectory.iter_segments(self.tolerance), accel, approach_feedrate)
+
+    def write(self, path, buffer, profile=None, approach_feedrate=None):
+        """
+        Writes the gcode to trace a path into a text buffer.
+
+        """
+        for line in self.generate(path, profile, approach_feedrate):
+            buffer.write(line)
+            buffer.write("\n")
+
+    def build(self, path, profile=None, approach_feedrate=None):
+        """
+        Returns the gcode to trace a path as a single string.
+
+        """
+        buffer = io.StringIO()
+        self.write(path, buffer, profile, approach_feedrate)
+
+        return buffer.getvalue()
+
+    def build_trajectory(self, trajectory, accel=None, approach_feedrate=None):
+        """
+        Returns the gcode to follow an optimized trajectory as a single string.
+
+        """
+        return "".join(line + "\n" for line in self.generate_trajectory(trajectory, accel, approach_feedrate))
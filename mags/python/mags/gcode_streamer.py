@@ -0,0 +1,172 @@
+import asyncio
+from collections import deque
+
+# Number of queue depth samples kept for the metrics
+QUEUE_SAMPLE_HISTORY = 1000
+
+# The toolhead fields that track klipper's motion queue
+QUEUE_STATUS = {"toolhead": ["print_time", "estimated_print_time"]}
+
+
+def split_gcode(gcode, chunk_lines):
+    """
+    Splits a gcode script into chunks of at most chunk_lines lines.
+    Empty lines are dropped.
+    """
+    lines = [line for line in gcode.splitlines() if line.strip() != ""]
+
+    return ["\n".join(lines[i:i + chunk_lines]) for i in range(0, len(lines), chunk_lines)]
+
+
+class GcodeStreamer():
+    """
+    Streams gcode to klipper in chunks while keeping a target amount of motion queued.
+
+    Klipper reports how far ahead its motion queue is through the toolhead status:
+    the queued motion time is print_time - estimated_print_time, where estimated_print_time advances in real time.
+    1. A chunk is only sent while less than the target motion time is queued, so long sequences never flood klipper
+    2. Up to max_in_flight chunks can be waiting for their reply, so the next chunk is queued before the previous one has been processed
+    3. A chunk sent after the queue has run dry is an idle gap, the gantry stopped between the chunks
+
+    NOTE: The toolhead is queried after every processed chunk, between the chunks the subscribed PrinterStatus is used.
+    """
+
+    def __init__(self, moonraker, status, chunk_lines=16, target_queue_time=1.0, max_in_flight=2, poll_interval=0.05):
+        self.moonraker = moonraker
+        self.status = status
+
+        self.chunk_lines = chunk_lines
+        self.target_queue_time = target_queue_time
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+
+        # Only one stream is sent at a time so the scripts are not interleaved
+        self.lock = None
+
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.chunks_sent = 0
+        self.lines_sent = 0
+
+        self.queue_samples = deque(maxlen=QUEUE_SAMPLE_HISTORY)
+
+        self.idle_gaps = 0
+        self.idle_time = 0.0
+        self.max_idle_gap = 0.0
+
+    def get_queue_slack(self):
+        """
+        Get the motion time in seconds queued in klipper.
+        A negative slack is the time since the queue ran dry, None if the toolhead status is unknown.
+        """
+        print_time = self.status.get("toolhead", "print_time")
+        estimated_print_time = self.status.get("toolhead", "estimated_print_time")
+
+        if print_time is None or estimated_print_time is None:
+            return None
+
+        # The estimated print time has advanced in real time since the status was received
+        return print_time - estimated_print_time - self.status.get_age()
+
+    def get_queue_time(self):
+        """
+        Get the motion time in seconds queued in klipper or None if the toolhead status is unknown.
+        """
+        slack = self.get_queue_slack()
+
+        if slack is None:
+            return None
+
+        return max(0.0, slack)
+
+    async def wait_for_capacity(self, in_flight):
+        """
+        Waits until another chunk can be sent.
+        Raises the error of a failed chunk.
+        """
+        while True:
+            # Collect the finished chunks, a failed chunk stops the stream
+            finished = [task for task in in_flight if task.done()]
+            for task in finished:
+                in_flight.remove(task)
+                task.result()
+
+            # The subscription only updates periodically, query the queue as soon as a chunk has been processed
+            if len(finished) > 0:
+                await self.status.refresh(QUEUE_STATUS)
+
+            queue_time = self.get_queue_time()
+
+            if len(in_flight) < self.max_in_flight and (queue_time is None or queue_time < self.target_queue_time):
+                return
+
+            if len(in_flight) > 0:
+                await asyncio.wait(in_flight, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    def record_chunk(self, chunk, first):
+        """
+        Records the queue depth when a chunk is sent.
+        """
+        self.chunks_sent += 1
+        self.lines_sent += chunk.count("\n") + 1
+
+        slack = self.get_queue_slack()
+        if slack is None:
+            return
+
+        self.queue_samples.append(max(0.0, slack))
+
+        # The first chunk of a stream is expected to find the queue empty
+        if not first and slack < 0:
+            self.idle_gaps += 1
+            self.idle_time += -slack
+            self.max_idle_gap = max(self.max_idle_gap, -slack)
+
+    async def stream(self, gcode):
+        """
+        Streams a gcode script to klipper and waits until every chunk has been processed.
+        NOTE: The chunks are sent in order over one websocket, so klipper processes them in order.
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            in_flight = set()
+
+            try:
+                for i, chunk in enumerate(split_gcode(gcode, self.chunk_lines)):
+                    await self.wait_for_capacity(in_flight)
+
+                    self.record_chunk(chunk, i == 0)
+
+                    in_flight.add(asyncio.ensure_future(self.moonraker.request("printer.gcode.script", {"script": chunk})))
+
+                if len(in_flight) > 0:
+                    await asyncio.gather(*in_flight)
+            except BaseException:
+                # Do not send the rest of the stream after a failure
+                for task in in_flight:
+                    task.cancel()
+
+                raise
+
+    def get_metrics(self):
+        """
+        Get the streaming metrics.
+        The queue times are in seconds of queued motion when the chunks were sent.
+        """
+        queue_samples = list(self.queue_samples)
+
+        return {
+            "chunks": self.chunks_sent,
+            "lines": self.lines_sent,
+            "mean_queue_time": sum(queue_samples) / len(queue_samples) if len(queue_samples) > 0 else None,
+            "min_queue_time": min(queue_samples, default=None),
+            "max_queue_time": max(queue_samples, default=None),
+            "idle_gaps": self.idle_gaps,
+            "idle_time": self.idle_time,
+            "max_idle_gap": self.max_idle_gap,
+        }
@@ -0,0 +1,209 @@
+import struct
+from threading import Lock
+
+import numpy as np
+
+from planning.segments import arc_sweep, iter_segments
+from planning.trajectory import Trajectory
+
+# A frame is the sequence number (uint32), the number of sections (uint16), a reserved uint16
+# and the width and length of the board in mm (float32), little-endian
+FRAME_FORMAT = "<IHHff"
+
+# A section is its kind (uint8), layer (uint8) and number of items (uint16) followed by the float32 values of the items
+SECTION_FORMAT = "<BBH"
+
+# Section kinds and the number of float32 values per item
+CIRCLES = 0 # cx, cy, r
+LINES = 1 # x1, y1, x2, y2
+ARCS = 2 # cx, cy, r, start angle, signed sweep (radians, positive is anticlockwise)
+POLYLINE = 3 # x, y of each point
+
+KIND_STRIDES = {CIRCLES: 3, LINES: 4, ARCS: 5, POLYLINE: 2}
+
+# Section layers, the UI draws each layer in its own style
+LAYER_OBSTACLES = 0
+LAYER_GRAPH = 1
+LAYER_APPROACH = 2
+LAYER_PATH = 3
+
+# Number of items a section can hold
+MAX_SECTION_ITEMS = 0xFFFF
+
+
+class GeometryFrame():
+    """
+    The geometry of a planned turn packed into float32 sections, so the browser can read it with typed arrays.
+    All sizes are multiples of 4 bytes, so every section can be viewed as a Float32Array without copying.
+    """
+
+    def __init__(self, width, length):
+        self.width = width
+        self.length = length
+
+        self.sections = []
+
+    def add_section(self, kind, layer, values):
+        values = np.asarray(values, dtype="<f4").reshape(-1, KIND_STRIDES[kind])
+
+        # Long sections are split, the UI draws the sections independently
+        for i in range(0, len(values), MAX_SECTION_ITEMS):
+            self.sections.append((kind, layer, values[i:i + MAX_SECTION_ITEMS]))
+
+    def add_circles(self, layer, circles):
+        if len(circles) > 0:
+            self.add_section(CIRCLES, layer, [[*circle.get_center(), circle.get_r()] for circle in circles])
+
+    def add_lines(self, layer, lines):
+        """
+        Adds lines given as (start, end) pairs.
+        """
+        if len(lines) > 0:
+            self.add_section(LINES, layer, [[*start, *end] for start, end in lines])
+
+    def add_arcs(self, layer, arcs):
+        """
+        Adds arcs given as (center, radius, start, sweep) tuples, start is a position on the arc.
+        """
+        if len(arcs) > 0:
+            self.add_section(ARCS, layer, [[*center, r, np.arctan2(start[1] - center[1], start[0] - center[0]), sweep] for center, r, start, sweep in arcs])
+
+    def add_path(self, layer, path):
+        """
+        Adds a path generated by astar as its motion segments, or an optimized trajectory as a polyline.
+        """
+        if isinstance(path, Trajectory):
+            self.add_section(POLYLINE, layer, path.get_positions())
+            return
+
+        lines = []
+        arcs = []
+
+        for segment in iter_segments(path):
+            if segment.is_arc():
+                arcs.append((segment.get_center(), segment.get_radius(), segment.get_start(), segment.get_sweep()))
+            else:
+                lines.append((segment.get_start(), segment.get_end()))
+
+        self.add_lines(layer, lines)
+        self.add_arcs(layer, arcs)
+
+    def add_graph(self, graph, layer=LAYER_GRAPH):
+        """
+        Adds the edges of a prepared graph, the hugging edges are stored in both directions so only every other is added.
+        """
+        self.add_lines(layer, [(edge.get_first().get_position(), edge.get_second().get_position()) for edge in graph.surfing_edges + graph.tangent_edges])
+
+        arcs = []
+        for edge in graph.hugging_edges[::2]:
+            circle = edge.get_first().get_circle()
+            start = edge.get_first().get_position()
+
+            arcs.append((circle.get_center(), circle.get_r(), start, arc_sweep(circle.get_center(), start, edge.get_second().get_position())))
+
+        self.add_arcs(layer, arcs)
+
+    def add_plan(self, plan):
+        """
+        Adds the approach moves and paths of planned actions and the return move of the head.
+        """
+        approaches = [(action.get_approach().get_start(), action.get_approach().get_end()) for action in plan]
+
+        return_move = plan.get_return_move()
+        if return_move is not None:
+            approaches.append((return_move.get_start(), return_move.get_end()))
+
+        self.add_lines(LAYER_APPROACH, [(start, end) for start, end in approaches if np.any(start != end)])
+
+        for path in plan.get_paths():
+            self.add_path(LAYER_PATH, path)
+
+    def encode(self, sequence):
+        parts = [struct.pack(FRAME_FORMAT, sequence & 0xFFFFFFFF, len(self.sections), 0, self.width, self.length)]
+
+        for kind, layer, values in self.sections:
+            parts.append(struct.pack(SECTION_FORMAT, kind, layer, len(values)))
+            parts.append(values.tobytes())
+
+        return b"".join(parts)
+
+
+def decode_frame(frame):
+    """
+    Returns the sequence number, board width and length and the (kind, layer, values) of each section of a frame.
+    """
+    sequence, count, _, width, length = struct.unpack_from(FRAME_FORMAT, frame)
+    offset = struct.calcsize(FRAME_FORMAT)
+
+    sections = []
+    for _ in range(count):
+        kind, layer, items = struct.unpack_from(SECTION_FORMAT, frame, offset)
+        offset += struct.calcsize(SECTION_FORMAT)
+
+        values = np.frombuffer(frame, dtype="<f4", count=items * KIND_STRIDES[kind], offset=offset).reshape(items, KIND_STRIDES[kind])
+        offset += values.nbytes
+
+        sections.append((kind, layer, values))
+
+    return sequence, width, length, sections
+
+
+class GeometryFeed():
+    """
+    Publishes the geometry of every planned turn to the browsers over the Socket.IO server.
+
+    1. A binary frame with the obstacles, approach moves and paths (and optionally the planning graph) is emitted once per plan
+    2. A client that joins gets the last frame
+    3. The sequence number lets the client drop frames that arrive out of order
+
+    NOTE: Publish is called from the job worker of the table after planning, it only packs arrays that already exist.
+    """
+
+    def __init__(self, socketio, width, length, event="geometry", room=None, include_graph=False):
+        self.socketio = socketio
+        self.event = event
+
+        # The frames are only sent to the clients in the room (e.g. the clients of one table), or to all clients if None
+        self.room = room
+
+        self.width = width
+        self.length = length
+
+        # The graph of a full board is tens of kilobytes, it is only sent for debugging
+        self.include_graph = include_graph
+
+        self.sequence = 0
+        self.frame = None
+
+        self.lock = Lock()
+
+    def publish(self, plan, obstacles, graph=None):
+        """
+        Emits the geometry of a plan, the obstacles are the circles around the pieces before the turn.
+        """
+        frame = GeometryFrame(self.width, self.length)
+
+        frame.add_circles(LAYER_OBSTACLES, obstacles)
+
+        if self.include_graph and graph is not None and graph.is_prepared():
+            frame.add_graph(graph)
+
+        frame.add_plan(plan)
+
+        with self.lock:
+            self.sequence += 1
+            self.frame = frame.encode(self.sequence)
+
+            data = self.frame
+
+        self.socketio.emit(self.event, data, to=self.room)
+
+    def send_current(self, sid):
+        """
+        Sends the last frame to a single client (e.g. when it joins).
+        """
+        with self.lock:
+            data = self.frame
+
+        if data is not None:
+            self.socketio.emit(self.event, data, to=sid)
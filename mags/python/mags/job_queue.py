@@ -0,0 +1,188 @@
+from collections import deque
+from enum import Enum
+from itertools import count
+from threading import Condition, Thread
+import time
+
+
+class JobRejected(Exception):
+    """
+    Raised by a job handler when the job is refused before it changed the state (e.g. an illegal move).
+    """
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STALE = "stale"
+
+
+class Job():
+    """
+    A unit of work for the JobQueue, e.g. responding to a move.
+    """
+
+    def __init__(self, job_id, kind, payload, key, version, publish):
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+
+        # Queued jobs with the same key are coalesced
+        self.key = key
+
+        # The state version the job was submitted against, None if it doesn't go stale
+        self.version = version
+
+        self.status = JobStatus.QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+
+        self.submit_time = time.time()
+
+        self.publish = publish
+
+    def get_id(self):
+        return self.id
+
+    def get_status(self):
+        return self.status
+
+    def set_progress(self, progress):
+        """
+        Reports the progress [0, 1] of a running job.
+        """
+        self.progress = progress
+        self.publish("job_progress", self)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status.value,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue():
+    """
+    Runs the jobs that change the game state one at a time on a single worker thread.
+
+    The worker is the only writer of the board state, the Socket.IO handlers only submit jobs and return:
+    1. A job submitted right after a queued job with the same key is coalesced into it (e.g. a double click on start)
+    2. Jobs submitted with stale=True are dropped if the state changed after they were submitted (e.g. a second move during the robot's reply)
+    3. Every change of a job is published as an event (job_queued, job_started, job_progress, job_done, job_failed, job_stale)
+
+    Each job that changes the state bumps the state version, a job rejected by its handler with JobRejected doesn't.
+    """
+
+    def __init__(self, publish=None):
+        # Called with (event, job dict) for every job event
+        self.publish_callback = publish
+
+        # Job handlers keyed by kind, called with the job and returning its result
+        self.handlers = {}
+
+        self.ids = count(1)
+        self.jobs = deque()
+        self.version = 0
+
+        self.condition = Condition()
+        self.stopped = False
+
+        self.worker = Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def add_handler(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def get_version(self):
+        return self.version
+
+    def publish(self, event, job):
+        if self.publish_callback is None:
+            return
+
+        try:
+            self.publish_callback(event, job.to_dict())
+        except Exception as error:
+            print("Error Publishing {}: {}".format(event, error))
+
+    def submit(self, kind, payload=None, key=None, stale=False):
+        """
+        Queues a job and returns it without waiting.
+        If the last queued job has the same key that job is returned and its payload is replaced with the newer one.
+        NOTE: Only the last job is coalesced, merging into an earlier one would reorder it with the jobs queued in between.
+        """
+        if kind not in self.handlers:
+            raise ValueError("No handler for job: " + kind)
+
+        with self.condition:
+            if key is not None and len(self.jobs) > 0 and self.jobs[-1].key == key:
+                job = self.jobs[-1]
+                job.payload = payload
+                return job
+
+            job = Job(next(self.ids), kind, payload, key, self.version if stale else None, self.publish)
+
+            self.jobs.append(job)
+            self.condition.notify()
+
+        self.publish("job_queued", job)
+
+        return job
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.worker.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.jobs) == 0 and not self.stopped:
+                    self.condition.wait()
+
+                if self.stopped:
+                    return
+
+                job = self.jobs.popleft()
+
+            self.run_job(job)
+
+    def run_job(self, job):
+        # The state changed after the job was submitted
+        if job.version is not None and job.version != self.version:
+            job.status = JobStatus.STALE
+            self.publish("job_stale", job)
+            return
+
+        job.status = JobStatus.RUNNING
+        self.publish("job_started", job)
+
+        changed = True
+
+        try:
+            job.result = self.handlers[job.kind](job)
+        except Exception as error:
+            # A rejected job left the state as it was, the jobs submitted after it are still valid
+            changed = not isinstance(error, JobRejected)
+
+            job.status = JobStatus.FAILED
+            job.error = str(error)
+
+            print("Job {} ({}) Failed: {}".format(job.id, job.kind, repr(error)))
+            self.publish("job_failed", job)
+        else:
+            job.status = JobStatus.DONE
+            job.progress = 1.0
+            self.publish("job_done", job)
+
+        if changed:
+            self.version += 1
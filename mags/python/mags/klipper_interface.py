@@ -1,176 +1,265 @@
+from concurrent.futures import wait
 from enum import Enum
-from threading import Lock, Thread
 import time
 
-from jsonrpcclient import Ok, Error, parse_json, request_json
-from websocket import create_connection
-import websocket
+from connection_supervisor import ConnectionSupervisor
+from file_printer import FilePrinter
+from gcode_streamer import GcodeStreamer
+from metrics import METRICS
+from moonraker import MoonrakerClient, MoonrakerError
+from motion_monitor import MotionMonitor
+from printer_status import PrinterStatus
 
 
 class Klipper():
     """
     A class to hook into the websockets interface of moonraker and send data to klipper.
+    NOTE: The requests are sent through a MoonrakerClient so replies are matched to their requests and several requests can be in flight.
     """
 
-    def __init__(self, server_address, throw_connection_status, throw_message_status):
+    def __init__(self, server_address, throw_connection_status, throw_message_status, queue_timeout=30.0, http_address=None, metrics=METRICS):
         self.server_address = server_address
-        self.moonraker_websocket = websocket.WebSocket()
-        self.connection_lock = Lock()
+        self.moonraker = MoonrakerClient(server_address, metrics)
+
+        # Records the time until the gcode has been processed and its motion is complete
+        self.metrics = metrics
+
+        # Klipper objects kept up to date through the moonraker subscription
+        self.status = PrinterStatus(self.moonraker, {
+            "toolhead": ["print_time", "estimated_print_time", "position"],
+            "idle_timeout": ["state"],
+            "virtual_sdcard": ["progress", "is_active", "file_position"],
+            "print_stats": ["state", "filename", "message"],
+        })
+
+        # Detects when the queued motion has been executed
+        self.motion_monitor = MotionMonitor(self.status)
+
+        # Streams long gcode scripts with backpressure from the toolhead queue
+        self.streamer = GcodeStreamer(self.moonraker, self.status)
+
+        # Prints long gcode programs from the virtual sdcard, the file API is served on the same address as the websocket by default
+        if http_address is None:
+            http_address = server_address
+        self.file_printer = FilePrinter(self.moonraker, self.status, http_address)
+
+        # Keeps the connection alive in the background, the status is subscribed again after every reconnect
+        self.supervisor = ConnectionSupervisor(self.moonraker)
+        self.supervisor.add_ready_callback(self.status.subscribe)
+        self.supervisor.add_ready_callback(self.load_config)
+        self.supervisor.add_connection_callback(self.report_connection_status)
+
+        # Time in seconds commands wait for a reconnect before they are rejected (0 rejects them immediately)
+        self.queue_timeout = queue_timeout
+
+        # The max_accel of the printer config, restored after the piece drags lower the acceleration
+        self.max_accel = None
 
         self.throw_connection_status = throw_connection_status
         self.throw_message_status = throw_message_status
     
     def connect(self):
-        # Try to connect to moonraker websocket
-        while True:
-            try:
-                self.moonraker_websocket.connect("ws://" + self.server_address + "/websocket")
-                self.throw_connection_status(Klipper.ConnectionStatus.CONNECTED)
-                break
-            except:
-                self.throw_connection_status(Klipper.ConnectionStatus.DISCONNECTED)
-                time.sleep(2)
-                pass
+        """
+        Start connecting to moonraker in the background.
+        NOTE: This does not block, the connection is retried with a backoff until klipper is ready.
+        """
+        self.supervisor.start()
+
+    def disconnect(self):
+        self.supervisor.stop()
 
     def is_connected(self):
-        self.moonraker_websocket.recv()
-        return self.moonraker_websocket.connected
+        """
+        Check if moonraker is connected and klipper is ready.
+        """
+        return self.supervisor.is_ready()
     
     def check_klipper_connection(self):
-        state = self.query("server.info")
-
-        if state["klippy_state"] == "ready":
+        """
+        Check if klipper is ready.
+        NOTE: This does not block, the connection is checked in the background by the supervisor.
+        """
+        return self.is_connected()
+
+    async def load_config(self):
+        """
+        Reads the settings of the printer config that the gcode depends on.
+        NOTE: The config is read instead of the toolhead status, the toolhead limits are changed by the gcode itself.
+        """
+        result = await self.moonraker.request("printer.objects.query", {"objects": {"configfile": ["settings"]}})
+
+        printer_settings = result["status"].get("configfile", {}).get("settings", {}).get("printer", {})
+        self.max_accel = printer_settings.get("max_accel")
+
+    def get_max_accel(self):
+        """
+        Get the max_accel of the printer config or None if it has not been read yet.
+        """
+        return self.max_accel
+
+    def report_connection_status(self, ready):
+        if ready:
+            self.throw_connection_status(Klipper.ConnectionStatus.CONNECTED)
             self.throw_message_status(Klipper.MessageStatus.READY)
-            return True
-        elif state["klippy_state"] == "startup":
-            time.sleep(2)
-            return self.check_klipper_connection()
         else:
-            self.throw_message_status(Klipper.MessageStatus.FAILURE)
-            print("Klipper Is Not Ready! Status:" + self.query("printer.info")["state_message"])
-            return False
-    
-    def query(self, request):
-        # Check if connected to moonraker
-        if not self.is_connected():
-            self.throw_message_status(Klipper.MessageStatus.FAILURE)
-            return
-
-        # Send request to moonraker
-        self.moonraker_websocket.send(request_json(request))
-
-        # Get response from moonraker
-        while True:
-            response = parse_json(self.moonraker_websocket.recv())
-            if isinstance(response, Ok):
-                return response.result
-            elif isinstance(response, Error):
-                print(response.message)
-                self.throw_message_status(Klipper.MessageStatus.FAILURE)
-
+            # The motion and prints being waited for can't complete without klipper
+            error = ConnectionError("Moonraker connection lost")
+            self.motion_monitor.fail_waiters(error)
+            self.file_printer.fail_prints(error)
+
+            self.throw_connection_status(Klipper.ConnectionStatus.DISCONNECTED)
+
+    def run(self, coroutine):
+        """
+        Run a coroutine on the moonraker client once klipper is ready.
+        While disconnected the coroutine waits up to the queue timeout for a reconnect, then it is rejected with a ConnectionError.
+        Returns a concurrent.futures.Future of its result.
+        """
+        async def run_when_ready():
+            try:
+                if not self.supervisor.is_ready():
+                    if self.queue_timeout <= 0:
+                        raise ConnectionError("Not connected to Moonraker")
 
-        # # Start a thread to try to connect to moonraker
-        # def run():
-        #     while True:
-        #         # Check if connected to moonraker
-        #         self.moonraker_websocket.recv()
+                    await self.supervisor.wait_until_ready(self.queue_timeout)
+            except ConnectionError:
+                coroutine.close()
+                raise
 
-        #         if not self.moonraker_websocket.connected:
-        #             try:
-        #                 self.moonraker_websocket.connect("ws://localhost:5000")
-        #         self.throw_connection_status(Klipper.ConnectionStatus.CONNECTED)
+            return await coroutine
 
-    def send_initialize(self):
-        # Check if connected to moonraker
-        if not self.is_connected():
+        return self.moonraker.run(run_when_ready())
+    
+    def query(self, request, params=None):
+        # Send the request to moonraker and wait for its reply
+        try:
+            return self.run(self.moonraker.request(request, params)).result()
+        except (MoonrakerError, ConnectionError) as error:
+            print(error)
             self.throw_message_status(Klipper.MessageStatus.FAILURE)
-            return
 
-        # Send request to moonraker
-        self.moonraker_websocket.send(request_json("printer.gcode.script", params={"script": "SET_KINEMATIC_POSITION X=20 Y=25 Z=0"}))
+    def get_status(self):
+        return self.status
 
-        # Get response from moonraker
-        while True:
-            try:
-                response = parse_json(self.moonraker_websocket.recv())
-            except KeyError:
-                print("KeyError")
-                continue
-
-            if isinstance(response, Ok):
-                self.throw_message_status(Klipper.MessageStatus.SUCCESS)
-                return
-            elif isinstance(response, Error):
-                self.throw_message_status(Klipper.MessageStatus.FAILURE)
-                print("Error Sending GCode: " + response.message)
-                return
+    def send_initialize(self):
+        self.send_gcode("SET_KINEMATIC_POSITION X=20 Y=25 Z=0")
 
     def send_end(self):
-        # Check if connected to moonraker
-        if not self.is_connected():
+        self.send_gcode("M18")
+
+    def submit_gcode(self, gcode):
+        """
+        Send gcode to klipper without waiting for it to be processed.
+        Returns a future that is resolved once klipper has processed the gcode.
+        NOTE: Scripts submitted one after another are processed by klipper in the same order.
+        """
+        # Send gcode to moonraker
+        future = self.run(self.moonraker.request("printer.gcode.script", {"script": gcode}))
+        future.add_done_callback(self.report_gcode_status)
+
+        return future
+
+    def stream_gcode(self, gcode):
+        """
+        Stream gcode to klipper in chunks without waiting for it to be processed.
+        The chunks are only sent while the motion queued in klipper is below the target of the streamer.
+        Returns a future that is resolved once klipper has processed all of the gcode.
+        """
+        future = self.run(self.streamer.stream(gcode))
+        future.add_done_callback(self.report_gcode_status)
+
+        return future
+
+    def execute_gcode(self, gcode):
+        """
+        Stream gcode to klipper without waiting for it to be executed.
+        Returns a future that is resolved once the motion of the gcode is complete.
+        """
+        async def execute():
+            start_time = time.perf_counter()
+            self.metrics.record("klipper/execute/gcode_bytes", len(gcode))
+
+            await self.streamer.stream(gcode)
+            self.metrics.record("klipper/execute/processed", time.perf_counter() - start_time)
+
+            await self.motion_monitor.wait_for_motion_complete()
+            self.metrics.record("klipper/execute/complete", time.perf_counter() - start_time)
+
+        future = self.run(execute())
+        future.add_done_callback(self.report_gcode_status)
+
+        return future
+
+    def print_gcode(self, gcode, progress_callback=None):
+        """
+        Upload gcode as a file and print it from the virtual sdcard.
+        NOTE: Use this for long programs (e.g. a full board reset), interactive moves should use execute_gcode which has less latency.
+        Returns a future that is resolved once the print is complete.
+        """
+        async def print_file():
+            start_time = time.perf_counter()
+            self.metrics.record("klipper/print/gcode_bytes", len(gcode))
+
+            await self.file_printer.print_gcode(gcode, progress_callback=progress_callback)
+            self.metrics.record("klipper/print/complete", time.perf_counter() - start_time)
+
+        future = self.run(print_file())
+        future.add_done_callback(self.report_gcode_status)
+
+        return future
+
+    def wait_for_motion_complete(self):
+        """
+        Returns a future that is resolved once the motion queued so far is complete.
+        """
+        return self.run(self.motion_monitor.wait_for_motion_complete())
+
+    def add_motion_complete_callback(self, callback):
+        """
+        Calls the callback every time klipper finishes executing the queued motion.
+        NOTE: The callback is called from the moonraker client thread.
+        """
+        self.motion_monitor.add_callback(callback)
+
+    def get_toolhead_position(self):
+        """
+        Get the last reported toolhead position [x, y, z, e] or None if it is unknown.
+        """
+        return self.status.get("toolhead", "position")
+
+    def get_stream_metrics(self):
+        """
+        Get the queue depth and idle gap metrics of the gcode streamer.
+        """
+        return self.streamer.get_metrics()
+
+    def get_metrics(self):
+        """
+        Get the summaries of the request timings, payload sizes and errors of the moonraker link.
+        """
+        summary = self.metrics.get_summary("moonraker/")
+        klipper_summary = self.metrics.get_summary("klipper/")
+
+        summary["histograms"].update(klipper_summary["histograms"])
+        summary["counters"].update(klipper_summary["counters"])
+
+        return summary
+
+    def report_gcode_status(self, future):
+        error = future.exception()
+
+        if error is None:
+            self.throw_message_status(Klipper.MessageStatus.SUCCESS)
+        else:
+            self.metrics.increment("klipper/gcode_errors")
             self.throw_message_status(Klipper.MessageStatus.FAILURE)
-            return
-
-        # Send request to moonraker
-        self.moonraker_websocket.send(request_json("printer.gcode.script", params={"script": "M18"}))
-
-        # Get response from moonraker
-        while True:
-            try:
-                response = parse_json(self.moonraker_websocket.recv())
-            except KeyError:
-                print("KeyError")
-                continue
-
-            if isinstance(response, Ok):
-                self.throw_message_status(Klipper.MessageStatus.SUCCESS)
-                return
-            elif isinstance(response, Error):
-                self.throw_message_status(Klipper.MessageStatus.FAILURE)
-                print("Error Sending GCode: " + response.message)
-                return
+            print("Error Sending GCode: " + str(error))
 
     def send_gcode(self, gcode):
-        # Check if connected to moonraker
-        if not self.is_connected():
-            self.throw_message_status(Klipper.MessageStatus.FAILURE)
-            return
-
-        # Send gcode to moonraker
-        self.moonraker_websocket.send(request_json("printer.gcode.script", params={"script": gcode}))
-
-        # Get response from moonraker
-        while True:
-            try:
-                response = parse_json(self.moonraker_websocket.recv())
-            except KeyError:
-                print("KeyError")
-                continue
-
-            if isinstance(response, Ok):
-                self.throw_message_status(Klipper.MessageStatus.SUCCESS)
-                return
-            elif isinstance(response, Error):
-                self.throw_message_status(Klipper.MessageStatus.FAILURE)
-                print("Error Sending GCode: " + response.message)
-                return
-
-
-    # def send_gcode(self, gcode):
-        # # Check if connected to moonraker
-        # if self.moonraker_websocket is None:
-        #     self.throw_message_status(Klipper.MessageStatus.FAILURE)
-        #     return
-        # else:
-        #     self.throw_message_status(Klipper.MessageStatus.SUCCESS)
-
-        # print("here")
-        # if self.moonraker_websocket:            
-        #     await self.moonraker_websocket.send(request_json("ping"))
-        #     response = parse_json(await self.moonraker_websocket.recv())
-
-        #     if isinstance(response, Ok):
-        #         print(response.result)
+        """
+        Send gcode to klipper and wait for it to be processed.
+        """
+        wait([self.submit_gcode(gcode)])
 
     class ConnectionStatus(Enum):
         CONNECTED = 1
@@ -185,6 +274,5 @@ class Klipper():
 # klipper = Klipper("10.29.122.93:7125", lambda x: print(x), lambda x: print(x))
 
 # klipper.connect()
-# klipper.check_klipper_connection()
 
 # klipper.send_gcode("G90")
\ No newline at end of file
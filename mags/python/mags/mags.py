@@ -1,17 +1,10 @@
-from threading import Thread
-from flask_socketio import SocketIO
-from flask import Flask, render_template
-from matplotlib import pyplot as plt
-import numpy as np
+import os
+from flask_socketio import SocketIO, join_room, leave_room
+from flask import Flask, Response, abort, jsonify, render_template, request
 from sassutils.wsgi import SassMiddleware
 
-from stockfish import Stockfish
-from klipper_interface import Klipper
-from move_manager import MoveManager
-from move_observer import MoveObserver
-from planning.astar import Astar
-
-from planning.board import PhysicalBoard
+from board_registry import DEFAULT_BOARD, BoardConfig, BoardRegistry, EnginePool
+from metrics import METRICS
 
 # Flask Setup
 app = Flask(__name__, static_folder="../../static", template_folder="../../templates")
@@ -26,91 +19,97 @@ app.wsgi_app = SassMiddleware(app.wsgi_app, {
     "mags": ("../../static/sass", "../../static/css", "/static/css", False)
 })
 
-# Chess Setup
-stockfish = Stockfish(path="stockfish/stockfish_15.1_linux_x64_avx2/stockfish-ubuntu-20.04-x86-64-avx2")
+# Tables Setup
+# The tables are configured in a JSON file, without one a single table is hosted
+BOARDS_CONFIG = os.environ.get("MAGS_BOARDS", "boards.json")
+ENGINE_COUNT = int(os.environ.get("MAGS_ENGINES", "1"))
 
-capture_positions = [
-        np.array([375, 200]),
-        np.array([375, 200]),
-        np.array([375, 200]),
-        np.array([375, 200]),
-    ]
+registry = BoardRegistry(socketio, EnginePool(ENGINE_COUNT))
 
-board = PhysicalBoard(400, 400, 22, 1, capture_positions=capture_positions)
-board.reset()
+if os.path.exists(BOARDS_CONFIG):
+    registry.load(BOARDS_CONFIG)
+else:
+    registry.add_board(BoardConfig(DEFAULT_BOARD, moonraker_address="10.29.43.219:7125", observe=True))
 
-astar = Astar()
-astar.clear()
+def get_session(data):
+    """
+    Get the session of the table an event is for, events without a board id are for the default table.
+    """
+    board_id = data.get("board", DEFAULT_BOARD) if isinstance(data, dict) else DEFAULT_BOARD
 
-move_manager = MoveManager(board, astar, stockfish)
+    session = registry.get(board_id)
 
-klipper = Klipper("10.29.43.219:7125", lambda x: print(x), lambda x: print(x))
+    if session is None:
+        raise ValueError("Unknown board: " + str(board_id))
 
-klipper.connect()
-klipper.check_klipper_connection()
+    return session
 
-# def update_binary_board_state():
-#     while True:
-#         socketio.sleep(0.1)
+@app.route("/")
+def index():
+    return render_template("index.html")
 
-#         move_observer.sample_board()
+@app.route("/boards")
+def boards():
+    return jsonify(registry.get_ids())
 
-#         # Get the binary board state
-#         binary_board_state = move_observer.get_binary_board_as_dict()
+@app.route("/boards/<board_id>/image.png")
+def board_image(board_id):
+    """
+    The current position of a table as a PNG, for spectators and debugging.
+    The ETag is the piece placement, so a client that already shows the position gets a 304.
+    """
+    session = registry.get(board_id)
 
-#         # Send the binary board state to the client
-#         socketio.emit("update_binary_board", json.dumps(binary_board_state))
+    if session is None:
+        abort(404)
 
-# # Make a thread to update the board state
-# thread = Thread(target=update_binary_board_state)
-# thread.daemon = True
+    placement, png = session.get_image()
 
-# # Start the thread
-# thread.start()
+    response = Response(png, mimetype="image/png")
+    response.set_etag(placement)
+    response.headers["Cache-Control"] = "no-cache"
 
-@app.route("/")
-def index():
-    return render_template("index.html")
+    return response.make_conditional(request)
 
-@socketio.on("start")
-def start():
-    print("Starting game!")
+@app.route("/metrics")
+def metrics():
+    """
+    The timing histograms and counters of the moonraker links, planning and the engines, and the turns of each table.
+    """
+    return jsonify({
+        "metrics": METRICS.get_summary(),
+        "boards": {session.get_id(): session.get_metrics() for session in registry.get_sessions()},
+    })
 
-    board.reset()
-    # klipper.send_initialize()
+@socketio.on("join")
+def join(data=None):
+    # The events of a table are only sent to the clients in its room
+    session = get_session(data)
 
-    update_state()
+    join_room(session.get_id())
+    session.send_current(request.sid)
 
-@socketio.on("end")
-def end():
-    print("Ending game!")
-    
-    board.clear()
-    # klipper.send_end()
+    return session.get_id()
 
-    update_state()
+@socketio.on("leave")
+def leave(data=None):
+    leave_room(get_session(data).get_id())
 
-@socketio.on("move")
-def move(data):
-    if not board.make_move(data):
-        update_state()
-        return
-    
-    print(board.get_fen())
-    capture_path, path = move_manager.respond()
-
-    if not capture_path is None:
-        print(move_manager.trace_path(capture_path))
-        klipper.send_gcode(move_manager.trace_path(capture_path))
-
-    print(move_manager.trace_path(path))
+@socketio.on("start")
+def start(data=None):
+    return get_session(data).submit("start")
 
-    klipper.send_gcode(move_manager.trace_path(path))
+@socketio.on("end")
+def end(data=None):
+    return get_session(data).submit("end")
 
-    update_state()
+@socketio.on("move")
+def move(data):
+    # Old clients only send the move of the default table
+    if isinstance(data, dict):
+        return get_session(data).submit("move", data["move"])
 
-def update_state():
-    socketio.emit("update", board.get_fen())
+    return get_session(None).submit("move", data)
 
 
 if __name__ == "__main__":
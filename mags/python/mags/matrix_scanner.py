@@ -0,0 +1,270 @@
+import heapq
+import time
+
+import chess
+import numpy as np
+
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+OUTPUT_PINS = [22, 10, 9, 11, 7, 8, 25, 24] # Columns (files a -> h)
+INPUT_PINS = list(reversed([5, 6, 13, 19, 26, 21, 20, 16])) # Rows (ranks 1 -> 8)
+
+# Time for the rows to settle after a column is driven high
+COLUMN_SETTLE_TIME = 0.00001 # Seconds
+
+
+def board_to_bitboard(binary_board):
+    """
+    Packs an 8x8 binary board indexed [file, rank] into a 64 bit bitboard.
+    Bit n is set if square n (a1 = 0, b1 = 1, ..., h8 = 63) is occupied, the same layout as python-chess.
+    """
+    bits = np.packbits(np.asarray(binary_board, dtype=np.uint8).T.ravel(), bitorder="little")
+
+    return int.from_bytes(bits.tobytes(), "little")
+
+
+def bitboard_to_board(bitboard):
+    """
+    Unpacks a 64 bit bitboard into an 8x8 binary board indexed [file, rank].
+    """
+    bits = np.unpackbits(np.frombuffer(bitboard.to_bytes(8, "little"), dtype=np.uint8), bitorder="little")
+
+    return bits.reshape(8, 8).T.copy()
+
+
+class ScanBackend():
+    """
+    Reads the occupancy of the reed switch matrix.
+
+    Backends return a full board per scan as an 8x8 uint8 array indexed [file, rank] (1 = piece present).
+    The bitboard of a scan uses the python-chess square layout (see board_to_bitboard).
+    """
+
+    def scan(self):
+        raise NotImplementedError()
+
+    def scan_bitboard(self):
+        return board_to_bitboard(self.scan())
+
+    def reset(self):
+        """
+        Puts the matrix into its idle state (no column driven).
+        """
+
+    def close(self):
+        """
+        Releases the hardware of the backend.
+        """
+
+
+class GpioScanBackend(ScanBackend):
+    """
+    Scans the matrix by driving one column high at a time and reading the rows.
+
+    With the pigpio daemon running all rows of a column are read in one read_bank_1 call and the columns are switched with set_bank_1/clear_bank_1.
+    Without it the pins are driven and read one by one with gpiozero, which is much slower.
+    NOTE: Raises gpiozero's errors if the pins are not available, e.g. when not running on a Raspberry Pi.
+    """
+
+    def __init__(self, output_pins=OUTPUT_PINS, input_pins=INPUT_PINS, settle_time=COLUMN_SETTLE_TIME):
+        self.output_pins = list(output_pins)
+        self.input_pins = list(input_pins)
+        self.settle_time = settle_time
+
+        self.pi = None
+        if pigpio is not None:
+            pi = pigpio.pi()
+
+            if pi.connected:
+                self.pi = pi
+            else:
+                print("pigpio Daemon Not Running! Falling back to gpiozero")
+
+        if self.pi is not None:
+            for pin in self.output_pins:
+                self.pi.set_mode(pin, pigpio.OUTPUT)
+
+            for pin in self.input_pins:
+                self.pi.set_mode(pin, pigpio.INPUT)
+                self.pi.set_pull_up_down(pin, pigpio.PUD_OFF)
+
+            self.output_mask = sum(1 << pin for pin in self.output_pins)
+
+            # Shift each row to its bit in the read bank
+            self.input_shifts = np.array(self.input_pins, dtype=np.uint32)
+        else:
+            import gpiozero
+
+            self.output_devices = [gpiozero.DigitalOutputDevice(pin) for pin in self.output_pins]
+            self.input_devices = [gpiozero.DigitalInputDevice(pin, pull_up=False) for pin in self.input_pins]
+
+        self.reset()
+
+    def scan(self):
+        binary_board = np.zeros((8, 8), dtype=np.uint8)
+
+        if self.pi is not None:
+            for i, pin in enumerate(self.output_pins):
+                # Drive only the column of file i
+                self.pi.clear_bank_1(self.output_mask)
+                self.pi.set_bank_1(1 << pin)
+
+                if self.settle_time > 0:
+                    time.sleep(self.settle_time)
+
+                binary_board[i] = (np.uint32(self.pi.read_bank_1()) >> self.input_shifts) & 1
+
+            self.pi.clear_bank_1(self.output_mask)
+        else:
+            for i, output in enumerate(self.output_devices):
+                output.on()
+
+                binary_board[i] = [input_device.value for input_device in self.input_devices]
+
+                output.off()
+
+        return binary_board
+
+    def reset(self):
+        if self.pi is not None:
+            self.pi.clear_bank_1(self.output_mask)
+        else:
+            for output in self.output_devices:
+                output.off()
+
+    def close(self):
+        self.reset()
+
+        if self.pi is not None:
+            self.pi.stop()
+        else:
+            for device in self.output_devices + self.input_devices:
+                device.close()
+
+
+class SimulatedScanBackend(ScanBackend):
+    """
+    A matrix driven by scripted piece movements to run the observer without hardware (e.g. on CI).
+
+    Changes are scheduled relative to the creation of the backend (or the last restart) and applied when their time has passed at a scan.
+    Squares are named like in python-chess ("e2").
+    """
+
+    def __init__(self, fen=chess.STARTING_FEN, clock=time.monotonic):
+        self.clock = clock
+
+        self.binary_board = np.zeros((8, 8), dtype=np.uint8)
+        self.set_fen(fen)
+
+        # Scheduled changes as (time, order, square, state)
+        self.events = []
+        self.event_count = 0
+
+        self.start_time = self.clock()
+
+    def set_fen(self, fen):
+        """
+        Sets the occupancy to the pieces of a FEN.
+        """
+        self.binary_board[:] = 0
+
+        for square in chess.SquareSet(chess.Board(fen).occupied):
+            self.binary_board[chess.square_file(square), chess.square_rank(square)] = 1
+
+    def restart(self):
+        """
+        Restarts the script clock and drops the scheduled changes.
+        """
+        self.events = []
+        self.start_time = self.clock()
+
+    def set_square(self, delay, square, state):
+        """
+        Schedules a square to change its state after a delay.
+        """
+        heapq.heappush(self.events, (self.start_time + delay, self.event_count, chess.parse_square(square), state))
+        self.event_count += 1
+
+    def lift(self, delay, square, bounces=0, bounce_time=0.002):
+        """
+        Schedules a piece to be lifted, optionally with the reed switch bouncing before it opens.
+        """
+        for bounce in range(bounces):
+            self.set_square(delay + 2 * bounce * bounce_time, square, 0)
+            self.set_square(delay + (2 * bounce + 1) * bounce_time, square, 1)
+
+        self.set_square(delay + 2 * bounces * bounce_time, square, 0)
+
+    def place(self, delay, square, bounces=0, bounce_time=0.002):
+        """
+        Schedules a piece to be placed, optionally with the reed switch bouncing before it closes.
+        """
+        for bounce in range(bounces):
+            self.set_square(delay + 2 * bounce * bounce_time, square, 1)
+            self.set_square(delay + (2 * bounce + 1) * bounce_time, square, 0)
+
+        self.set_square(delay + 2 * bounces * bounce_time, square, 1)
+
+    def move(self, delay, start, end, duration=0.5, capture=False, capture_time=0.5, bounces=0):
+        """
+        Schedules a piece to be moved from start to end.
+        For a capture the captured piece is lifted from the end square first.
+        Returns the delay after the move has ended.
+        """
+        if capture:
+            self.lift(delay, end, bounces)
+            delay += capture_time
+
+        self.lift(delay, start, bounces)
+        self.place(delay + duration, end, bounces)
+
+        return delay + duration
+
+    def scan(self):
+        now = self.clock()
+
+        while len(self.events) > 0 and self.events[0][0] <= now:
+            _, _, square, state = heapq.heappop(self.events)
+            self.binary_board[chess.square_file(square), chess.square_rank(square)] = state
+
+        return self.binary_board.copy()
+
+    def is_done(self):
+        """
+        Checks if all scheduled changes have been applied.
+        """
+        return len(self.events) == 0
+
+
+def benchmark_backend(backend, duration=1.0, bitboard=False):
+    """
+    Scans the board as fast as possible and returns the full board scans per second.
+    """
+    scan = backend.scan_bitboard if bitboard else backend.scan
+
+    scans = 0
+    start_time = time.perf_counter()
+
+    while time.perf_counter() - start_time < duration:
+        scan()
+        scans += 1
+
+    return scans / (time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    backend = SimulatedScanBackend()
+    print("Simulated: {:.0f} scans/s".format(benchmark_backend(backend)))
+
+    print("Simulated (bitboard): {:.0f} scans/s".format(benchmark_backend(backend, bitboard=True)))
+
+    try:
+        backend = GpioScanBackend()
+    except Exception as error:
+        print("GPIO Not Available: " + str(error))
+    else:
+        print("GPIO ({}): {:.0f} scans/s".format("pigpio" if backend.pi is not None else "gpiozero", benchmark_backend(backend)))
+        backend.close()
@@ -0,0 +1,126 @@
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+import time
+
+import numpy as np
+
+# Number of samples kept by each histogram
+HISTOGRAM_SIZE = 1000
+
+
+class Histogram():
+    """
+    A rolling histogram of the most recent samples of a metric.
+    """
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self.samples = deque(maxlen=size)
+
+        # The total number of samples recorded, including the ones that were dropped
+        self.count = 0
+
+    def record(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def get_summary(self):
+        """
+        Get the count, mean and percentiles of the samples.
+        """
+        if len(self.samples) == 0:
+            return {"count": self.count}
+
+        samples = np.array(self.samples, dtype=float)
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+
+        return {
+            "count": self.count,
+            "mean": float(samples.mean()),
+            "min": float(samples.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(samples.max()),
+        }
+
+    def get_histogram(self, bins=10):
+        """
+        Get the bin counts and bin edges of the samples.
+        """
+        counts, edges = np.histogram(np.array(self.samples, dtype=float), bins=bins)
+
+        return counts.tolist(), edges.tolist()
+
+
+class MetricsRegistry():
+    """
+    A registry of the timing histograms and counters of the whole system (e.g. the moonraker link, planning and the engine).
+    Metrics are named by their source, e.g. "moonraker/printer.gcode.script/ack".
+
+    NOTE: Times are in seconds and sizes in bytes. The registry is safe to use from any thread.
+    """
+
+    def __init__(self, histogram_size=HISTOGRAM_SIZE):
+        self.histogram_size = histogram_size
+
+        self.histograms = {}
+        self.counters = {}
+
+        self.lock = Lock()
+
+    def record(self, name, value):
+        """
+        Record a sample of a histogram.
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(self.histogram_size)
+
+            self.histograms[name].record(value)
+
+    def increment(self, name, amount=1):
+        """
+        Increment a counter.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def time(self, name):
+        """
+        Record the time spent in a with block.
+        """
+        start_time = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time)
+
+    def get_histogram(self, name):
+        with self.lock:
+            return self.histograms.get(name)
+
+    def get_counter(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    def get_summary(self, prefix=""):
+        """
+        Get the summaries of the histograms and the counters whose name starts with the prefix.
+        """
+        with self.lock:
+            return {
+                "histograms": {name: histogram.get_summary() for name, histogram in self.histograms.items() if name.startswith(prefix)},
+                "counters": {name: count for name, count in self.counters.items() if name.startswith(prefix)},
+            }
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+# The registry shared by the whole system
+METRICS = MetricsRegistry()
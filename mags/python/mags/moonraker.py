@@ -0,0 +1,232 @@
+import asyncio
+from itertools import count
+import json
+from threading import Thread
+import time
+
+import websockets
+
+from metrics import METRICS
+
+
+class MoonrakerError(Exception):
+    """
+    Raised when moonraker replies to a request with a JSON-RPC error.
+    """
+
+    def __init__(self, code, message):
+        super().__init__("{} (Code: {})".format(message, code))
+
+        self.code = code
+        self.message = message
+
+
+class MoonrakerClient():
+    """
+    An asyncio JSON-RPC client for the moonraker websocket.
+
+    One websocket is shared by all requests:
+    1. Each request gets a unique id and a future that is resolved by the reply with the same id
+    2. Any number of requests can be in flight at the same time, replies are matched by id and not by order
+    3. Notifications (messages without an id) are routed to the subscribers of their method
+
+    The time to send each request and to receive its reply, the payload sizes and the errors are recorded per method in the metrics registry.
+
+    The client runs its own event loop in a background thread.
+    The coroutines (open, request, shutdown) run on that loop, the other methods are safe to call from any thread (e.g. the Flask-SocketIO handlers).
+    """
+
+    def __init__(self, server_address, metrics=METRICS):
+        self.url = "ws://" + server_address + "/websocket"
+
+        self.metrics = metrics
+
+        self.websocket = None
+        self.reader = None
+        self.connected = False
+
+        # Requests waiting for a reply keyed by their id, stored as (future, method)
+        self.ids = count(1)
+        self.pending = {}
+
+        # Notification callbacks keyed by method
+        self.subscribers = {}
+
+        # Run the event loop in the background so the callers never block on the websocket
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def is_connected(self):
+        return self.connected
+
+    async def open(self):
+        """
+        Opens the websocket and starts reading messages.
+        """
+        self.websocket = await websockets.connect(self.url, max_size=None)
+        self.connected = True
+
+        self.reader = asyncio.ensure_future(self.read())
+
+    async def shutdown(self):
+        """
+        Closes the websocket, the pending requests fail with a ConnectionError.
+        """
+        if self.websocket is not None:
+            await self.websocket.close()
+
+        if self.reader is not None:
+            await self.reader
+
+    async def read(self):
+        """
+        Reads messages until the websocket is closed.
+        """
+        try:
+            async for message in self.websocket:
+                self.handle_message(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connected = False
+
+            # Nothing can reply to the pending requests anymore
+            pending = self.pending
+            self.pending = {}
+
+            for future, _ in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Moonraker connection closed"))
+
+    def handle_message(self, message):
+        """
+        Resolves the request a reply belongs to or passes a notification to its subscribers.
+        """
+        raw_message = message
+
+        try:
+            message = json.loads(message)
+        except ValueError:
+            print("Invalid Moonraker Message: " + message)
+            return
+
+        # Replies carry the id of their request
+        if "id" in message:
+            future, method = self.pending.pop(message["id"], (None, None))
+
+            # The request was cancelled or timed out
+            if future is None or future.done():
+                return
+
+            self.metrics.record("moonraker/{}/response_bytes".format(method), len(raw_message))
+
+            if "error" in message:
+                future.set_exception(MoonrakerError(message["error"].get("code"), message["error"].get("message")))
+            else:
+                future.set_result(message.get("result"))
+
+            return
+
+        # Notifications carry a method and a list of parameters
+        method = message.get("method")
+
+        for callback in list(self.subscribers.get(method, [])):
+            try:
+                callback(*message.get("params", []))
+            except Exception as error:
+                # A failing subscriber must not stop the reader
+                print("Error In {} Subscriber: {}".format(method, error))
+
+    async def request(self, method, params=None, timeout=None):
+        """
+        Sends a request and waits for its reply.
+        Returns the result of the request or raises a MoonrakerError if moonraker replies with an error.
+        """
+        if not self.connected:
+            raise ConnectionError("Not connected to Moonraker")
+
+        name = "moonraker/" + method
+        start_time = time.perf_counter()
+
+        request_id = next(self.ids)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (future, method)
+
+        message = {"jsonrpc": "2.0", "method": method, "id": request_id}
+        if params is not None:
+            message["params"] = params
+
+        try:
+            payload = json.dumps(message)
+            await self.websocket.send(payload)
+
+            sent_time = time.perf_counter()
+
+            self.metrics.record(name + "/send", sent_time - start_time)
+            self.metrics.record(name + "/request_bytes", len(payload))
+
+            result = await asyncio.wait_for(future, timeout)
+
+            # The reply is sent once moonraker (and klipper) have processed the request
+            self.metrics.record(name + "/ack", time.perf_counter() - sent_time)
+
+            return result
+        except asyncio.TimeoutError:
+            self.metrics.increment(name + "/timeouts")
+            raise
+        except (MoonrakerError, ConnectionError, websockets.ConnectionClosed):
+            self.metrics.increment(name + "/errors")
+            raise
+        finally:
+            self.pending.pop(request_id, None)
+
+    def run(self, coroutine):
+        """
+        Schedules a coroutine on the event loop of the client from another thread.
+        Returns a concurrent.futures.Future of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def connect(self, timeout=None):
+        """
+        Opens the websocket and waits for the connection.
+        """
+        self.run(self.open()).result(timeout)
+
+    def close(self, timeout=None):
+        """
+        Closes the websocket and waits for the pending requests to be failed.
+        """
+        self.run(self.shutdown()).result(timeout)
+
+    def submit(self, method, params=None, timeout=None):
+        """
+        Sends a request without waiting for the reply.
+        Returns a concurrent.futures.Future of the result.
+        """
+        return self.run(self.request(method, params, timeout))
+
+    def call(self, method, params=None, timeout=None):
+        """
+        Sends a request and blocks the calling thread until the reply arrives.
+        NOTE: This must not be called from the event loop of the client.
+        """
+        return self.submit(method, params, timeout).result()
+
+    def subscribe(self, method, callback):
+        """
+        Calls the callback with the parameters of every notification of a method (e.g. notify_status_update).
+        NOTE: The callback is called on the event loop of the client and should not block.
+        """
+        self.subscribers.setdefault(method, []).append(callback)
+
+    def unsubscribe(self, method, callback):
+        """
+        Removes a notification callback.
+        """
+        callbacks = self.subscribers.get(method, [])
+
+        if callback in callbacks:
+            callbacks.remove(callback)
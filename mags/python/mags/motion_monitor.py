@@ -0,0 +1,133 @@
+import asyncio
+
+# The klipper status fields that show if the toolhead is still moving
+MOTION_STATUS = {
+    "toolhead": ["print_time", "estimated_print_time"],
+    "idle_timeout": ["state"],
+}
+
+# Time in seconds a motion wait allows beyond the queued print time before it fails
+MOTION_TIMEOUT_MARGIN = 10.0
+
+
+class MotionMonitor():
+    """
+    Detects when klipper has finished executing the queued motion.
+
+    The motion is complete once the idle_timeout state has left "Printing" and the estimated print time has passed the print time of the last queued move.
+    Both come from the status subscription, so motion complete events are delivered as the status updates arrive instead of by polling.
+
+    The waiters fail with a ConnectionError when the connection is lost and with a TimeoutError when the motion takes much longer than it was queued for.
+    NOTE: The idle_timeout state and the toolhead times have to be in the subscribed PrinterStatus.
+    """
+
+    def __init__(self, status):
+        self.status = status
+
+        # Futures waiting for the motion to complete
+        self.waiters = []
+
+        # Called every time the motion completes
+        self.callbacks = []
+
+        self.moving = False
+
+        status.add_listener(self.check_motion)
+
+    def is_motion_complete(self):
+        """
+        Checks if the toolhead has stopped according to the last status.
+        """
+        if self.status.get("idle_timeout", "state") == "Printing":
+            return False
+
+        print_time = self.status.get("toolhead", "print_time")
+        estimated_print_time = self.status.get("toolhead", "estimated_print_time")
+
+        if print_time is None or estimated_print_time is None:
+            return True
+
+        # The estimated print time has advanced in real time since the status was received
+        return estimated_print_time + self.status.get_age() >= print_time
+
+    def get_queued_time(self):
+        """
+        Get the time in seconds until the motion queued so far is executed according to the last status.
+        """
+        print_time = self.status.get("toolhead", "print_time")
+        estimated_print_time = self.status.get("toolhead", "estimated_print_time")
+
+        if print_time is None or estimated_print_time is None:
+            return 0.0
+
+        return max(print_time - estimated_print_time - self.status.get_age(), 0.0)
+
+    def fail_waiters(self, error):
+        """
+        Fails all waiters with the error (e.g. when the connection is lost, the motion complete never arrives).
+        """
+        waiters = self.waiters
+        self.waiters = []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+        self.moving = False
+
+    def check_motion(self, status):
+        """
+        Resolves the waiters and calls the callbacks when the motion completes.
+        """
+        complete = self.is_motion_complete()
+
+        if not complete:
+            self.moving = True
+            return
+
+        waiters = self.waiters
+        self.waiters = []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+        if self.moving:
+            self.moving = False
+
+            for callback in list(self.callbacks):
+                callback()
+
+    async def wait_for_motion_complete(self, timeout=None):
+        """
+        Waits until all of the motion queued so far has been executed.
+        Raises a TimeoutError if it is not executed within the timeout, by default the queued print time and a margin.
+        NOTE: This has to be awaited after klipper has processed the gcode of the motion.
+        """
+        # The subscription may not have caught up with the gcode yet
+        await self.status.refresh(MOTION_STATUS)
+
+        if self.is_motion_complete():
+            return
+
+        if timeout is None:
+            timeout = self.get_queued_time() + MOTION_TIMEOUT_MARGIN
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Motion not complete after {:.1f}s".format(timeout))
+
+    def add_callback(self, callback):
+        """
+        Calls the callback every time the motion completes.
+        NOTE: The callback is called on the event loop of the moonraker client and should not block.
+        """
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
@@ -0,0 +1,157 @@
+from enum import Enum
+
+import chess
+
+
+class InferenceStatus(Enum):
+    MATCH = 1
+    AMBIGUOUS = 2
+    ERROR = 3
+
+
+class MoveInference():
+    """
+    Infers the move made on the board from the occupancy bitboards seen by the reed switches.
+
+    The sensors only see occupancy, so every legal move is reduced to its effect on the occupancy bitboard (python-chess square layout):
+    1. The final occupancy after the move (castling moves two pieces, en passant clears the square of the captured pawn)
+    2. The squares that have to be lifted during the move (the start square and for a normal capture the captured piece on the end square)
+
+    The deltas are computed once per position and indexed by the final occupancy, so a settled board is matched with a dictionary lookup and a few 64 bit and/or operations.
+    Squares lifted and put back (transient lift-offs, bouncing switches) do not change the final occupancy and only add to the lifted squares.
+    Captures that end with the same occupancy (e.g. Nxe5 or Nxd4) are resolved by the squares that were lifted and by the square the last piece was placed on.
+    NOTE: Promotions can't be told apart by occupancy, a promotion is inferred as a queen promotion.
+    """
+
+    def __init__(self, board=None):
+        self.board = None
+
+        # Candidate moves keyed by the occupancy after the move, stored as (move, required lifted squares)
+        self.candidates = {}
+
+        # The observation of the current move
+        self.occupied = 0
+        self.lifted = 0
+        self.last_placed = None
+
+        if board is not None:
+            self.set_position(board)
+
+    def set_position(self, board):
+        """
+        Computes the occupancy deltas of all legal moves of a position and starts observing a new move.
+        """
+        self.board = board.copy(stack=False)
+        self.candidates = {}
+
+        occupied = self.board.occupied
+
+        for move in self.board.legal_moves:
+            # Only one promotion per square pair, the sensors can't see the piece type
+            if move.promotion is not None and move.promotion != chess.QUEEN:
+                continue
+
+            self.board.push(move)
+            occupied_after = self.board.occupied
+            self.board.pop()
+
+            required = chess.BB_SQUARES[move.from_square]
+
+            # A normal capture leaves the end square occupied, the captured piece must have been lifted from it
+            if occupied & chess.BB_SQUARES[move.to_square] and not self.board.is_castling(move):
+                required |= chess.BB_SQUARES[move.to_square]
+
+            self.candidates.setdefault(occupied_after, []).append((move, required))
+
+        self.begin()
+
+    def begin(self):
+        """
+        Starts observing a new move from the current position.
+        """
+        self.occupied = self.board.occupied
+        self.lifted = 0
+        self.last_placed = None
+
+    def observe(self, bitboard):
+        """
+        Adds an occupancy bitboard of the move in progress.
+        """
+        # Squares that were occupied before the move and are empty now
+        self.lifted |= self.board.occupied & ~bitboard & chess.BB_ALL
+
+        # The lowest square placed since the last observation, placing two pieces at once is rare
+        placed = bitboard & ~self.occupied & chess.BB_ALL
+        if placed:
+            self.last_placed = chess.lsb(placed)
+
+        self.occupied = bitboard
+
+    def infer(self):
+        """
+        Infers the move from the observed bitboards.
+        Returns the status and the matching moves (one move for a match).
+        """
+        # Nothing has changed (e.g. a piece was lifted and put back)
+        if self.occupied == self.board.occupied:
+            return InferenceStatus.ERROR, []
+
+        candidates = [move for move, required in self.candidates.get(self.occupied, []) if required & ~self.lifted == 0]
+
+        if len(candidates) > 1:
+            # Prefer the moves that end on the square the last piece was placed on
+            placed = [move for move in candidates if move.to_square == self.last_placed]
+
+            if len(placed) > 0:
+                candidates = placed
+
+        if len(candidates) > 1:
+            # Prefer the moves that lifted the fewest extra squares, the other lifts were most likely transient
+            extra = [chess.popcount(self.lifted & ~required) for move, required in self.candidates[self.occupied] if move in candidates]
+            candidates = [move for move, count in zip(candidates, extra) if count == min(extra)]
+
+        if len(candidates) == 0:
+            return InferenceStatus.ERROR, []
+
+        if len(candidates) > 1:
+            return InferenceStatus.AMBIGUOUS, candidates
+
+        return InferenceStatus.MATCH, candidates
+
+    def infer_move(self, bitboards):
+        """
+        Infers the move from a sequence of occupancy bitboards.
+        """
+        self.begin()
+
+        for bitboard in bitboards:
+            self.observe(bitboard)
+
+        return self.infer()
+
+
+if __name__ == "__main__":
+    import time
+
+    board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p3/3P4/5N2/PPP1PPPP/RNBQKB1R w KQkq - 0 4")
+
+    inference = MoveInference(board)
+
+    # Nxe5: the pawn on e5 is lifted, then the knight moves from f3
+    bitboards = []
+    occupied = board.occupied
+    for square, state in ((chess.E5, 0), (chess.F3, 0), (chess.E5, 1)):
+        occupied = occupied | chess.BB_SQUARES[square] if state else occupied & ~chess.BB_SQUARES[square]
+        bitboards.append(occupied)
+
+    print(inference.infer_move(bitboards))
+
+    start_time = time.perf_counter()
+    for _ in range(10000):
+        inference.infer_move(bitboards)
+    print("Inference: {:.1f} us".format((time.perf_counter() - start_time) / 10000 * 1e6))
+
+    start_time = time.perf_counter()
+    for _ in range(100):
+        inference.set_position(board)
+    print("Position: {:.1f} us".format((time.perf_counter() - start_time) / 100 * 1e6))
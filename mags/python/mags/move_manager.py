@@ -1,14 +1,29 @@
+from collections import deque
+import chess
 from enum import Enum
 import numpy as np
-from matplotlib import pyplot as plt
+from gcode import GcodeBuilder
 from klipper_interface import Klipper
+from metrics import METRICS
 
+from planning.arrangement import arrange_pieces, order_relocations
 from planning.astar import Astar
 from planning.board import PhysicalBoard
+from planning.decomposition import decompose_move
+from planning.graph import Circle, Graph
+from planning.motion import MotionProfile
+from planning.planner import PlanOptions, search
+from planning.segments import iter_segments
+from planning.sequencing import ActionPlanner
+from planning.trajectory import Trajectory, TrajectoryOptimizer
 
 from stockfish import Stockfish
 
-from planning.utils import v2v_angle, zero_to_2pi
+# The position the head is set to when klipper is initialized
+HOME_POSITION = [20, 25]
+
+# Number of turn reports kept for throughput tracking
+TURN_REPORT_HISTORY = 100
 
 
 class MoveManager():
@@ -17,15 +32,67 @@ class MoveManager():
 
     """
 
-    def __init__(self, board: PhysicalBoard, astar: Astar, stockfish: Stockfish):
+    def __init__(self, board: PhysicalBoard, astar: Astar, stockfish: Stockfish, gcode_builder: GcodeBuilder = None, motion_profile: MotionProfile = None, trajectory_optimizer: TrajectoryOptimizer = None, home_position=HOME_POSITION, park_position=None, plan_options: PlanOptions = None):
         self.board = board
         self.astar = astar
 
         self.stockfish = stockfish
 
+        # Assigns the feedrates of the planned paths
+        if motion_profile is None:
+            motion_profile = MotionProfile()
+        self.motion_profile = motion_profile
+
+        # Generates the gcode for the planned paths
+        # NOTE: The travel acceleration of the motion profile is restored after the drags until the printer config is known, see set_travel_accel
+        if gcode_builder is None:
+            gcode_builder = GcodeBuilder(max_accel=motion_profile.get_accel(magnet_on=False))
+        self.gcode_builder = gcode_builder
+
+        # Optionally smooths the planned paths into minimum time trajectories
+        self.trajectory_optimizer = trajectory_optimizer
+
+        # Orders the pieces to be moved each turn
+        self.action_planner = ActionPlanner(self.plan_path, self.measure_path, motion_profile, board.get_clearance_radius())
+
+        # The graph shared by the paths planned for a turn and the options of the path queries on it
+        self.map = None
+        self.plan_options = plan_options if plan_options is not None else PlanOptions()
+
+        # Track the last commanded position of the head
+        self.head_position = np.asarray(home_position, dtype=float)
+
+        # Position the head returns to after each turn, if None the head stays where the last move ended
+        self.park_position = park_position
+
+        # Travel reports of the most recent turns
+        self.turn_reports = deque(maxlen=TURN_REPORT_HISTORY)
+
+    def set_travel_accel(self, accel):
+        """
+        Set the acceleration restored after a piece is dragged, it should be the max_accel of the printer config.
+        """
+        self.gcode_builder.max_accel = accel
+
+    def get_head_position(self):
+        """
+        Get the last commanded position of the electromagnet head.
+
+        """
+        return self.head_position
+
+    def set_head_position(self, position):
+        """
+        Set the position of the electromagnet head (e.g. after homing).
+
+        """
+        self.head_position = np.asarray(position, dtype=float)
+
     def respond(self, plotting_axs=None):
         """
         Respond to the current board state.
+        Returns the planned actions for the move.
+        Raises a RuntimeError if the move can't be planned, the board is unchanged.
 
         """
         # Get the current board state
@@ -34,25 +101,12 @@ class MoveManager():
         print("Calling Stockfish!")
 
         # Get the best move UCI from stockfish
-        self.stockfish.set_fen_position(fen)
-        best_move = self.stockfish.get_best_move()
+        with METRICS.time("engine/best_move"):
+            self.stockfish.set_fen_position(fen)
+            best_move = self.stockfish.get_best_move()
 
         print("Stockfish Called!")
 
-        # Get the start and end squares
-        # Read the UCI string from the start to account for promotion
-        start_square = best_move[:2]
-        end_square = best_move[2:4]
-
-        # Get the start and end positions
-        start_position = self.board.get_square_position(start_square)
-        end_position = self.board.get_square_position(end_square)
-
-        # Generate the board map
-        map = self.board.generate_map([start_square, end_square])
-
-        print("Map Generated Called!")
-
         # Plot the board
         if plotting_axs is not None:
             # Set the path planner background
@@ -61,152 +115,210 @@ class MoveManager():
             # Plot the pieces
             self.board.plot_board(plotting_axs)
 
-        # Setup a variable to hold the capture path
-        capture_path = None
+        # The decomposition reserves capture positions, they are given back if the move can't be planned
+        capture_state = self.board.get_capture_state()
 
-        # Check if move is capture
-        if self.board.check_capture(best_move):
-            print("Calling Astar For Capture!")
-            # If the move is a capture, remove the piece from the board
-            # Prepare the path planner
-            map.clear_points()
-            self.astar.set_graph(map)
-        
-            # Set the start and end points
-            self.astar.set_start(end_position)
-            self.astar.set_goal(self.board.get_open_capture_position())
-
-            # Plan the path
-            capture_path = self.astar.calculate_path()
-
-            # Plot the capture path
-            if plotting_axs is not None:
-                self.astar.plot_path(plotting_axs, board.get_piece_diameter())
+        # Break the move down into the pieces that have to be moved
+        relocations = decompose_move(self.board, best_move)
 
-        # Plan the move path
         print("Calling Astar!")
 
-        map.clear_points()
-        self.astar.set_graph(map)
-
-        self.astar.set_start(start_position)
-        self.astar.set_goal(end_position)
-
-        path = self.astar.calculate_path()
+        with METRICS.time("planning/turn"):
+            plan = self.plan_actions(relocations)
 
         print("Astar Called!")
+
+        if plan is None:
+            self.board.set_capture_state(capture_state)
+            raise RuntimeError("No valid order of the relocations found for " + best_move)
         
         # Make the move on the board
         self.board.make_move(best_move)
         
-        # Plot the graph and the move path
+        # Plot the move paths
         if plotting_axs is not None:
-            map.plot_graph(plotting_axs, simplify=True)
-            self.astar.plot_path(plotting_axs, self.board.get_piece_diameter())
+            for path in plan.get_paths():
+                if isinstance(path, Trajectory):
+                    path = path.get_path()
+
+                self.astar.plot_path(plotting_axs, self.board.get_piece_diameter(), path)
+
+        # Return the planned actions
+        return plan
+
+    def plan_actions(self, relocations, occupied=None):
+        """
+        Plan a set of relocations in the order that minimizes the total time, starting from the current head position.
+        One graph is prepared for the current pieces and updated as the pieces move.
+
+        """
+        if occupied is None:
+            occupied = self.board.get_piece_positions()
+
+        self.map = Graph([Circle(self.board.get_clearance_radius(), position) for position in occupied.values()])
+
+        return self.action_planner.plan(relocations, occupied, self.head_position, self.park_position)
+
+    def plan_setup(self, fen=chess.STARTING_FEN):
+        """
+        Plan the relocations that physically set the pieces up in the position of a FEN (e.g. to reset the board after a game).
+        The pieces in the capture area are brought back and surplus pieces are moved off the board.
+        Returns the planned actions, raises a RuntimeError if the setup can't be planned, the board is unchanged.
+
+        NOTE: The board is set to the FEN once the setup has been planned.
+
+        """
+        occupied = self.board.get_piece_positions()
+
+        # The arrangement reserves and frees capture positions, they are given back if the setup can't be planned
+        capture_state = self.board.get_capture_state()
+
+        # Assign the pieces to their squares and order the relocations so no goal is still occupied
+        relocations = order_relocations(self.board, arrange_pieces(self.board, fen), occupied, self.head_position)
+
+        if relocations is None:
+            self.board.set_capture_state(capture_state)
+            raise RuntimeError("The pieces could not be ordered for the setup")
+
+        print("Calling Astar!")
 
-        # Return the path
-        return [capture_path, path]
+        # One graph is prepared for the current pieces and updated as the pieces move
+        self.map = Graph([Circle(self.board.get_clearance_radius(), position) for position in occupied.values()])
+
+        with METRICS.time("planning/setup"):
+            plan = self.action_planner.evaluate(relocations, range(len(relocations)), occupied, self.head_position, self.park_position)
+
+        print("Astar Called!")
+
+        if plan is None:
+            self.board.set_capture_state(capture_state)
+            raise RuntimeError("No path found for the relocations of the setup")
+
+        self.board.set_fen(fen)
+
+        return plan
+
+    def plan_path(self, obstacles, start_position, goal_position):
+        """
+        Plan the path of a piece around a list of obstacle circles.
+        NOTE: The prepared graph is updated to the obstacles instead of being rebuilt, the start and goal are never added to it.
+
+        """
+        with METRICS.time("planning/path"):
+            self.map.update_circles(obstacles)
+
+            if not self.map.is_prepared():
+                self.map.prepare()
+
+            result = search(self.map, start_position, goal_position, self.plan_options)
+
+        if not result.is_found():
+            raise RuntimeError("No path found from {} to {}".format(start_position, goal_position))
+
+        with METRICS.time("planning/smoothing"):
+            return self.smooth_path(result.get_path(), obstacles)
+
+    def measure_path(self, path):
+        """
+        Estimate the (time, length) of a path generated by astar or an optimized trajectory.
+
+        """
+        if isinstance(path, Trajectory):
+            positions = path.get_positions()
+            return path.get_time(), float(np.sum(np.linalg.norm(np.diff(positions, axis=0), axis=1)))
+
+        profile = self.profile_path(path)
+
+        return profile.get_time(), profile.get_length()
+
+    def smooth_path(self, path, obstacles):
+        """
+        Smooth a path generated by astar into a minimum time trajectory.
+        Returns the path unchanged if no optimizer is set or the optimization falls back to the raw path.
+
+        """
+        if self.trajectory_optimizer is None:
+            return path
+
+        trajectory = self.trajectory_optimizer.optimize(path, obstacles)
+
+        print("Trajectory Optimization: {} ({:.3f}s)".format(trajectory.get_status(), trajectory.get_solve_time()))
+
+        if not trajectory.is_optimized():
+            return path
+
+        return trajectory
+
+    def profile_path(self, path):
+        """
+        Generate the motion profile of a path generated by astar.
+
+        """
+        return self.motion_profile.profile(iter_segments(path, self.gcode_builder.tolerance))
+
+    def estimate_path_time(self, path):
+        """
+        Estimate the time in seconds it takes to trace a path generated by astar.
+
+        """
+        return self.profile_path(path).get_time()
 
     def trace_path(self, path):
         """
-        Trace a pth generated by astar and return the gcode.
+        Trace a path generated by astar or an optimized trajectory and return the gcode.
+        NOTE: The head is assumed to be at the end of the path afterwards.
         
         """
-        # Get the start node
-        start_node = path[0]
-
-        gcode = "G90\n"
-
-        # Add the move to the start
-        gcode += self.generate_linear_gcode(start_node)
-
-        # Turn on the electromagnet
-        gcode += "\n"
-        gcode += "M106 S255\n"
-
-        arc_start = None
-        # Loop through the path
-        for i in range(1, len(path)):
-            # Get the current and previous nodes
-            current_node = path[i]
-            previous_node = path[i - 1]
-
-            # Check if the current node lies on the same circle as the previous node
-            if current_node.get_circle() is previous_node.get_circle():
-                # If the current node is at the same position as the previous node, skip it
-                if all(current_node.get_position() == previous_node.get_position()):
-                    continue
-
-                if arc_start is None:
-                    arc_start = previous_node
-            else:
-                print(arc_start)
-                if arc_start is not None:
-                    gcode += "\n"
-                    gcode += self.generate_arc_gcode(arc_start.get_circle(), arc_start, previous_node)
-                    arc_start = None
-
-                    gcode += "\n"
-                    gcode += self.generate_linear_gcode(current_node)
-                else:
-                    # If it is not, generate the linear gcode
-                    gcode += "\n"
-                    gcode += self.generate_linear_gcode(current_node)
-
-        # Turn off the electromagnet
-        gcode += "\n"
-        gcode += "M106 S0\n"
+        travel_feedrate = self.motion_profile.max_speed * 60
+
+        if isinstance(path, Trajectory):
+            print("Estimated Path Time: {:.2f}s".format(path.get_time()))
+
+            gcode = self.gcode_builder.build_trajectory(path, self.motion_profile.get_accel(magnet_on=True), travel_feedrate)
+
+            self.head_position = path.get_positions()[-1]
+        else:
+            profile = self.profile_path(path)
+
+            print("Estimated Path Time: {:.2f}s ({:.1f}mm)".format(profile.get_time(), profile.get_length()))
+
+            gcode = self.gcode_builder.build(path, profile, travel_feedrate)
+
+            self.head_position = path[-1].get_position()
 
         return gcode
 
-    @staticmethod
-    def generate_arc_gcode(circle, start_node, end_node):
+    def trace_plan(self, plan):
         """
-        Generates the gcode for an arc move from the current position (start node) to the end node.
+        Trace planned actions and return a list of gcode scripts, one per action.
+        The travel of the turn is reported and stored in the turn reports.
 
         """
-        # Start and end positions
-        start_position = start_node.get_position()
-        end_position = end_node.get_position()
+        scripts = []
 
-        # Get the parameters of the circle
-        arc_center = circle.get_center()
+        for action in plan:
+            scripts.append(self.trace_path(action.get_path()))
 
-        # Get the end position
-        arc_start = v2v_angle(arc_center, start_position)
-        arc_end = v2v_angle(arc_center, end_position)
+        # Return the head to the park position with the electromagnet off
+        return_move = plan.get_return_move()
+        if return_move is not None:
+            scripts.append("G90\n" + self.gcode_builder.linear_gcode(return_move.get_end(), self.motion_profile.max_speed * 60) + "\n")
 
-        # Change the arc start and end to be between 0 and 2pi
-        arc_start = zero_to_2pi(arc_start)
-        arc_end = zero_to_2pi(arc_end)
+            self.head_position = return_move.get_end()
 
-        if abs(arc_start - arc_end) > np.pi:
-            arc_start, arc_end = arc_end, arc_start
+        report = plan.get_report()
+        self.turn_reports.append(report)
 
-        # Determine if the arc is clockwise or anticlockwise
-        if arc_end > arc_start:
-            arc_direction = "G3" # CCW
-        else:
-            arc_direction = "G2" # C#
+        print("Turn Travel: {:.1f}mm ({:.1f}mm idle), Estimated Time: {:.2f}s".format(report["distance"], report["idle_distance"], report["time"]))
 
-        # Calculate I and J
-        print(start_position)
-        arc_I = arc_center[0] - start_position[0]
-        arc_J = arc_center[1] - start_position[1]
-        
+        return scripts
 
-        return "{} X{} Y{} I{} J{} F99999999".format(arc_direction, end_position[0], end_position[1], arc_I, arc_J)
-    
-    @staticmethod
-    def generate_linear_gcode(node):
+    def get_turn_reports(self):
         """
-        Generates the gcode for a linear move to the node.
+        Get the travel reports of the most recent turns.
 
         """
-        # Get the end positions
-        end_position = node.get_position()
-
-        return "G1 X{} Y{} F99999999".format(end_position[0], end_position[1])
+        return list(self.turn_reports)
 
 
 if __name__ == "__main__":
@@ -236,18 +348,20 @@ if __name__ == "__main__":
     # board.reset("rnbqkbnr/pppp1ppp/8/8/PP2p3/5N2/2PPPPPP/RNBQKB1R b KQkq - 0 3")
     board.reset("rnbqkbnr/ppp1pppp/8/3p4/P7/5N2/1PPPPPPP/RNBQKB1R b KQkq - 0 2")
 
+    from matplotlib import pyplot as plt
+
     fig, ax = plt.subplots()
 
-    capture_path, path = move_manager.respond(ax)
+    plan = move_manager.respond(ax)
 
-    # print(move_manager.trace_path(capture_path))
-    print(move_manager.trace_path(path))
+    for gcode in move_manager.trace_plan(plan):
+        print(gcode)
 
     plt.show()
     
 
-    # klipper.send_gcode(move_manager.trace_path(capture_path))
-    # klipper.send_gcode(move_manager.trace_path(path))
+    # for gcode in move_manager.trace_plan(plan):
+    #     klipper.send_gcode(gcode)
 
     # fig, axs = plt.subplots(2, 5)
 
@@ -1,16 +1,46 @@
 from enum import Enum
-from threading import Event
-import threading
+import queue
+import chess
+from threading import Event, Thread
 import time
-import gpiozero
+from matrix_scanner import GpioScanBackend, SimulatedScanBackend, bitboard_to_board, board_to_bitboard
+from move_inference import InferenceStatus, MoveInference
+from scan_history import ScanHistory, ScanLog, load_scans
 from planning.board import PhysicalBoard
 import numpy as np
 
-OUTPUT_PINS = [22, 10, 9, 11, 7, 8, 25, 24]
-INPUT_PINS = reversed([5, 6, 13, 19, 26, 21, 20, 16])
-
 MOVE_TIME_THRESHOLD = 2 # Seconds
 
+SCAN_RATE = 100 # Scans per second while the board is changing
+IDLE_SCAN_RATE = 10 # Scans per second while the board is idle
+DEBOUNCE_SCANS = 3 # Number of consecutive scans a square has to hold a new state for the change to be accepted
+
+
+class SquareChange:
+    """
+    A debounced change of a square of the reed switch matrix.
+    Stores the (column, row) index of the square, its new state and the time of the scan that confirmed it.
+
+    """
+
+    def __init__(self, square, state, timestamp):
+        self.square = square
+        self.state = state
+        self.timestamp = timestamp
+
+    def get_square(self):
+        return self.square
+
+    def get_state(self):
+        return self.state
+
+    def get_timestamp(self):
+        return self.timestamp
+
+    def __repr__(self):
+        return "SquareChange({}, {}, {:.3f})".format(self.square, self.state, self.timestamp)
+
+
 class MoveObserver:
     """
     Observes the current state of the board and detects moves.
@@ -33,15 +63,239 @@ class MoveObserver:
     Board(PhysicalBoard): The internal stored chessboard representation
     """
 
-    def __init__(self, board, throw_observation_status):
+    def __init__(self, board, throw_observation_status, backend=None, scan_rate=SCAN_RATE, idle_scan_rate=IDLE_SCAN_RATE, debounce_scans=DEBOUNCE_SCANS, settle_time=MOVE_TIME_THRESHOLD, history=None, log_path=None):
         self.board = board
         self.throw_observation_status = throw_observation_status
 
-        self.binary_board = np.zeros((8, 8), dtype=np.int8)
+        # The matrix is scanned on the GPIO pins unless another backend (e.g. a simulated board) is given
+        self.backend = backend if backend is not None else GpioScanBackend()
+
+        # The raw state of the last scan
+        self.binary_board = np.zeros((8, 8), dtype=np.uint8)
+
+        # Scanner settings
+        self.scan_rate = scan_rate
+        self.idle_scan_rate = idle_scan_rate
+        self.debounce_scans = debounce_scans
+        self.settle_time = settle_time
+
+        # The debounced state of the board and the number of consecutive scans each square has disagreed with it
+        self.debounced_board = np.zeros((8, 8), dtype=np.uint8)
+        self.debounce_counts = np.zeros((8, 8), dtype=np.int32)
+
+        # The recent raw scans and the log they are flushed to after every detected move (if any)
+        self.history = history if history is not None else ScanHistory()
+        self.log = ScanLog(log_path) if log_path is not None else None
+
+        # The debounced square changes published by the scanner
+        self.changes = queue.Queue()
+
+        # Functions called with the debounced occupancy bitboard whenever it changes (e.g. the browser feed)
+        self.listeners = []
+        self.last_change_time = None
+
+        # The scanner thread
+        self.scanner = None
+        self.stop_scanning = Event()
+
+        # Matches the observed occupancy against the legal moves of the stored board
+        self.inference = MoveInference()
+
+        # Set when the debounced board has to be taken from the next scan without publishing the changes (e.g. after the robot moved)
+        self.resync = True
+
+        # Cleared while the robot is moving pieces so its moves are not detected as human moves
+        self.robot_idle = Event()
+        self.robot_idle.set()
+
+
+    def set_robot_moving(self, moving):
+        """
+        Tells the observer if the robot is moving pieces.
+        The board is not observed while the robot is moving.
+
+        """
+        if moving:
+            self.robot_idle.clear()
+        else:
+            self.robot_idle.set()
+
+    def start(self):
+        """
+        Starts the scanner thread.
+
+        """
+        if self.scanner is not None and self.scanner.is_alive():
+            return
+
+        self.stop_scanning.clear()
+        self.resync = True
+
+        self.scanner = Thread(target=self.run_scanner, daemon=True)
+        self.scanner.start()
+
+    def stop(self):
+        """
+        Stops the scanner thread.
+
+        """
+        self.stop_scanning.set()
+
+        # Wake the scanner if it is waiting for the robot
+        self.robot_idle.set()
+
+        if self.scanner is not None:
+            self.scanner.join()
+            self.scanner = None
+
+    def run_scanner(self):
+        """
+        Scans the board until stopped.
+        The board is scanned at the scan rate while it is changing and at the idle scan rate once it has settled.
+        NOTE: While the robot is moving the scanner sleeps until the motion is complete.
+
+        """
+        while not self.stop_scanning.is_set():
+            # Sleep while the robot is moving, the pieces it moves are not changes
+            if not self.robot_idle.is_set():
+                self.robot_idle.wait()
+                self.resync = True
+                continue
+
+            start_time = time.monotonic()
+
+            self.scan(start_time)
+
+            # Scan quickly while a square is bouncing or the board has not settled yet
+            active = self.debounce_counts.any() or (self.last_change_time is not None and start_time - self.last_change_time < self.settle_time)
+            period = 1.0 / (self.scan_rate if active else self.idle_scan_rate)
+
+            self.stop_scanning.wait(max(0.0, period - (time.monotonic() - start_time)))
+
+    def scan(self, timestamp):
+        """
+        Samples the board, records the scan and publishes the debounced square changes.
+
+        """
+        self.sample_board()
+
+        self.history.record(timestamp, board_to_bitboard(self.binary_board))
+
+        self.filter_scan(self.binary_board, timestamp)
+
+    def filter_scan(self, binary_board, timestamp):
+        """
+        Passes a scan through the debounce unless the board has to be resynced.
+
+        """
+        if self.resync:
+            # Take the board as it is without publishing changes and drop the changes that were not consumed
+            self.debounced_board = binary_board.copy()
+            self.debounce_counts[:] = 0
+
+            self.clear_changes()
+
+            self.resync = False
+
+            self.notify_listeners()
+            return
+
+        self.debounce(binary_board, timestamp)
+
+    def debounce(self, binary_board, timestamp):
+        """
+        Filters a scan through the per square debounce counters.
+        A square only changes once it has held its new state for the debounce scans.
+
+        """
+        differs = binary_board != self.debounced_board
+
+        # Count the consecutive scans each square disagrees with its debounced state
+        self.debounce_counts = np.where(differs, self.debounce_counts + 1, 0)
 
-        self.output_pins = [gpiozero.DigitalOutputDevice(pin) for pin in OUTPUT_PINS]
-        self.input_pins = [gpiozero.DigitalInputDevice(pin, pull_up=False) for pin in INPUT_PINS]
+        changed = self.debounce_counts >= self.debounce_scans
+        if not changed.any():
+            return
 
+        self.debounced_board[changed] = binary_board[changed]
+        self.debounce_counts[changed] = 0
+
+        for i, j in np.argwhere(changed):
+            self.changes.put(SquareChange((int(i), int(j)), int(binary_board[i, j]), timestamp))
+
+        self.last_change_time = timestamp
+
+        self.notify_listeners()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def notify_listeners(self):
+        """
+        Passes the debounced occupancy bitboard to the listeners.
+        NOTE: This is called from the scanner thread.
+
+        """
+        if len(self.listeners) == 0:
+            return
+
+        occupancy = board_to_bitboard(self.debounced_board)
+
+        for callback in list(self.listeners):
+            try:
+                callback(occupancy)
+            except Exception as error:
+                # A failing listener must not stop the scanner
+                print("Error In Board Listener: " + str(error))
+
+    def clear_changes(self):
+        """
+        Drops the published changes that have not been consumed.
+
+        """
+        try:
+            while True:
+                self.changes.get_nowait()
+        except queue.Empty:
+            pass
+
+    def get_change(self, timeout=None):
+        """
+        Get the next debounced square change, blocks until one is published.
+        Returns None if no change is published within the timeout.
+
+        """
+        try:
+            return self.changes.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wait_for_settle(self):
+        """
+        Collects the square changes until no change has been published for the settle time.
+        NOTE: This blocks until the first change is published.
+
+        """
+        changes = [self.get_change()]
+
+        while True:
+            change = self.get_change(self.settle_time)
+
+            if change is None:
+                return changes
+
+            changes.append(change)
+
+    def get_debounced_board(self):
+        """
+        Get a copy of the debounced state of the board.
+
+        """
+        return self.debounced_board.copy()
 
     def reset(self):
         """"
@@ -49,26 +303,15 @@ class MoveObserver:
 
         """
         # Set all the outputs to low
-        for pin in self.output_pins:
-            pin.off()
+        self.backend.reset()
 
     def sample_board(self):
         """
         Samples the current state of the board and updates the binary board.
 
         """
-        for i in range(len(self.output_pins)):
-            # Set the output pin of the column to high
-            self.output_pins[i].on()
-
-            for j in range(len(self.input_pins)):
-                # Read the input pin of the row
-                if self.input_pins[j].value:
-                    self.binary_board[i, j] = 1 # Piece is present at column i, row j -> (j, i) in BCS
-                else:
-                    self.binary_board[i, j] = 0
-
-            self.output_pins[i].off()
+        # Piece is present at column i, row j -> (i, j) in BCS
+        self.binary_board = self.backend.scan()
 
     def check_board_state(self, other_binary_board):
         """
@@ -89,76 +332,126 @@ class MoveObserver:
         if self.check_board_state(self.board.get_binary_board()):
             self.throw_observation_status(self.ObservationStatus.BOARD_MATCH_ERROR)
 
-    def extract_move(self, previous_binary_board):
+    def extract_move(self, changes):
         """
-        Extracts the move made on the board.
+        Extracts the move made on the board from the square changes.
+        The occupancy after each change is matched against the legal moves of the stored board.
+        Returns the move in UCI notation or None if no single legal move matches.
 
         """
-        # Find the difference between the previous board state and the current board state
-        difference = self.binary_board - previous_binary_board
+        self.inference.set_position(chess.Board(self.board.get_fen()))
+
+        # Replay the changes on the occupancy of the stored board
+        bitboard = self.inference.board.occupied
+        for change in changes:
+            square = chess.BB_SQUARES[chess.square(*change.get_square())]
 
-        # When we subtract the two boards the start of the move will be when the board goes from 1 -> 0 (0 - 1 = -1) and the end of the move will be when the board goes from 0 -> 1 (1 - 0 = 1)
-        move_start = np.argwhere(difference == -1)
-        move_end = np.argwhere(difference == 1)
+            bitboard = bitboard | square if change.get_state() else bitboard & ~square
+            self.inference.observe(bitboard)
 
-        # Convert the move coordinates to CCS
-        move_start_ccs = self.board.bcs_2_ccs(move_start.tolist()[0])
-        move_end_ccs = self.board.bcs_2_ccs(move_end.tolist()[0])
+        status, moves = self.inference.infer()
 
-        # Return the move
-        return move_start_ccs + move_end_ccs
+        if status == InferenceStatus.AMBIGUOUS:
+            self.throw_observation_status(self.ObservationStatus.MOVE_AMBIGUOUS)
+            return None
+
+        if status == InferenceStatus.ERROR:
+            self.throw_observation_status(self.ObservationStatus.MOVE_ERROR)
+            return None
+
+        return moves[0].uci()
 
     def detect_move(self):
         """
         Detects a move on the board.
+        The move has ended once the board has settled (no change for the settle time).
+
+        Returns the move in UCI notation or None if it could not be inferred.
 
-        NOTE: THIS IS A BLOCKING CALL!
+        NOTE: THIS IS A BLOCKING CALL! It waits on the change queue of the scanner, so no CPU is used while waiting.
 
         """
-        stored_binary_board = self.board.get_binary_board()
+        self.start()
 
-        # Wait until a move is detected
-        while True:
-            self.sample_board()
-            time.sleep(0.01)
-
-            # Check if the real board state is the same as the internally stored board
-            if not self.check_board_state(stored_binary_board):
-                # If the board state is different, a move has started, so break out of the loop
-                previous_binary_board = self.binary_board
-                break
-        
-        print("out")
-
-        # Setup the timer threading
-        time_out_condition = Event()
-        time_out_timer = threading.Timer(MOVE_TIME_THRESHOLD, time_out_condition.set)  
-
-        # Start the timer
-        time_out_timer.start()
-
-        # To detect the end of a move we constantly compare the current board state to the previous board state and once they
-        # are the same for a specified settling time, we can assume that the move has ended
-        while not time_out_condition.is_set():
-            self.sample_board()
-            time.sleep(0.01)
-
-            # Check if the real board state is the same as the previous board state
-            if not self.check_board_state(previous_binary_board):
-                # If the board state isn't the same as the previous board state, a move is still being made, so reset the timer
-                time_out_timer.cancel()
-                time_out_timer.start()
-
-                # Update the previous board state
-                previous_binary_board = self.binary_board
-
-        # Once we exit the loop, we are sure a move has ended
-        # Extract the move by looking at the difference between the stored board state and the current board state
-        return self.extract_move(stored_binary_board)
+        # Wait for the board to settle after the first change
+        changes = self.wait_for_settle()
+
+        # Extract the move by matching the changes against the legal moves of the stored board
+        move = self.extract_move(changes)
+
+        if self.log is not None:
+            self.flush_history()
+
+        return move
+
+    def flush_history(self):
+        """
+        Appends the scans recorded since the last flush to the log.
+
+        """
+        dropped = self.history.flush(self.log)
+
+        if dropped > 0:
+            print("Scan History Overflowed! {} Scans Were Not Logged".format(dropped))
+
+    def replay(self, scans):
+        """
+        Feeds recorded scans through the debounce, settle detection and move inference without waiting in real time.
+        The settle time is measured with the timestamps of the scans and the detected moves are made on the stored board.
+        Returns the detected moves as (timestamp, move), the move is None if it could not be inferred.
+
+        NOTE: The scanner must not be running. The stored board has to be in the position the recording started from.
+
+        """
+        self.resync = True
+        self.last_change_time = None
+
+        moves = []
+        changes = []
+
+        for timestamp, occupancy in zip(scans["timestamp"], scans["occupancy"]):
+            timestamp = float(timestamp)
+
+            # The board has settled before this scan
+            if len(changes) > 0 and timestamp - changes[-1].get_timestamp() >= self.settle_time:
+                moves.append(self.replay_move(changes[-1].get_timestamp() + self.settle_time, changes))
+                changes = []
+
+            self.filter_scan(bitboard_to_board(int(occupancy)), timestamp)
+
+            while True:
+                change = self.get_change(0)
+                if change is None:
+                    break
+
+                changes.append(change)
+
+        # The recording ended during a move
+        if len(changes) > 0:
+            moves.append(self.replay_move(changes[-1].get_timestamp() + self.settle_time, changes))
+
+        return moves
+
+    def replay_move(self, timestamp, changes):
+        move = self.extract_move(changes)
+
+        if move is not None:
+            self.board.make_move(move)
+
+        return timestamp, move
+
+    def replay_log(self, path):
+        """
+        Replays the scans of a log (see replay).
+
+        """
+        return self.replay(load_scans(path))
 
     class ObservationStatus(Enum):
         BOARD_MATCH_ERROR = 1
         MOVE_MADE = 2
+        MOVE_AMBIGUOUS = 3
+        MOVE_ERROR = 4
 
 if __name__ == "__main__":
     capture_positions = [
@@ -169,11 +462,20 @@ if __name__ == "__main__":
         ]
 
     board = PhysicalBoard(395, 395, 22, 1, capture_positions=capture_positions)
-    board.reset("8/4p3/8/8/8/8/8/8")
+    board.reset()
 
     print(board.get_binary_board())
 
-    move_observer = MoveObserver(board, lambda x: print(x))
+    try:
+        backend = GpioScanBackend()
+    except Exception as error:
+        # Play a scripted move on a simulated board instead
+        print("GPIO Not Available, Simulating The Board: " + str(error))
+
+        backend = SimulatedScanBackend(board.get_fen())
+        backend.move(1.0, "e2", "e4", bounces=2)
+
+    move_observer = MoveObserver(board, lambda x: print(x), backend=backend)
 
     move_observer.sample_board()
 
@@ -0,0 +1,71 @@
+import struct
+from threading import Lock
+
+# A frame is the sequence number (uint32) followed by the occupancy bitboard (uint64), little-endian
+FRAME_FORMAT = "<IQ"
+
+
+def encode_frame(sequence, occupancy):
+    return struct.pack(FRAME_FORMAT, sequence & 0xFFFFFFFF, occupancy)
+
+
+def decode_frame(frame):
+    """
+    Returns the sequence number and occupancy bitboard of a frame.
+    """
+    return struct.unpack(FRAME_FORMAT, frame)
+
+
+class OccupancyFeed():
+    """
+    Publishes the occupancy of the reed switch matrix to the browsers over the Socket.IO server.
+
+    1. A 12 byte binary frame (sequence number, 64 bit occupancy bitboard) is only emitted when the occupancy changes
+    2. A client that connects gets the current frame, afterwards it patches the squares that differ from the previous frame
+    3. The sequence number lets the client notice frames that arrive out of order
+
+    NOTE: Publish is called from the scanner thread of the MoveObserver.
+    """
+
+    def __init__(self, socketio, event="occupancy", room=None):
+        self.socketio = socketio
+        self.event = event
+
+        # The frames are only sent to the clients in the room (e.g. the clients of one table), or to all clients if None
+        self.room = room
+
+        self.sequence = 0
+        self.occupancy = None
+
+        self.lock = Lock()
+
+    def get_frame(self):
+        with self.lock:
+            if self.occupancy is None:
+                return None
+
+            return encode_frame(self.sequence, self.occupancy)
+
+    def publish(self, occupancy):
+        """
+        Emits the occupancy to all clients if it has changed.
+        """
+        with self.lock:
+            if occupancy == self.occupancy:
+                return
+
+            self.sequence += 1
+            self.occupancy = occupancy
+
+            frame = encode_frame(self.sequence, occupancy)
+
+        self.socketio.emit(self.event, frame, to=self.room)
+
+    def send_current(self, sid):
+        """
+        Sends the current occupancy to a single client (e.g. when it connects).
+        """
+        frame = self.get_frame()
+
+        if frame is not None:
+            self.socketio.emit(self.event, frame, to=sid)
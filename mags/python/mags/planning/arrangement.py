@@ -0,0 +1,235 @@
+import chess
+import numpy as np
+
+from .sequencing import ActionPlanner, Relocation
+from .utils import dist
+
+
+def solve_assignment(cost):
+    """
+    Solves the linear assignment problem for a square cost matrix with the Hungarian algorithm.
+    Returns the column assigned to each row so the total cost is minimized.
+
+    NOTE: This is the O(n^3) shortest augmenting path formulation with row and column potentials.
+
+    """
+    cost = np.asarray(cost, dtype=float)
+    n = cost.shape[0]
+
+    # Potentials of the rows and columns (1 indexed), column 0 is a virtual column used to start each augmentation
+    u = np.zeros(n + 1)
+    v = np.zeros(n + 1)
+
+    # The row matched to each column (0 is unmatched) and the previous column on the augmenting path
+    matched = np.zeros(n + 1, dtype=int)
+    way = np.zeros(n + 1, dtype=int)
+
+    for row in range(1, n + 1):
+        matched[0] = row
+        column = 0
+
+        min_reduced = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+
+        # Grow the alternating tree until a free column is reached
+        while True:
+            used[column] = True
+            current_row = matched[column]
+
+            # Update the smallest reduced costs of the unused columns from the current row
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            free = ~used[1:]
+            improved = free & (reduced < min_reduced[1:])
+            min_reduced[1:][improved] = reduced[improved]
+            way[1:][improved] = column
+
+            # Move to the unused column with the smallest reduced cost
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            # Update the potentials so the reduced costs stay non-negative
+            u[matched[used]] += delta
+            v[used] -= delta
+            min_reduced[1:][free] -= delta
+
+            column = next_column
+            if matched[column] == 0:
+                break
+
+        # Flip the matching along the augmenting path
+        while column != 0:
+            previous = way[column]
+            matched[column] = matched[previous]
+            column = previous
+
+    assignment = np.zeros(n, dtype=int)
+    for column in range(1, n + 1):
+        assignment[matched[column] - 1] = column - 1
+
+    return assignment
+
+
+def get_layout(board):
+    """
+    Returns the physical layout of the pieces as a list of (key, piece, position).
+    The key is the CCS square of the piece or None for the pieces in the capture area.
+
+    """
+    layout = []
+
+    for square, piece in board.board.piece_map().items():
+        square = chess.square_name(square)
+        layout.append((square, piece, board.get_square_position(square)))
+
+    for piece, position in board.get_captured_pieces():
+        layout.append((None, piece, np.asarray(position, dtype=float)))
+
+    return layout
+
+
+def arrange_pieces(board, fen=chess.STARTING_FEN):
+    """
+    Plans the relocations that rearrange the physical pieces into the position of a FEN (e.g. to reset the board after a game).
+    NOTE: This must be called before the position is set on the board. Capture positions are reserved for the pieces leaving the board.
+
+    The pieces of each type are assigned to the target squares of that type so the total travel is minimized:
+    1. Pieces already on a target square of their type stay where they are
+    2. Surplus pieces on the board are moved to the capture area, surplus pieces in the capture area stay there
+    3. Target squares without a piece left anywhere have to be filled by hand
+
+    Returns a list of relocations in no particular order, see order_relocations.
+
+    """
+    target_map = chess.Board(fen).piece_map()
+
+    # Group the pieces and target squares by piece type
+    sources = {}
+    for key, piece, position in get_layout(board):
+        sources.setdefault(piece, []).append((key, position))
+
+    targets = {}
+    for square, piece in target_map.items():
+        targets.setdefault(piece, []).append(chess.square_name(square))
+
+    capture_positions = np.asarray(board.capture_positions, dtype=float)
+
+    moved = [] # (piece, key, position, goal key)
+    for piece in sorted(set(sources) | set(targets), key=lambda p: (p.color, p.piece_type)):
+        piece_sources = sources.get(piece, [])
+        piece_targets = targets.get(piece, [])
+
+        # Pad the cost matrix to a square matrix
+        # Extra columns send surplus pieces to the capture area and extra rows are missing pieces
+        n = max(len(piece_sources), len(piece_targets))
+        cost = np.zeros((n, n))
+
+        for i, (key, position) in enumerate(piece_sources):
+            for j in range(n):
+                if j < len(piece_targets):
+                    cost[i, j] = dist(position, board.get_square_position(piece_targets[j]))
+                elif key is not None:
+                    cost[i, j] = np.min(np.linalg.norm(capture_positions - position, axis=1))
+
+        assignment = solve_assignment(cost)
+
+        for i, j in enumerate(assignment):
+            if i >= len(piece_sources):
+                print("No {} {} left for {}, it has to be placed by hand!".format(chess.COLOR_NAMES[piece.color], chess.piece_name(piece.piece_type), piece_targets[j]))
+                continue
+
+            key, position = piece_sources[i]
+            goal_key = piece_targets[j] if j < len(piece_targets) else None
+
+            # The piece is already in place
+            if key == goal_key:
+                continue
+
+            moved.append((piece, key, position, goal_key))
+
+    relocations = []
+
+    # Reserve the capture positions for the pieces leaving the board before the pieces coming back free theirs
+    # NOTE: This keeps a piece from being dropped on a capture position before its previous piece has been picked up
+    for piece, key, position, goal_key in moved:
+        if goal_key is None:
+            capture_position = board.capture_piece(piece)
+            relocations.append(Relocation(key, position, None, capture_position, "capture"))
+
+    for piece, key, position, goal_key in moved:
+        if goal_key is None:
+            continue
+
+        if key is None:
+            board.release_captured_piece(piece, position)
+
+        relocations.append(Relocation(key, position, goal_key, board.get_square_position(goal_key), piece.symbol()))
+
+    return relocations
+
+
+def order_relocations(board, relocations, occupied, head_position):
+    """
+    Orders relocations so each goal square is vacated before it is used.
+    The relocation with the closest start to the head is executed next to keep the idle travel short.
+
+    If every remaining relocation is waiting on another one (e.g. two pieces swapping squares), the closest piece is parked on a buffer square first.
+    Returns the ordered list of relocations including the buffer moves or None if no buffer square is free.
+
+    """
+    remaining = list(relocations)
+    current_position = np.asarray(head_position, dtype=float)
+
+    ordered = []
+    while len(remaining) > 0:
+        feasible = [relocation for relocation in remaining if ActionPlanner.is_feasible(occupied, relocation)]
+
+        if len(feasible) > 0:
+            relocation = min(feasible, key=lambda r: dist(current_position, r.get_start_position()))
+            remaining.remove(relocation)
+        else:
+            relocation = get_buffer_relocation(board, remaining, occupied, current_position)
+
+            if relocation is None:
+                return None
+
+        ordered.append(relocation)
+
+        occupied = ActionPlanner.apply(occupied, relocation)
+        current_position = relocation.get_goal_position()
+
+    return ordered
+
+
+def get_buffer_relocation(board, remaining, occupied, head_position):
+    """
+    Breaks a cycle of blocked relocations by parking one piece on a free square.
+    The remaining relocations are updated to continue from the buffer square.
+    Returns the buffer relocation or None if no piece can be parked.
+
+    """
+    goal_keys = set(relocation.get_goal_key() for relocation in remaining)
+
+    # Only moving a piece that blocks another goal unblocks the cycle
+    candidates = [relocation for relocation in remaining if relocation.get_start_key() in goal_keys]
+    if len(candidates) == 0:
+        return None
+
+    blocked = min(candidates, key=lambda r: dist(head_position, r.get_start_position()))
+
+    # The buffer must not be needed by any of the remaining relocations
+    buffers = [square for square in board.square_indicies if square not in occupied and square not in goal_keys]
+    if len(buffers) == 0:
+        return None
+
+    def get_detour(square):
+        position = board.get_square_position(square)
+        return dist(blocked.get_start_position(), position) + dist(position, blocked.get_goal_position())
+
+    buffer_square = min(buffers, key=get_detour)
+    buffer_position = board.get_square_position(buffer_square)
+
+    remaining.remove(blocked)
+    remaining.append(Relocation(buffer_square, buffer_position, blocked.get_goal_key(), blocked.get_goal_position(), blocked.get_label()))
+
+    return Relocation(blocked.get_start_key(), blocked.get_start_position(), buffer_square, buffer_position, "buffer")
@@ -1,10 +1,9 @@
-from matplotlib import pyplot as plt
-from matplotlib.patches import Arc
 import numpy as np
 from .graph import Circle, Graph, Node
+from .planner import get_edge_cost
 from queue import PriorityQueue
 
-from .utils import dist, v2v_angle
+from .utils import dist
 
 
 class Astar:
@@ -22,6 +21,9 @@ class Astar:
 
         self.path = None
 
+        # Number of nodes expanded by the last search
+        self.expansions = 0
+
         if start is not None and goal is not None:
             self.set_start(start)
             self.set_goal(goal)
@@ -61,46 +63,8 @@ class Astar:
         Get the cost of an edge.
 
         """
-        first = edge.get_first()
-        second = edge.get_second()
-        
         # Add 1 to the cost of all edges to favor a path with less nodes
-        if edge.is_surfing():
-            # If the edge is surfing, the cost is the length
-            return 1 + dist(first.get_position(), second.get_position())
-        else:
-            # If the edge is hugging, calculate the arc length
-            arc_center = first.get_circle().get_center()
-
-            # Calculate the angle between the vectors:
-            #  a: The vector from the arc center to the first node
-            #  b: The vector from the arc center to the second node
-            # The dot product of these two vectors is:
-            #  a dot b = |a| * |b| * cos(theta)
-            # The angle between the vectors is:
-            #  theta = arccos(a dot b / (|a| * |b|))
-            # The range of arccos is [0, pi] so it is guaranteed to give us the smallest, positive angle
-
-            # Generate the vectors
-            a = first.get_position() - arc_center
-            b = second.get_position() - arc_center
-
-            # Calculate the angle
-            cos_angle = np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-            
-            # Check for floating point errors
-            cos_angle = np.clip(cos_angle, -1.0, 1.0)
-            
-            # Calculate the angle
-            angle = np.arccos(cos_angle)
-
-            # Get the radius of the circle
-            radius = first.get_circle().get_r()
-
-            # Calculate the arc length
-            arc_length = radius * angle
-
-            return 1 + arc_length
+        return get_edge_cost(edge, 1)
 
     def get_heuristic(self, node):
         """
@@ -110,6 +74,9 @@ class Astar:
         # A simple heuristic is the distance to the goal
         return dist(node.get_position(), self.goal.get_position())
 
+    def get_expansions(self):
+        return self.expansions
+
     def clear(self):
         """
         Clear the frontier and explored sets.
@@ -120,6 +87,7 @@ class Astar:
         self.cost.clear()
 
         self.path = None
+        self.expansions = 0
 
     def calculate_path(self):
         """
@@ -150,6 +118,8 @@ class Astar:
             if current == self.goal:
                 break
 
+            self.expansions += 1
+
             # Get the neighbors of the current node
             neighbors = self.graph.get_neighbors(current)
 
@@ -194,46 +164,22 @@ class Astar:
 
         return path
 
-    def plot_path(self, ax, piece_diameter=None):
-        if self.path is None:
+    def plot_path(self, ax, piece_diameter=None, path=None):
+        """
+        Plots a path on the given axes.
+        If no path is given the last calculated path is plotted.
+
+        """
+        if path is None:
+            path = self.path
+
+        if path is None:
             print("No path found!")
             return
-        
-        # Plot the path
-        for i in range(len(self.path)):
-            node = self.path[i]
-            next_node = self.path[i + 1] if i < len(self.path) - 1 else None
-
-            if next_node is not None:
-                if node.get_circle() == next_node.get_circle():
-                    # Hugging Edge
-                    circle = node.get_circle()
-                    arc_center = circle.get_center()
-                    arc_radius = circle.get_r()
-
-                    # Get the angle between the two nodes
-                    arc_start = v2v_angle(arc_center, node.get_position())
-                    arc_end = v2v_angle(arc_center, next_node.get_position())
-
-                    # Determine the start and end points for plotting and convert the angles to degrees
-                    theta1 = np.rad2deg(min(arc_start, arc_end))
-                    theta2 = np.rad2deg(max(arc_start, arc_end))
-
-                    ax.add_patch(Arc(arc_center, 2 * arc_radius, 2 * arc_radius, theta1=theta1, theta2=theta2, color="orange", linewidth=4))
-                else:
-                    # Surfing Edge
-                    ax.plot([node.get_position()[0], next_node.get_position()[0]], [node.get_position()[1], next_node.get_position()[1]], "orange", linewidth=4)
-            
-            # Plot the piece at the node
-            if piece_diameter is not None:
-                circle = plt.Circle(node.get_position(), piece_diameter / 2, fill=False, color="orange")
-                ax.add_patch(circle)
-            
-            # Plot the star and end points in different colors
-            if node == self.start:
-                ax.plot(node.get_position()[0], node.get_position()[1], color="lightcoral", marker="o")
-            elif node == self.goal:
-                ax.plot(node.get_position()[0], node.get_position()[1], color="mediumpurple", marker="o")
+
+        from .visualization import plot_path
+
+        plot_path(ax, path, piece_diameter)
 
 
 if __name__ == "__main__":
@@ -279,6 +225,8 @@ if __name__ == "__main__":
     print(astar.calculate_path())
 
     # Setup plotting
+    from matplotlib import pyplot as plt
+
     fig, ax = plt.subplots()
 
     # Plot graph
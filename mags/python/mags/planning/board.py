@@ -1,15 +1,50 @@
+from functools import lru_cache
 import string
 import chess
-import chess.svg
-import cairosvg
-from matplotlib import pyplot as plt
-from PIL import Image
-import io
 import numpy as np
 
 from .graph import Circle, Graph
 
 
+@lru_cache(maxsize=None)
+def get_square_layout(length, width):
+    """
+    Get the square positions, the CCS to BCS mapping and the inverse mapping of a board with the given dimensions.
+    NOTE: The layout is shared between boards, the square positions are read only.
+    """
+    # The square positions are stored in a numpy array with their BCS index and a dictionary is used to map their CCS index to their BCS index
+    # Generate a numpy array with the positions of all the squares
+    square_positions = np.zeros((8, 8, 2))
+    square_indicies = {}
+
+    # The inverse mapping from BCS index to CCS square
+    square_names = {}
+
+    square_width = width / 8.0
+    square_length = length / 8.0
+
+    # Generate the x positions
+    x_positions = np.arange(square_width / 2.0, width, square_width)
+
+    # Generate the y positions
+    y_positions = np.arange(square_length / 2.0, length, square_length)
+
+    # Put them in the square positions array
+    for i in range(8):
+        for j in range(8):
+            # Put the x and y positions in the square positions array
+            square_positions[i, j, 0] = x_positions[i]
+            square_positions[i, j, 1] = y_positions[j]
+
+            # Put the CCS to BCS mapping in the square indicies dictionary
+            square_indicies[string.ascii_lowercase[i] + str(j + 1)] = (i, j)
+            square_names[(i, j)] = string.ascii_lowercase[i] + str(j + 1)
+
+    square_positions.setflags(write=False)
+
+    return square_positions, square_indicies, square_names
+
+
 class PhysicalBoard():
     """
     A class to represent a chess board for move making.
@@ -38,6 +73,9 @@ class PhysicalBoard():
         self.capture_positions = capture_positions
         self.open_capture_positions = capture_positions.copy()
 
+        # The pieces in the capture area and their positions
+        self.captured_pieces = []
+
         # Calculate the piece clearance radius
         # The is the radius of the circle around the piece used for path finding
         piece_radius = piece_diameter / 2.0
@@ -45,29 +83,8 @@ class PhysicalBoard():
 
         # Square mapping
         # The mapping from the board coordinate system to the square positions
-        # The square positions are stored in a numpy array with their BCS index and a dictionary is used to map their CCS index to their BCS index
-        # Generate a numpy array with the positions of all the squares
-        self.square_positions = np.zeros((8, 8, 2))
-        self.square_indicies = {}
-
-        square_width = width / 8.0
-        square_length = length / 8.0
-
-        # Generate the x positions
-        x_positions = np.arange(square_width / 2.0, width, square_width)
-
-        # Generate the y positions
-        y_positions = np.arange(square_length / 2.0, length, square_length)
-
-        # Put them in the square positions array
-        for i in range(8):
-            for j in range(8):
-                # Put the x and y positions in the square positions array
-                self.square_positions[i, j, 0] = x_positions[i]
-                self.square_positions[i, j, 1] = y_positions[j]
-                
-                # Put the CCS to BCS mapping in the square indicies dictionary # TODO: Can be static.
-                self.square_indicies[string.ascii_lowercase[i] + str(j + 1)] = (i, j)
+        # NOTE: The mapping only depends on the board dimensions, so it is shared by all boards of the same size
+        self.square_positions, self.square_indicies, self.square_names = get_square_layout(length, width)
 
     def get_fen(self):
         """
@@ -86,17 +103,26 @@ class PhysicalBoard():
         Reset and clear the board.
         """
         self.open_capture_positions = self.capture_positions.copy()
+        self.captured_pieces = []
 
         if fen is not None:
             self.board.set_fen(fen)
         else:
             self.board.reset()
     
+    def set_fen(self, fen):
+        """
+        Set the position of the pieces on the board without changing the capture area.
+        NOTE: This is used after the pieces have been physically rearranged.
+        """
+        self.board.set_fen(fen)
+
     def clear(self):
         """
         Clear the board.
         """
         self.open_capture_positions = self.capture_positions.copy()
+        self.captured_pieces = []
 
         self.board.clear()
 
@@ -119,6 +145,53 @@ class PhysicalBoard():
         except IndexError:
             return self.capture_positions[0]
 
+    def capture_piece(self, piece):
+        """
+        Reserve an open capture position for a piece leaving the board.
+        Returns the capture position.
+        """
+        position = self.get_open_capture_position()
+
+        self.captured_pieces.append((piece, position))
+
+        return position
+
+    def release_captured_piece(self, piece, position=None):
+        """
+        Take a piece back out of the capture area (e.g. for a promotion).
+        If a position is given only a piece at that capture position is released.
+        Returns the capture position of the piece or None if the piece has not been captured.
+        """
+        for i, (captured_piece, captured_position) in enumerate(self.captured_pieces):
+            if captured_piece == piece and (position is None or np.array_equal(captured_position, position)):
+                self.captured_pieces.pop(i)
+
+                # The capture position is free again
+                self.open_capture_positions.insert(0, captured_position)
+
+                return captured_position
+
+        return None
+
+    def get_capture_state(self):
+        """
+        Get a copy of the capture area state, to restore it if a planned move is not made.
+        """
+        return list(self.captured_pieces), list(self.open_capture_positions)
+
+    def set_capture_state(self, state):
+        """
+        Restore the capture area state returned by get_capture_state.
+        """
+        self.captured_pieces = list(state[0])
+        self.open_capture_positions = list(state[1])
+
+    def get_captured_pieces(self):
+        """
+        Get the pieces in the capture area and their positions.
+        """
+        return self.captured_pieces
+
     def make_move(self, move):
         """
         Check's if a move is legal and then makes it.
@@ -133,6 +206,16 @@ class PhysicalBoard():
             self.board.push(move)
             return True
 
+    def undo_move(self):
+        """
+        Takes back the last move made on the board.
+        Returns the move or None if no move has been made.
+        """
+        if len(self.board.move_stack) == 0:
+            return None
+
+        return self.board.pop()
+
     def get_square_position(self, square):
         """
         Get the position of a UCI square on the board.
@@ -145,9 +228,27 @@ class PhysicalBoard():
 
         return square_position
 
-    def generate_map(self, excluded_squares=[]):
+    def get_clearance_radius(self):
         """
-        Generate a map of the board.
+        Get the radius of the clearance circle around a piece.
+        """
+        return self.clearance_radius
+
+    def get_piece_positions(self):
+        """
+        Get the positions of the pieces on the board keyed by their CCS square.
+        """
+        piece_positions = {}
+
+        for position in self.board.piece_map().keys():
+            square = chess.square_name(position)
+            piece_positions[square] = self.get_square_position(square)
+
+        return piece_positions
+
+    def get_obstacle_circles(self, excluded_squares=[]):
+        """
+        Get the clearance circles around the pieces on the board.
         Exclude the squares in the excluded_squares list.
         """
         # Get the board map from python chess
@@ -187,59 +288,33 @@ class PhysicalBoard():
             # Add the piece circle to the board map
             board_map.append(Circle(self.clearance_radius, np.array([x, y])))
 
+        return board_map
+
+    def generate_map(self, excluded_squares=[]):
+        """
+        Generate a map of the board.
+        Exclude the squares in the excluded_squares list.
+        """
         # Create a graph from the board map
-        return Graph(board_map)
+        return Graph(self.get_obstacle_circles(excluded_squares))
 
     def plot_background(self, ax):
         """
         Plots the background of the board.
 
         """
+        from .visualization import plot_background
 
-        # Render chess board svg
-        svg = chess.svg.board(
-            board = self.board,
-            coordinates = False
-        )
-
-        # Convert svg to png
-        png = cairosvg.svg2png(svg, dpi=100)
-
-        # Plot the png
-        img = Image.open(io.BytesIO(png))
-        ax.imshow(img, extent=[0, self.width, 0, self.length])
+        plot_background(ax, self)
 
     def plot_board(self, ax):
         """
         Plots the pieces on the board.
     
         """
+        from .visualization import plot_board
 
-        # Get the board map from python chess
-        piece_map = self.board.piece_map()
-
-        # Loop through the board map
-        for position, _ in piece_map.items():
-            # Piece map is labeled with a row-major index
-            #
-            # 56 57 58 59 60 61 62 63
-            # ...
-            # 0  1  2  3  4  5  6  7
-
-            # Get x and y position of the piece on the board
-            board_index = np.unravel_index(position, (8, 8)) # Returns a tuple of (row, col)
-
-            # We need to reverse the unraveled index to get the BCS index
-            # row = y
-            # col = x
-            board_index = (board_index[1], board_index[0])
-            
-            # Get the x and y position of the piece on the board
-            x = self.square_positions[board_index[0], board_index[1], 0]
-            y = self.square_positions[board_index[0], board_index[1], 1]
-
-            # Plot a circle at the position of the piece
-            ax.add_patch(plt.Circle([x, y], self.piece_diameter / 2, fill=False, color="green"))
+        plot_board(ax, self)
 
     def get_binary_board(self):
         """
@@ -280,9 +355,7 @@ class PhysicalBoard():
         """
         i, j = bcs
 
-        for key, value in self.square_indicies.items():
-            if value == (i, j):
-                return key
+        return self.square_names.get((int(i), int(j)))
 
 if __name__ == "__main__":
     capture_positions = [
@@ -303,6 +376,8 @@ if __name__ == "__main__":
 
     print("Map Generated!")
 
+    from matplotlib import pyplot as plt
+
     fig, ax = plt.subplots()
     graph.plot_graph(ax, False)
     board.plot_background(ax)
@@ -0,0 +1,80 @@
+import chess
+
+from .sequencing import Relocation
+
+
+def decompose_move(board, move):
+    """
+    Breaks a chess move down into the physical relocations of the pieces it moves.
+    NOTE: This must be called before the move is made on the board. Capture positions are reserved for the pieces leaving the board.
+
+    1. Captures: The captured piece is moved to the capture area (for en passant the captured pawn is not on the target square)
+    2. Castling: The king and the rook are both moved
+    3. Promotion: The pawn is moved to the capture area and the promoted piece is brought back from the capture area
+
+    Returns a list of relocations in no particular order, the order is chosen when they are planned.
+
+    """
+    if isinstance(move, str):
+        move = chess.Move.from_uci(move)
+
+    chess_board = board.board
+
+    from_square = chess.square_name(move.from_square)
+    to_square = chess.square_name(move.to_square)
+
+    relocations = []
+
+    # Remove the captured piece
+    if chess_board.is_en_passant(move):
+        # The captured pawn is next to the starting square of the moving pawn
+        captured_square = chess.square_name(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+    elif chess_board.is_capture(move):
+        captured_square = to_square
+    else:
+        captured_square = None
+
+    if captured_square is not None:
+        captured_piece = chess_board.piece_at(chess.parse_square(captured_square))
+        capture_position = board.capture_piece(captured_piece)
+
+        relocations.append(Relocation(captured_square, board.get_square_position(captured_square), None, capture_position, "capture"))
+
+    if chess_board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+
+        # The king and rook squares are the standard (not chess960) castling squares
+        if chess_board.is_kingside_castling(move):
+            king_square = chess.square_name(chess.square(6, rank))
+            rook_from_square = chess.square_name(chess.square(7, rank))
+            rook_to_square = chess.square_name(chess.square(5, rank))
+        else:
+            king_square = chess.square_name(chess.square(2, rank))
+            rook_from_square = chess.square_name(chess.square(0, rank))
+            rook_to_square = chess.square_name(chess.square(3, rank))
+
+        relocations.append(Relocation(from_square, board.get_square_position(from_square), king_square, board.get_square_position(king_square), "king"))
+        relocations.append(Relocation(rook_from_square, board.get_square_position(rook_from_square), rook_to_square, board.get_square_position(rook_to_square), "rook"))
+
+        return relocations
+
+    if move.promotion is not None:
+        color = chess_board.piece_at(move.from_square).color
+        promoted_piece = chess.Piece(move.promotion, color)
+
+        # Swap the pawn for a captured piece of the promoted type if there is one
+        if any(captured_piece == promoted_piece for captured_piece, _ in board.get_captured_pieces()):
+            # The pawn's position is reserved before the promoted piece's position is freed, so the pawn never lands on the promoted piece
+            pawn_position = board.capture_piece(chess.Piece(chess.PAWN, color))
+            promoted_position = board.release_captured_piece(promoted_piece)
+
+            relocations.append(Relocation(from_square, board.get_square_position(from_square), None, pawn_position, "pawn"))
+            relocations.append(Relocation(None, promoted_position, to_square, board.get_square_position(to_square), "promotion"))
+
+            return relocations
+
+        print("No captured {} to promote to, the pawn has to be swapped by hand!".format(chess.piece_name(move.promotion)))
+
+    relocations.append(Relocation(from_square, board.get_square_position(from_square), to_square, board.get_square_position(to_square), "move"))
+
+    return relocations
@@ -1,8 +1,5 @@
 from collections import UserList
 from itertools import compress
-from multiprocessing import Pool, cpu_count
-from matplotlib import pyplot as plt
-from matplotlib.patches import Arc
 import numpy as np
 
 from .utils import cross, dist, dot, transform_polar, v2v_angle, zero_to_2pi
@@ -95,14 +92,21 @@ class Graph:
 
         self.points = []
         self.point_circles = []
+        self.tangent_nodes = [] # Nodes added on the circles by the point tangents
         self.tangent_edges = [] # Store the tangent edges separately to allow of easy modification of the graph
 
+        # Surfing edges that were removed because they intersect a circle, stored by the id of the first circle they intersect
+        # NOTE: This allows the edges to be restored when the circle is removed from the graph
+        self.blocked_edges = {}
+
+        self.prepared = False
+
         # Add the circles to the graph
-        for circle in circles:
-            for other_circle in circles:
-                if circle == other_circle:
-                    continue
-                
+        for i, circle in enumerate(circles):
+            self.circles[id(circle)] = circle
+
+            # The bitangents are symmetric so each pair of circles only needs to be connected once
+            for other_circle in circles[:i]:
                 # Add internal and external bitangents between circles
                 self.add_internal_bitangents(other_circle, circle)
                 self.add_external_bitangents(other_circle, circle)
@@ -111,12 +115,20 @@ class Graph:
         """
         Prepares a graph for searching
 
-        NOTE: This should only be called once after the graph is fully constructed.
+        NOTE: The first call cleans all of the surfing edges, later calls only clean the edges added by new points.
+        Circles added or removed after the first call are cleaned incrementally.
 
         """
 
-        # Clean up the surfing edge intersections
-        self.clean_surfing_edges()
+        if not self.prepared:
+            # Clean up the surfing edge intersections
+            self.clean_surfing_edges()
+
+            self.prepared = True
+        else:
+            # Only the point tangents have changed since the last preparation
+            self.clean_tangent_edges()
+            self.remove_unconnected_nodes()
 
         # Add hugging edges
         self.add_hugging_edges()
@@ -124,6 +136,9 @@ class Graph:
         # Edge optimization
         self.prepare_edge_optimization()
 
+    def is_prepared(self):
+        return self.prepared
+
     def get_nodes(self):
         return self.nodes
     
@@ -139,29 +154,39 @@ class Graph:
 
         self.surfing_edges.clear()
         self.hugging_edges.clear()
+
+        self.blocked_edges.clear()
+        self.prepared = False
     
     def clear_points(self):
         """
         Removes all points from the graph.
 
         """
-        for point in self.points:
-            self.nodes.pop(id(point))
+        for point in self.points + self.tangent_nodes:
+            self.nodes.pop(id(point), None)
 
         for circle in self.point_circles:
-            self.circles.pop(id(circle))
+            self.circles.pop(id(circle), None)
 
         self.points.clear()
         self.point_circles.clear()
+        self.tangent_nodes.clear()
         self.tangent_edges.clear()
 
     def prepare_edge_optimization(self):
         """
-        Generates a numpy array of the final edges for speedups.
+        Generates an adjacency map of the final edges for speedups.
         """
 
-        # Generate np_edges for optimization
-        self.np_edges = np.array(self.get_edges())
+        # Map each node to its neighbors
+        self.adjacency = {}
+        for edge in self.get_edges():
+            first = edge.get_first()
+            second = edge.get_second()
+
+            self.adjacency.setdefault(id(first), []).append((second, edge))
+            self.adjacency.setdefault(id(second), []).append((first, edge))
 
     def get_neighbors(self, node):
         """
@@ -170,36 +195,10 @@ class Graph:
 
         """
         # Check if graph has been prepared
-        if not hasattr(self, 'np_edges'):
+        if not hasattr(self, 'adjacency'):
             raise Exception('Graph has not been prepared for searching. Call prepare() before searching!')
 
-        neighbors = []
-
-        # Get the indicies of the edges that contain the node
-        node_indicies = np.where(self.np_edges == node)
-
-        # Get the neighbors
-        for i in range(len(node_indicies[0])):
-            node_row = node_indicies[0][i]
-            node_col = node_indicies[1][i]
-            
-            # If the node is the first node in the edge, the second node is the neighbor
-            if node_col == 0:
-                neighbors.append((self.np_edges[node_row][1], self.get_edges()[node_row]))
-            # If the node is the second node in the edge, the first node is the neighbor
-            else:
-                neighbors.append((self.np_edges[node_row][0], self.get_edges()[node_row]))
-
-        # # Slow Method
-        # for edge in self.get_edges():
-        #     if edge.get_first() == node:
-        #         neighbors.append((edge.get_second(), edge))
-        #         print("hi")
-        #     elif edge.get_second() == node:
-        #         neighbors.append((edge.get_first(), edge))
-        #         print("low")
-
-        return neighbors
+        return self.adjacency.get(id(node), [])
 
     def add_node(self, node):
         circle = node.get_circle()
@@ -219,32 +218,47 @@ class Graph:
         Removes all edges that intersect any of the circles in the graph.
 
         """
-        with Pool(cpu_count()-1) as pool: 
-            self.surfing_edges = list(compress(self.surfing_edges, pool.map(self.check_intersection, self.surfing_edges)))
+        circles = list(self.circles.values())
 
-        with Pool(cpu_count()-1) as pool: 
-            self.tangent_edges = list(compress(self.tangent_edges, pool.map(self.check_intersection, self.tangent_edges)))
+        # Find the first circle each edge intersects
+        blockers = self.find_blocking_circles(self.surfing_edges, circles)
 
-        self.prepare_edge_optimization()
+        surfing_edges = []
+        for edge, blocker in zip(self.surfing_edges, blockers):
+            if blocker < 0:
+                surfing_edges.append(edge)
+            else:
+                self.blocked_edges.setdefault(id(circles[blocker]), []).append(edge)
+
+        self.surfing_edges = surfing_edges
+
+        self.clean_tangent_edges()
 
         # Remove nodes that are no longer connected to any other nodes
-        self.remove_unconnected_nodes() # TODO: Very slow
+        self.remove_unconnected_nodes()
+
+    def clean_tangent_edges(self):
+        """
+        Removes all point tangent edges that intersect any of the circles in the graph.
+
+        """
+        blockers = self.find_blocking_circles(self.tangent_edges, list(self.circles.values()))
+
+        self.tangent_edges = list(compress(self.tangent_edges, blockers < 0))
 
     def remove_unconnected_nodes(self):
         """
         Removes all nodes that are no longer connected to any other nodes.
 
         """
-        # Create a copy of the nodes dictionary
-        new_nodes = self.nodes.copy()
+        # Find the nodes that are part of an edge
+        connected = set()
+        for edge in self.surfing_edges + self.tangent_edges:
+            connected.add(id(edge.get_first()))
+            connected.add(id(edge.get_second()))
 
         # Remove all nodes that are not connected to any other nodes
-        for node in self.nodes.values():
-            if len(self.get_neighbors(node)) == 0:
-                new_nodes.pop(id(node))
-
-        # Update the nodes dictionary
-        self.nodes = new_nodes
+        self.nodes = {key: node for key, node in self.nodes.items() if key in connected}
 
     def check_intersection(self, edge):
         """
@@ -253,16 +267,184 @@ class Graph:
         Returns True if the edge does not intersect any of the circles in the graph.
 
         """
-        circles_to_ignore = [edge.get_first().get_circle(), edge.get_second().get_circle()]
+        return self.find_blocking_circles([edge], list(self.circles.values()))[0] < 0
 
-        for circle in self.circles.values():
-            if circle in circles_to_ignore:
+    @staticmethod
+    def find_blocking_circles(edges, circles, chunk_size=4096):
+        """
+        Finds the first circle each edge intersects.
+        The circles the edge starts or ends on and points are ignored.
+
+        Returns an array with the index of the blocking circle for each edge, or -1 if the edge is free.
+
+        """
+        blockers = np.full(len(edges), -1)
+
+        if len(edges) == 0 or len(circles) == 0:
+            return blockers
+
+        centers = np.array([circle.get_center() for circle in circles], dtype=float)
+        radii = np.array([circle.get_r() for circle in circles], dtype=float)
+        circle_indicies = {id(circle): i for i, circle in enumerate(circles)}
+
+        # Check the edges in chunks to bound the memory used
+        for chunk_start in range(0, len(edges), chunk_size):
+            chunk = edges[chunk_start:chunk_start + chunk_size]
+
+            pos1 = np.array([edge.get_first().get_position() for edge in chunk], dtype=float)
+            pos2 = np.array([edge.get_second().get_position() for edge in chunk], dtype=float)
+
+            # The distance from each circle center to the closest point on each edge
+            # The closest point is the projection of the center onto the edge, clamped to the ends of the edge
+            direction = pos2 - pos1
+            length_squared = np.sum(direction**2, axis=1)
+
+            # It is faster to assume a zero length edge lies on another circle and thus cannot intersect any circle
+            is_point = length_squared == 0
+            length_squared[is_point] = 1
+
+            t = np.einsum("ecd,ed->ec", centers[None, :, :] - pos1[:, None, :], direction) / length_squared[:, None]
+            t = np.clip(t, 0, 1)
+
+            closest = pos1[:, None, :] + t[:, :, None] * direction[:, None, :]
+            d_squared = np.sum((centers[None, :, :] - closest)**2, axis=2)
+
+            # Points (circles with zero radius) are not obstacles
+            intersects = (d_squared <= radii[None, :]**2) & (radii[None, :] > 0)
+            intersects[is_point] = False
+
+            # Ignore the circles the edge is connected to
+            for i, edge in enumerate(chunk):
+                for circle in (edge.get_first().get_circle(), edge.get_second().get_circle()):
+                    if id(circle) in circle_indicies:
+                        intersects[i, circle_indicies[id(circle)]] = False
+
+            blocked = intersects.any(axis=1)
+            blockers[chunk_start:chunk_start + len(chunk)] = np.where(blocked, np.argmax(intersects, axis=1), -1)
+
+        return blockers
+
+    def add_circle(self, circle):
+        """
+        Inserts a circle into the graph.
+        NOTE: If the graph has already been prepared the surfing edges are cleaned incrementally.
+
+        """
+        new_edges_start = len(self.surfing_edges)
+
+        # Add internal and external bitangents to the other circles
+        for other_circle in list(self.circles.values()):
+            if other_circle.get_r() == 0:
+                # Points are only connected when they are added
                 continue
 
-            if self.check_circle_intersection(circle, edge):
-                return False
+            self.add_internal_bitangents(other_circle, circle)
+            self.add_external_bitangents(other_circle, circle)
+
+        self.circles[id(circle)] = circle
+
+        if not self.prepared:
+            return circle
 
-        return True
+        new_edges = self.surfing_edges[new_edges_start:]
+        old_edges = self.surfing_edges[:new_edges_start]
+
+        # Remove the existing edges that intersect the new circle
+        old_blockers = self.find_blocking_circles(old_edges, [circle])
+
+        surfing_edges = []
+        for edge, blocker in zip(old_edges, old_blockers):
+            if blocker < 0:
+                surfing_edges.append(edge)
+            else:
+                self.blocked_edges.setdefault(id(circle), []).append(edge)
+
+        # Check the new edges against all of the circles
+        circles = list(self.circles.values())
+        new_blockers = self.find_blocking_circles(new_edges, circles)
+
+        for edge, blocker in zip(new_edges, new_blockers):
+            if blocker < 0:
+                surfing_edges.append(edge)
+            else:
+                self.blocked_edges.setdefault(id(circles[blocker]), []).append(edge)
+
+        self.surfing_edges = surfing_edges
+
+        self.clean_tangent_edges()
+        self.remove_unconnected_nodes()
+
+        self.add_hugging_edges()
+        self.prepare_edge_optimization()
+
+        return circle
+
+    def remove_circle(self, circle):
+        """
+        Removes a circle from the graph.
+        The edges that were only blocked by the circle are restored.
+
+        """
+        self.circles.pop(id(circle), None)
+
+        # Remove the nodes on the circle and the edges connected to them
+        self.nodes = {key: node for key, node in self.nodes.items() if node.get_circle() is not circle}
+
+        def is_connected(edge):
+            return edge.get_first().get_circle() is circle or edge.get_second().get_circle() is circle
+
+        self.surfing_edges = [edge for edge in self.surfing_edges if not is_connected(edge)]
+        self.tangent_edges = [edge for edge in self.tangent_edges if not is_connected(edge)]
+
+        # Restore the edges that were blocked by the circle if no other circle blocks them
+        restored_edges = [edge for edge in self.blocked_edges.pop(id(circle), []) if not is_connected(edge) and self.is_edge_valid(edge)]
+
+        circles = list(self.circles.values())
+        blockers = self.find_blocking_circles(restored_edges, circles)
+
+        for edge, blocker in zip(restored_edges, blockers):
+            if blocker < 0:
+                self.surfing_edges.append(edge)
+
+                self.add_node(edge.get_first())
+                self.add_node(edge.get_second())
+            else:
+                self.blocked_edges.setdefault(id(circles[blocker]), []).append(edge)
+
+        if self.prepared:
+            self.remove_unconnected_nodes()
+
+            self.add_hugging_edges()
+            self.prepare_edge_optimization()
+
+    def is_edge_valid(self, edge):
+        """
+        Checks if both of the circles an edge connects are still in the graph.
+
+        """
+        return id(edge.get_first().get_circle()) in self.circles and id(edge.get_second().get_circle()) in self.circles
+
+    def update_circles(self, circles):
+        """
+        Updates the graph so it contains exactly the given circles.
+        Circles are matched by their center and radius, so only the circles that changed are removed or added.
+
+        """
+        def get_key(circle):
+            return (float(circle.get_center()[0]), float(circle.get_center()[1]), float(circle.get_r()))
+
+        current = {get_key(circle): circle for circle in self.circles.values() if circle.get_r() > 0}
+        target = {get_key(circle): circle for circle in circles}
+
+        for key, circle in current.items():
+            if key not in target:
+                self.remove_circle(circle)
+
+        for key, circle in target.items():
+            if key not in current:
+                self.add_circle(circle)
+
+        return self
 
     def add_point(self, node):
         """
@@ -339,6 +521,9 @@ class Graph:
         self.add_node(E_node)
         self.add_node(F_node)
 
+        self.tangent_nodes.append(E_node)
+        self.tangent_nodes.append(F_node)
+
         # Generate the internal bitangent edges
         self.tangent_edges.append(Edge(point_node, E_node, True))
         self.tangent_edges.append(Edge(point_node, F_node, True))
@@ -497,54 +682,9 @@ class Graph:
         """
         Plots the graph on the given axes.
         """
-        # Set square aspect ratio
-        ax.set_aspect("equal")
+        from .visualization import plot_graph
 
-        # Plot the circles
-        for circle in self.circles.values():
-            ax.add_patch(plt.Circle(circle.get_center(), circle.get_r(), fill=False))
-
-        if not simplify:
-            # Plot the surfing edge lines
-            # count = 0
-            for edge in self.surfing_edges + self.tangent_edges:
-                first = edge.get_first()
-                second = edge.get_second()
-
-                ax.plot([first.get_x(), second.get_x()], [first.get_y(), second.get_y()], "b-")
-
-                # # Label the surfing edges
-                # ax.text((first.get_x() + second.get_x()) / 2, (first.get_y() + second.get_y()) / 2, str(count), color="b")
-                # count += 1
-
-            # Plot the hugging edge arcs
-            for edge in self.hugging_edges[::2]:
-                first = edge.get_first()
-                second = edge.get_second()
-
-                arc_center = first.get_circle().get_center()
-                arc_radius = first.get_circle().get_r()
-
-                arc_start = v2v_angle(arc_center, first.get_position())
-                arc_end = v2v_angle(arc_center, second.get_position())
-
-                # For plotting we will first transform the angles to be in the range [0, 2pi)
-                arc_start = zero_to_2pi(arc_start)
-                arc_end = zero_to_2pi(arc_end)
-
-                # Determine the start and end points for plotting and convert the angles to degrees
-                theta1 = np.rad2deg(min(arc_start, arc_end))
-                theta2 = np.rad2deg(max(arc_start, arc_end))
-
-                # Plot the start and end points
-                ax.plot(first.get_x(), first.get_y(), "r*")
-                ax.plot(second.get_x(), second.get_y(), "g*")
-
-                ax.add_patch(Arc(arc_center, 2 * arc_radius, 2 * arc_radius, theta1=theta1, theta2=theta2, color="g"))
-
-            # # Plot the nodes
-            # for node in self.nodes.values():
-            #     ax.plot(node.get_x(), node.get_y(), "ro")
+        plot_graph(ax, self, simplify)
 
     @staticmethod
     def check_circle_intersection(circle, edge):
@@ -646,6 +786,8 @@ if __name__ == "__main__":
 
     print("Generated Graph!")
 
+    from matplotlib import pyplot as plt
+
     fig, ax = plt.subplots()
     graph.plot_graph(ax, simplify=False)
 
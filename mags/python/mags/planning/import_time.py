@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+# The modules of the planning core and the dependencies they must not import
+CORE_MODULES = ["planning.graph", "planning.astar", "planning.planner", "planning.board", "planning.trajectory"]
+HEAVY_MODULES = ["matplotlib", "PIL", "casadi"]
+
+# Import time of the planning core in seconds before the benchmark fails
+MAX_IMPORT_TIME = 1.0
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+print(time.perf_counter() - start)
+print(",".join(module for module in {heavy!r} if module in sys.modules))
+"""
+
+
+def measure_import(modules=CORE_MODULES, heavy=HEAVY_MODULES, cwd=None):
+    """
+    Imports the modules in a fresh interpreter.
+    Returns the import time and the heavy modules that were imported with them.
+
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(modules=modules, heavy=heavy)],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+
+    return float(output[0]), [module for module in output[1].split(",") if module != ""]
+
+
+if __name__ == "__main__":
+    import os
+
+    # The planning package is imported the way the server imports it
+    import_time, loaded = measure_import(cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    print("Import Time: {:.3f}s".format(import_time))
+
+    if len(loaded) > 0:
+        sys.exit("Planning core imported: " + ", ".join(loaded))
+
+    if import_time > MAX_IMPORT_TIME:
+        sys.exit("Import time above {:.3f}s".format(MAX_IMPORT_TIME))
@@ -0,0 +1,201 @@
+import numpy as np
+
+
+class PathProfile:
+    """
+    Stores the segments of a path with the speeds assigned to them.
+    NOTE: Speeds are in mm/s, gcode feedrates are in mm/min.
+
+    """
+
+    def __init__(self, segments, speeds, junction_speeds, times, accel):
+        self.segments = segments
+        self.speeds = speeds
+        self.junction_speeds = junction_speeds
+        self.times = times
+        self.accel = accel
+
+    def __iter__(self):
+        """
+        Iterates over (segment, feedrate) pairs.
+
+        """
+        for segment, speed in zip(self.segments, self.speeds):
+            yield segment, speed * 60
+
+    def __len__(self):
+        return len(self.segments)
+
+    def get_segments(self):
+        return self.segments
+
+    def get_speeds(self):
+        return self.speeds
+
+    def get_feedrates(self):
+        return [speed * 60 for speed in self.speeds]
+
+    def get_junction_speeds(self):
+        return self.junction_speeds
+
+    def get_accel(self):
+        return self.accel
+
+    def get_segment_times(self):
+        return self.times
+
+    def get_time(self):
+        """
+        Returns the estimated execution time of the path in seconds.
+
+        """
+        return sum(self.times)
+
+    def get_length(self):
+        return sum(segment.get_length() for segment in self.segments)
+
+
+class MotionProfile:
+    """
+    Assigns feedrates to the segments of a path and estimates how long the path takes to execute.
+
+    Each segment is limited by:
+    1. The maximum speed of the gantry
+    2. The centripetal acceleration limit on hugging arcs (v = sqrt(a * r))
+    3. The magnet slip limit when a piece is being dragged
+
+    The junction speeds between segments are limited by the acceleration like klipper's lookahead queue.
+    NOTE: All dimensions are in mm and all times are in seconds.
+
+    """
+
+    def __init__(self, max_speed=250, max_accel=3000, centripetal_accel=2000, slip_speed=150, slip_accel=1500, corner_speed=5, corner_tolerance=np.deg2rad(1)):
+        self.max_speed = max_speed
+        self.max_accel = max_accel
+
+        self.centripetal_accel = centripetal_accel
+
+        self.slip_speed = slip_speed
+        self.slip_accel = slip_accel
+
+        # Speed allowed through a junction where the path changes direction
+        self.corner_speed = corner_speed
+        self.corner_tolerance = corner_tolerance
+
+    def get_accel(self, magnet_on=True):
+        """
+        Returns the acceleration limit for a move.
+
+        """
+        if magnet_on:
+            return min(self.max_accel, self.slip_accel)
+        else:
+            return self.max_accel
+
+    def get_segment_speed(self, segment, magnet_on=True):
+        """
+        Returns the cruise speed of a segment.
+
+        """
+        speed = self.max_speed
+
+        # Dragging a piece faster than the magnet can hold it loses the piece
+        if magnet_on:
+            speed = min(speed, self.slip_speed)
+
+        # Limit the centripetal acceleration on arcs
+        if segment.is_arc():
+            speed = min(speed, float(np.sqrt(self.centripetal_accel * segment.get_radius())))
+
+        return speed
+
+    def get_junction_speed(self, previous_segment, next_segment, previous_speed, next_speed):
+        """
+        Returns the maximum speed through the junction between two segments.
+
+        """
+        speed = min(previous_speed, next_speed)
+
+        # Angle between the exit direction of the previous segment and the entry direction of the next one
+        exit_direction = self.get_tangent(previous_segment, at_end=True)
+        entry_direction = self.get_tangent(next_segment, at_end=False)
+
+        angle = np.arccos(np.clip(np.dot(exit_direction, entry_direction), -1.0, 1.0))
+
+        if angle > self.corner_tolerance:
+            speed = min(speed, self.corner_speed)
+
+        return speed
+
+    def profile(self, segments, magnet_on=True):
+        """
+        Generates the motion profile for a list of segments.
+        NOTE: The path starts and ends at rest.
+
+        """
+        segments = list(segments)
+
+        accel = self.get_accel(magnet_on)
+
+        speeds = [self.get_segment_speed(segment, magnet_on) for segment in segments]
+        lengths = [segment.get_length() for segment in segments]
+
+        # Junction speeds, junction i is at the start of segment i
+        junction_speeds = [0.0]
+        for i in range(1, len(segments)):
+            junction_speeds.append(self.get_junction_speed(segments[i - 1], segments[i], speeds[i - 1], speeds[i]))
+        junction_speeds.append(0.0)
+
+        # Forward pass: limit the speed we can accelerate to
+        for i in range(1, len(junction_speeds)):
+            junction_speeds[i] = min(junction_speeds[i], float(np.sqrt(junction_speeds[i - 1]**2 + 2 * accel * lengths[i - 1])))
+
+        # Backward pass: limit the speed we can decelerate from
+        for i in range(len(junction_speeds) - 2, -1, -1):
+            junction_speeds[i] = min(junction_speeds[i], float(np.sqrt(junction_speeds[i + 1]**2 + 2 * accel * lengths[i])))
+
+        times = []
+        for i in range(len(segments)):
+            times.append(float(self.trapezoid_time(lengths[i], junction_speeds[i], speeds[i], junction_speeds[i + 1], accel)))
+
+        return PathProfile(segments, speeds, junction_speeds, times, accel)
+
+    @staticmethod
+    def trapezoid_time(length, entry_speed, cruise_speed, exit_speed, accel):
+        """
+        Returns the time taken to move a distance with a trapezoidal velocity profile.
+
+        """
+        # Distances needed to accelerate to and decelerate from the cruise speed
+        accel_distance = (cruise_speed**2 - entry_speed**2) / (2 * accel)
+        decel_distance = (cruise_speed**2 - exit_speed**2) / (2 * accel)
+
+        if accel_distance + decel_distance <= length:
+            # Trapezoid: the cruise speed is reached
+            cruise_distance = length - accel_distance - decel_distance
+
+            return (cruise_speed - entry_speed) / accel + cruise_distance / cruise_speed + (cruise_speed - exit_speed) / accel
+        else:
+            # Triangle: the peak speed is limited by the length of the move
+            peak_speed = np.sqrt((2 * accel * length + entry_speed**2 + exit_speed**2) / 2)
+
+            return max(peak_speed - entry_speed, 0) / accel + max(peak_speed - exit_speed, 0) / accel
+
+    @staticmethod
+    def get_tangent(segment, at_end):
+        """
+        Returns the unit direction of motion at the start or end of a segment.
+
+        """
+        if not segment.is_arc():
+            return segment.get_direction()
+
+        # The tangent of an arc is perpendicular to its radius
+        position = segment.get_end() if at_end else segment.get_start()
+        radius = position - segment.get_center()
+        tangent = np.array([-radius[1], radius[0]]) / np.linalg.norm(radius)
+
+        if segment.is_clockwise():
+            tangent = -tangent
+
+        return tangent
@@ -0,0 +1,355 @@
+from collections import OrderedDict
+import heapq
+from itertools import count
+from threading import Lock
+
+import numpy as np
+
+from .graph import Circle, Edge, Graph, Node
+from .utils import dist, transform_polar, v2v_angle, zero_to_2pi
+
+# Number of prepared graphs kept by the geometry cache
+GRAPH_CACHE_SIZE = 32
+
+
+class PlanOptions:
+    """
+    The options of a path query.
+
+    node_cost: The cost added to every edge to favor paths with less nodes
+    heuristic_weight: The weight of the distance heuristic, 1 keeps the search optimal
+    max_expansions: The number of nodes expanded before the search gives up, None to search the whole graph
+
+    """
+
+    def __init__(self, node_cost=1.0, heuristic_weight=1.0, max_expansions=None):
+        self.node_cost = node_cost
+        self.heuristic_weight = heuristic_weight
+        self.max_expansions = max_expansions
+
+
+class PathResult:
+    """
+    The result of a path query.
+    The path is a list of nodes like the paths generated by Astar, or None if no path was found.
+
+    """
+
+    def __init__(self, path, cost, expansions):
+        self.path = path
+        self.cost = cost
+        self.expansions = expansions
+
+    def is_found(self):
+        return self.path is not None
+
+    def get_path(self):
+        return self.path
+
+    def get_cost(self):
+        return self.cost
+
+    def get_expansions(self):
+        return self.expansions
+
+
+class GraphCache:
+    """
+    A least recently used cache of prepared graphs keyed by the geometry of their obstacles.
+
+    NOTE: The cached graphs are shared between queries and threads, they must not be modified.
+
+    """
+
+    def __init__(self, size=GRAPH_CACHE_SIZE):
+        self.size = size
+        self.graphs = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = Lock()
+
+    @staticmethod
+    def get_key(obstacles):
+        """
+        Get the geometry key of a list of obstacle circles, independent of their order.
+
+        """
+        return tuple(sorted((float(circle.get_center()[0]), float(circle.get_center()[1]), float(circle.get_r())) for circle in obstacles))
+
+    def get_graph(self, obstacles):
+        """
+        Get the prepared graph of a list of obstacle circles, the graph is built and prepared on a miss.
+
+        """
+        key = self.get_key(obstacles)
+
+        with self.lock:
+            graph = self.graphs.get(key)
+
+            if graph is not None:
+                self.graphs.move_to_end(key)
+                self.hits += 1
+                return graph
+
+            self.misses += 1
+
+        # Build outside of the lock so other queries are not blocked, two threads may build the same graph
+        graph = Graph([Circle(r, np.array([x, y])) for x, y, r in key])
+        graph.prepare()
+
+        with self.lock:
+            self.graphs[key] = graph
+
+            while len(self.graphs) > self.size:
+                self.graphs.popitem(last=False)
+
+        return graph
+
+    def clear(self):
+        with self.lock:
+            self.graphs.clear()
+
+
+# The geometry cache shared by all queries
+GRAPH_CACHE = GraphCache()
+
+
+def get_edge_cost(edge, node_cost=1.0):
+    """
+    Get the cost of an edge, the length of a surfing edge or the arc length of a hugging edge plus the node cost.
+
+    """
+    first = edge.get_first()
+    second = edge.get_second()
+
+    if edge.is_surfing():
+        return node_cost + dist(first.get_position(), second.get_position())
+
+    # The smallest angle between the nodes seen from the center of the circle
+    arc_center = first.get_circle().get_center()
+
+    a = first.get_position() - arc_center
+    b = second.get_position() - arc_center
+
+    cos_angle = np.clip(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)), -1.0, 1.0)
+
+    return node_cost + first.get_circle().get_r() * np.arccos(cos_angle)
+
+
+class PlanContext:
+    """
+    The scratch of a single path query on a prepared graph.
+
+    The start and goal points and their tangents are added to an overlay instead of the graph:
+    1. The tangents from each point to each circle and the direct edge between the points are checked against the circles
+    2. The tangent nodes are connected to their neighbors on their circle with hugging edges
+    3. The neighbors of a node are its neighbors on the graph plus its neighbors in the overlay
+
+    The prepared graph is only read, so any number of contexts can search the same graph at once.
+
+    """
+
+    def __init__(self, graph, start, goal):
+        self.graph = graph
+
+        self.start = Node(Circle(0, np.asarray(start, dtype=float)), np.asarray(start, dtype=float))
+        self.goal = Node(Circle(0, np.asarray(goal, dtype=float)), np.asarray(goal, dtype=float))
+
+        # Edges of the overlay keyed by the id of their nodes
+        self.adjacency = {}
+
+        self.add_points()
+
+    def add_points(self):
+        circles = [circle for circle in self.graph.get_circles().values() if circle.get_r() > 0]
+
+        edges = [Edge(self.start, self.goal, True)]
+        tangent_nodes = {}
+
+        for point in (self.start, self.goal):
+            for circle in circles:
+                for node in self.get_tangent_nodes(point, circle):
+                    tangent_nodes.setdefault(id(circle), (circle, []))[1].append(node)
+                    edges.append(Edge(point, node, True))
+
+        # Only keep the tangents that don't cross a circle
+        blockers = Graph.find_blocking_circles(edges, circles)
+
+        connected = set()
+        for edge, blocker in zip(edges, blockers):
+            if blocker < 0:
+                self.add_edge(edge)
+                connected.add(id(edge.get_second()))
+
+        # Group the nodes of the graph by their circle in one pass
+        rings = {}
+        for node in self.graph.get_nodes().values():
+            if id(node.get_circle()) in tangent_nodes:
+                rings.setdefault(id(node.get_circle()), []).append(node)
+
+        # Connect the tangent nodes to their neighbors on their circle
+        for key, (circle, nodes) in tangent_nodes.items():
+            nodes = [node for node in nodes if id(node) in connected]
+
+            if len(nodes) > 0:
+                self.add_hugging_edges(circle, rings.get(key, []), nodes)
+
+    @staticmethod
+    def get_tangent_nodes(point, circle):
+        """
+        Get the nodes where the tangents from a point touch a circle.
+        No tangents exist if the point is inside the circle.
+
+        """
+        A = point.get_position()
+        B = circle.get_center()
+        r = circle.get_r()
+
+        d = dist(A, B)
+        if d <= r:
+            return []
+
+        theta = np.arccos(r / d)
+        angle_BA = v2v_angle(B, A)
+
+        return [Node(circle, transform_polar(B, r, angle_BA - theta)), Node(circle, transform_polar(B, r, angle_BA + theta))]
+
+    def add_hugging_edges(self, circle, ring, nodes):
+        """
+        Inserts the tangent nodes into the ring of graph nodes on a circle and connects them to the nodes before and after them.
+
+        """
+        ring = ring + nodes
+
+        if len(ring) < 2:
+            return
+
+        angles = [zero_to_2pi(v2v_angle(circle.get_center(), node.get_position())) for node in ring]
+        ring = [ring[i] for i in np.argsort(angles)]
+
+        new = set(id(node) for node in nodes)
+
+        for i in range(len(ring)):
+            n1 = ring[i]
+            n2 = ring[(i + 1) % len(ring)]
+
+            # The edges between two nodes of the graph are already in the graph
+            if n1 is not n2 and (id(n1) in new or id(n2) in new):
+                self.add_edge(Edge(n1, n2, False))
+
+    def add_edge(self, edge):
+        first = edge.get_first()
+        second = edge.get_second()
+
+        self.adjacency.setdefault(id(first), []).append((second, edge))
+        self.adjacency.setdefault(id(second), []).append((first, edge))
+
+    def get_neighbors(self, node):
+        neighbors = self.adjacency.get(id(node), [])
+
+        if node is self.start or node is self.goal:
+            return neighbors
+
+        return self.graph.get_neighbors(node) + neighbors
+
+    def search(self, options):
+        """
+        Runs A* from the start to the goal.
+
+        """
+        goal_position = self.goal.get_position()
+
+        # The counter breaks ties so the nodes are never compared
+        order = count()
+        frontier = [(0.0, next(order), 0.0, self.start)]
+
+        parents = {id(self.start): None}
+        nodes = {id(self.start): self.start}
+        cost = {id(self.start): 0.0}
+
+        expansions = 0
+
+        while len(frontier) > 0:
+            _, _, current_cost, current = heapq.heappop(frontier)
+
+            # The node was pushed again with a lower cost after this entry, it has already been expanded
+            if current_cost > cost[id(current)]:
+                continue
+
+            if current is self.goal:
+                break
+
+            expansions += 1
+            if options.max_expansions is not None and expansions > options.max_expansions:
+                return PathResult(None, None, expansions)
+
+            for neighbor, edge in self.get_neighbors(current):
+                neighbor_cost = cost[id(current)] + get_edge_cost(edge, options.node_cost)
+
+                if id(neighbor) not in cost or neighbor_cost < cost[id(neighbor)]:
+                    cost[id(neighbor)] = neighbor_cost
+                    parents[id(neighbor)] = current
+                    nodes[id(neighbor)] = neighbor
+
+                    priority = neighbor_cost + options.heuristic_weight * dist(neighbor.get_position(), goal_position)
+                    heapq.heappush(frontier, (priority, next(order), neighbor_cost, neighbor))
+
+        if id(self.goal) not in parents:
+            return PathResult(None, None, expansions)
+
+        # Reconstruct the path from the goal
+        path = []
+
+        current = self.goal
+        while current is not None:
+            path.append(current)
+            current = parents[id(current)]
+
+        path.reverse()
+
+        return PathResult(path, cost[id(self.goal)], expansions)
+
+
+def search(graph, start, goal, options=None):
+    """
+    Finds a path from the start to the goal on a prepared graph without modifying it.
+
+    """
+    if options is None:
+        options = PlanOptions()
+
+    return PlanContext(graph, start, goal).search(options)
+
+
+def plan(obstacles, start, goal, options=None, cache=GRAPH_CACHE):
+    """
+    Finds a path from the start to the goal around a list of obstacle circles.
+    The prepared graph of the obstacles is taken from the geometry cache, so repeated queries around the same pieces only search.
+
+    NOTE: This is safe to call from several threads at once.
+
+    """
+    return search(cache.get_graph(obstacles), start, goal, options)
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    import time
+
+    # Grid of circles
+    obstacles = [Circle(0.2, np.array([i, j])) for i in range(8) for j in range(4)]
+
+    result = plan(obstacles, np.array([0.5, 0.5]), np.array([6.5, 1]))
+    print("Cost: {:.3f}, Expansions: {}, Nodes: {}".format(result.get_cost(), result.get_expansions(), len(result.get_path())))
+
+    # Run queries between random points concurrently on the cached graph
+    rng = np.random.default_rng(0)
+    queries = [(rng.integers(0, 7, 2) + 0.5, rng.integers(0, 3, 2) + 0.5) for _ in range(100)]
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda query: plan(obstacles, *query), queries))
+
+    print("{} Queries: {:.3f}s, Cache Hits: {}".format(len(results), time.perf_counter() - start_time, GRAPH_CACHE.hits))
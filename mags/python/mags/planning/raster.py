@@ -0,0 +1,168 @@
+from functools import lru_cache
+import io
+import os
+
+import chess
+import numpy as np
+from PIL import Image
+
+# The piece sprites of the UI, named by color and piece (e.g. wK.png)
+SPRITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "static", "images", "chesspieces", "wikipedia")
+
+# Size of a square in pixels, the size of the sprites
+SQUARE_SIZE = 80
+
+# Colors of the squares (the colors of chess.svg)
+LIGHT_COLOR = (0xff, 0xce, 0x9e)
+DARK_COLOR = (0xd1, 0x8b, 0x47)
+
+# Number of rendered positions kept by a renderer
+RENDER_CACHE_SIZE = 128
+
+
+class BoardRenderer():
+    """
+    Renders the position of a FEN as an RGB image with the white pieces at the bottom.
+
+    1. The empty board is rendered once
+    2. The sprites of the pieces are loaded once and stored premultiplied by their alpha
+    3. A position is rendered by blending the sprites onto a copy of the empty board with NumPy slicing
+
+    The rendered images and PNGs are kept in an LRU cache keyed by the piece placement of the FEN,
+    so rendering the same position again only looks it up.
+
+    NOTE: The cached images are shared, they are read-only.
+
+    """
+
+    def __init__(self, square_size=SQUARE_SIZE, sprite_path=SPRITE_PATH, cache_size=RENDER_CACHE_SIZE):
+        self.square_size = square_size
+
+        self.empty = self.render_empty(square_size)
+        self.sprites = self.load_sprites(sprite_path, square_size)
+
+        # Per renderer caches keyed by the piece placement
+        self.render_placement = lru_cache(maxsize=cache_size)(self.composite)
+        self.render_placement_png = lru_cache(maxsize=cache_size)(self.encode_png)
+
+    @staticmethod
+    def render_empty(square_size):
+        """
+        Get the image of the empty board, a1 is dark and in the bottom left.
+
+        """
+        # The parity of (file + rank) of the squares with rank 8 in the first row
+        files, ranks = np.meshgrid(np.arange(8), np.arange(7, -1, -1))
+        light = (files + ranks) % 2 == 1
+
+        squares = np.where(light[..., None], np.array(LIGHT_COLOR, dtype=np.uint8), np.array(DARK_COLOR, dtype=np.uint8))
+
+        # Scale every square up to square_size x square_size pixels
+        return np.repeat(np.repeat(squares, square_size, axis=0), square_size, axis=1)
+
+    @staticmethod
+    def load_sprites(sprite_path, square_size):
+        """
+        Get the premultiplied color and the alpha of each piece sprite keyed by its symbol (e.g. K, k).
+
+        """
+        sprites = {}
+
+        for symbol in "PNBRQKpnbrqk":
+            name = ("w" if symbol.isupper() else "b") + symbol.upper() + ".png"
+
+            image = Image.open(os.path.join(sprite_path, name)).convert("RGBA")
+            if image.size != (square_size, square_size):
+                image = image.resize((square_size, square_size), Image.LANCZOS)
+
+            rgba = np.asarray(image, dtype=np.float32) / 255
+            alpha = rgba[..., 3:]
+
+            sprites[symbol] = (rgba[..., :3] * alpha * 255, 1 - alpha)
+
+        return sprites
+
+    @staticmethod
+    def get_placement(fen):
+        """
+        Get the piece placement field of a FEN, the other fields don't change the image.
+
+        """
+        return fen.split(" ")[0]
+
+    def composite(self, placement):
+        image = self.empty.astype(np.float32)
+
+        size = self.square_size
+
+        for square, piece in chess.BaseBoard(placement).piece_map().items():
+            # The rows of the image start at rank 8
+            x = chess.square_file(square) * size
+            y = (7 - chess.square_rank(square)) * size
+
+            color, transparency = self.sprites[piece.symbol()]
+
+            tile = image[y:y + size, x:x + size]
+            tile *= transparency
+            tile += color
+
+        image = np.rint(image).astype(np.uint8)
+        image.flags.writeable = False
+
+        return image
+
+    def encode_png(self, placement):
+        file = io.BytesIO()
+        Image.fromarray(self.render_placement(placement)).save(file, format="PNG")
+
+        return file.getvalue()
+
+    def render(self, fen):
+        """
+        Get the RGB image (8 * square_size x 8 * square_size x 3) of a position.
+
+        """
+        return self.render_placement(self.get_placement(fen))
+
+    def render_png(self, fen):
+        """
+        Get the PNG of a position.
+
+        """
+        return self.render_placement_png(self.get_placement(fen))
+
+    def get_cache_info(self):
+        return self.render_placement.cache_info()
+
+
+@lru_cache
+def get_renderer(square_size=SQUARE_SIZE):
+    """
+    Get the renderer shared by all boards and the server.
+
+    """
+    return BoardRenderer(square_size)
+
+
+if __name__ == "__main__":
+    import time
+
+    renderer = get_renderer()
+
+    board = chess.Board()
+
+    start_time = time.perf_counter()
+    for move in ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6"]:
+        board.push_uci(move)
+        renderer.render(board.fen())
+    print("Render: {:.3f}ms".format((time.perf_counter() - start_time) / 6 * 1000))
+
+    start_time = time.perf_counter()
+    renderer.render(board.fen())
+    print("Cached: {:.3f}ms".format((time.perf_counter() - start_time) * 1000))
+
+    start_time = time.perf_counter()
+    png = renderer.render_png(board.fen())
+    print("PNG: {:.3f}ms, {} Bytes".format((time.perf_counter() - start_time) * 1000, len(png)))
+
+    print(renderer.get_cache_info())
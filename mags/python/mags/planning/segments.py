@@ -0,0 +1,211 @@
+import numpy as np
+
+from .utils import dist
+
+
+class Segment:
+    """
+    Base class for a single motion segment of a path.
+    Stores the start and end positions of the segment.
+
+    """
+
+    def __init__(self, start, end):
+        self.start = np.asarray(start, dtype=float)
+        self.end = np.asarray(end, dtype=float)
+
+    def get_start(self):
+        return self.start
+
+    def get_end(self):
+        return self.end
+
+    def get_length(self):
+        return dist(self.start, self.end)
+
+    def is_arc(self):
+        return False
+
+
+class LinearSegment(Segment):
+    """
+    Class that represents a straight line move between two positions.
+
+    """
+
+    def get_direction(self):
+        """
+        Returns the unit direction vector of the segment.
+
+        """
+        return (self.end - self.start) / self.get_length()
+
+    def can_merge(self, other, tolerance):
+        """
+        Checks if another linear segment continues this one in a straight line.
+        The segments are merged if the shared point deviates less than the tolerance from the merged line.
+
+        """
+        if other.is_arc():
+            return False
+
+        # The merged segment must keep moving forward
+        if np.dot(self.end - self.start, other.end - other.start) <= 0:
+            return False
+
+        # Distance of the joint from the merged line
+        # h = |(end - start) x (joint - start)| / |end - start|
+        merged = other.end - self.start
+        joint = self.end - self.start
+        deviation = abs(merged[0] * joint[1] - merged[1] * joint[0]) / np.linalg.norm(merged)
+
+        return deviation <= tolerance
+
+    def get_point(self, distance):
+        """
+        Returns the position a distance along the segment.
+
+        """
+        return self.start + self.get_direction() * distance
+
+    def merge(self, other):
+        self.end = other.end
+
+
+class ArcSegment(Segment):
+    """
+    Class that represents an arc move around a circle.
+    NOTE: The sweep is signed, positive sweeps are anticlockwise (G3) and negative sweeps are clockwise (G2).
+
+    """
+
+    def __init__(self, circle, start, end, sweep):
+        super().__init__(start, end)
+
+        self.circle = circle
+        self.sweep = sweep
+
+    def get_circle(self):
+        return self.circle
+
+    def get_center(self):
+        return self.circle.get_center()
+
+    def get_radius(self):
+        return self.circle.get_r()
+
+    def get_sweep(self):
+        return self.sweep
+
+    def get_length(self):
+        return self.circle.get_r() * abs(self.sweep)
+
+    def is_arc(self):
+        return True
+
+    def is_clockwise(self):
+        return self.sweep < 0
+
+    def can_merge(self, other, tolerance):
+        """
+        Checks if another arc continues this one around the same circle in the same direction.
+
+        """
+        if not other.is_arc():
+            return False
+
+        if other.get_circle() is not self.circle:
+            # Different circle objects can still describe the same circle
+            if abs(other.get_radius() - self.get_radius()) > tolerance or dist(other.get_center(), self.get_center()) > tolerance:
+                return False
+
+        # A merged arc must not reverse or wrap around the circle
+        if other.is_clockwise() != self.is_clockwise():
+            return False
+
+        return abs(self.sweep + other.get_sweep()) < 2 * np.pi
+
+    def get_point(self, distance):
+        """
+        Returns the position a distance along the arc.
+
+        """
+        start_angle = np.arctan2(self.start[1] - self.get_center()[1], self.start[0] - self.get_center()[0])
+        angle = start_angle + np.sign(self.sweep) * distance / self.get_radius()
+
+        return self.get_center() + self.get_radius() * np.array([np.cos(angle), np.sin(angle)])
+
+    def merge(self, other):
+        self.end = other.end
+        self.sweep += other.get_sweep()
+
+
+def arc_sweep(center, start, end):
+    """
+    Returns the signed angle swept from start to end around center.
+    NOTE: This is the smallest angle between the two positions (range [-pi, pi]), matching the hugging edge cost.
+
+    """
+    a = start - center
+    b = end - center
+
+    return np.arctan2(a[0] * b[1] - a[1] * b[0], a[0] * b[0] + a[1] * b[1])
+
+
+def iter_segments(path, tolerance=1e-6):
+    """
+    Yields the motion segments for a path generated by astar.
+    Consecutive collinear lines and consecutive arcs on the same circle are merged into a single segment.
+    Segments shorter than the tolerance are dropped.
+
+    """
+    pending = None
+
+    for i in range(1, len(path)):
+        previous_node = path[i - 1]
+        current_node = path[i]
+
+        start = previous_node.get_position()
+        end = current_node.get_position()
+
+        # Skip nodes at the same position
+        if dist(start, end) <= tolerance:
+            continue
+
+        circle = current_node.get_circle()
+
+        # Nodes on the same circle are connected by a hugging edge
+        if circle is previous_node.get_circle() and circle.get_r() > 0:
+            segment = ArcSegment(circle, start, end, arc_sweep(circle.get_center(), start, end))
+        else:
+            segment = LinearSegment(start, end)
+
+        if pending is not None and pending.can_merge(segment, tolerance):
+            pending.merge(segment)
+            continue
+
+        if pending is not None:
+            yield pending
+
+        pending = segment
+
+    if pending is not None:
+        yield pending
+
+
+def sample_segments(segments, distances):
+    """
+    Returns the positions at the given distances along a list of segments.
+
+    """
+    lengths = np.array([segment.get_length() for segment in segments])
+    boundaries = np.concatenate([[0], np.cumsum(lengths)])
+
+    points = np.zeros((len(distances), 2))
+    for i, distance in enumerate(np.clip(distances, 0, boundaries[-1])):
+        # Find the segment containing the distance
+        index = min(np.searchsorted(boundaries, distance, side="right") - 1, len(segments) - 1)
+
+        points[i] = segments[index].get_point(distance - boundaries[index])
+
+    return points
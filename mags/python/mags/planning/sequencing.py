@@ -0,0 +1,337 @@
+from itertools import permutations
+import numpy as np
+
+from .graph import Circle
+from .segments import LinearSegment
+from .utils import dist
+
+# Above this many relocations the order is chosen greedily instead of trying every permutation
+MAX_EXHAUSTIVE_RELOCATIONS = 5
+
+
+class Relocation:
+    """
+    Class that represents a piece being dragged from one position to another with the electromagnet on.
+
+    The keys identify the occupied positions (e.g. "e2") so the obstacles can be updated as the pieces move.
+    A goal key of None means the piece leaves the board (e.g. into the capture area) and stops being an obstacle.
+    A start key of None means the piece comes from off the board (e.g. out of the capture area).
+
+    """
+
+    def __init__(self, start_key, start_position, goal_key, goal_position, label=None):
+        self.start_key = start_key
+        self.start_position = np.asarray(start_position, dtype=float)
+
+        self.goal_key = goal_key
+        self.goal_position = np.asarray(goal_position, dtype=float)
+
+        self.label = label
+
+    def get_start_key(self):
+        return self.start_key
+
+    def get_start_position(self):
+        return self.start_position
+
+    def get_goal_key(self):
+        return self.goal_key
+
+    def get_goal_position(self):
+        return self.goal_position
+
+    def get_label(self):
+        return self.label
+
+    def __repr__(self):
+        return "Relocation({} -> {})".format(self.start_key, self.goal_key)
+
+
+class PlannedAction:
+    """
+    Class that stores the planned motion for a relocation.
+    The approach is the idle (electromagnet off) move from the previous head position to the start of the path.
+
+    """
+
+    def __init__(self, relocation, approach, approach_time, path, path_time, path_length):
+        self.relocation = relocation
+
+        self.approach = approach
+        self.approach_time = approach_time
+
+        self.path = path
+        self.path_time = path_time
+        self.path_length = path_length
+
+    def get_relocation(self):
+        return self.relocation
+
+    def get_approach(self):
+        return self.approach
+
+    def get_approach_time(self):
+        return self.approach_time
+
+    def get_approach_length(self):
+        return self.approach.get_length()
+
+    def get_path(self):
+        return self.path
+
+    def get_path_time(self):
+        return self.path_time
+
+    def get_path_length(self):
+        return self.path_length
+
+    def get_time(self):
+        return self.approach_time + self.path_time
+
+
+class ActionPlan:
+    """
+    Class that stores an ordered sequence of planned actions and the optional return move of the head.
+
+    """
+
+    def __init__(self, actions, return_move=None, return_time=0.0):
+        self.actions = actions
+
+        self.return_move = return_move
+        self.return_time = return_time
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def get_actions(self):
+        return self.actions
+
+    def get_return_move(self):
+        return self.return_move
+
+    def get_return_time(self):
+        return self.return_time
+
+    def get_paths(self):
+        return [action.get_path() for action in self.actions]
+
+    def get_idle_distance(self):
+        """
+        Returns the distance travelled with the electromagnet off.
+
+        """
+        distance = sum(action.get_approach_length() for action in self.actions)
+
+        if self.return_move is not None:
+            distance += self.return_move.get_length()
+
+        return distance
+
+    def get_loaded_distance(self):
+        """
+        Returns the distance travelled while dragging pieces.
+
+        """
+        return sum(action.get_path_length() for action in self.actions)
+
+    def get_distance(self):
+        return self.get_idle_distance() + self.get_loaded_distance()
+
+    def get_time(self):
+        """
+        Returns the estimated execution time of the plan in seconds.
+
+        """
+        return sum(action.get_time() for action in self.actions) + self.return_time
+
+    def get_end_position(self, head_position):
+        """
+        Returns the head position after the plan has been executed.
+
+        """
+        if self.return_move is not None:
+            return self.return_move.get_end()
+
+        if len(self.actions) == 0:
+            return head_position
+
+        return self.actions[-1].get_relocation().get_goal_position()
+
+    def get_report(self):
+        """
+        Returns a summary of the travel of the plan.
+
+        """
+        return {
+            "actions": len(self.actions),
+            "distance": float(self.get_distance()),
+            "idle_distance": float(self.get_idle_distance()),
+            "loaded_distance": float(self.get_loaded_distance()),
+            "time": float(self.get_time()),
+        }
+
+
+class ActionPlanner:
+    """
+    Orders and plans a set of relocations so the total execution time is minimized.
+
+    The obstacles evolve as the relocations are executed, a relocation can only be executed once its goal is free.
+    Every valid order is evaluated (or a greedy order for large sets) including the idle approach moves between relocations.
+
+    """
+
+    def __init__(self, plan_path, measure_path, motion_profile, clearance_radius):
+        # Callables to plan a path around a list of obstacle circles and to estimate its (time, length)
+        self.plan_path = plan_path
+        self.measure_path = measure_path
+
+        self.motion_profile = motion_profile
+        self.clearance_radius = clearance_radius
+
+    def get_idle_move(self, start, goal):
+        """
+        Returns the idle move between two positions and its estimated time.
+        NOTE: The electromagnet is off, so the head can move straight under the pieces.
+
+        """
+        move = LinearSegment(start, goal)
+
+        if move.get_length() == 0:
+            return move, 0.0
+
+        return move, self.motion_profile.profile([move], magnet_on=False).get_time()
+
+    def get_obstacles(self, occupied, relocation):
+        """
+        Returns the obstacle circles for a relocation given the occupied positions.
+
+        """
+        return [Circle(self.clearance_radius, position) for key, position in occupied.items() if key != relocation.get_start_key()]
+
+    @staticmethod
+    def is_feasible(occupied, relocation):
+        """
+        Checks if a relocation can be executed with the current occupied positions.
+
+        """
+        if relocation.get_start_key() is not None and relocation.get_start_key() not in occupied:
+            return False
+
+        return relocation.get_goal_key() is None or relocation.get_goal_key() not in occupied
+
+    @staticmethod
+    def apply(occupied, relocation):
+        """
+        Returns the occupied positions after a relocation has been executed.
+
+        """
+        occupied = occupied.copy()
+        occupied.pop(relocation.get_start_key(), None)
+
+        if relocation.get_goal_key() is not None:
+            occupied[relocation.get_goal_key()] = relocation.get_goal_position()
+
+        return occupied
+
+    def plan(self, relocations, occupied, head_position, park_position=None):
+        """
+        Plans the relocations in the order with the lowest total time.
+        Returns an ActionPlan or None if no valid order exists.
+
+        """
+        # Paths only depend on which relocations were executed before them, so they are cached between orders
+        cache = {}
+
+        if len(relocations) > MAX_EXHAUSTIVE_RELOCATIONS:
+            return self.evaluate(relocations, self.greedy_order(relocations, occupied, head_position), occupied, head_position, park_position, cache)
+
+        best_plan = None
+        for order in permutations(range(len(relocations))):
+            plan = self.evaluate(relocations, order, occupied, head_position, park_position, cache)
+
+            if plan is not None and (best_plan is None or plan.get_time() < best_plan.get_time()):
+                best_plan = plan
+
+        return best_plan
+
+    def evaluate(self, relocations, order, occupied, head_position, park_position=None, cache=None):
+        """
+        Plans the relocations in a given order.
+        Returns an ActionPlan or None if a relocation is not feasible or has no path when it is reached.
+
+        NOTE: The cache is keyed by the relocation index and the set of relocations executed before it.
+
+        """
+        if cache is None:
+            cache = {}
+
+        current_occupied = occupied
+        current_position = np.asarray(head_position, dtype=float)
+        done = frozenset()
+
+        actions = []
+        for index in order:
+            relocation = relocations[index]
+
+            if not self.is_feasible(current_occupied, relocation):
+                return None
+
+            approach, approach_time = self.get_idle_move(current_position, relocation.get_start_position())
+
+            key = (index, done)
+            if key not in cache:
+                try:
+                    path = self.plan_path(self.get_obstacles(current_occupied, relocation), relocation.get_start_position(), relocation.get_goal_position())
+                    cache[key] = (path, *self.measure_path(path))
+                except RuntimeError as error:
+                    # The pieces block the relocation in this order, other orders may still have a path
+                    print("Order Rejected: {}".format(error))
+                    cache[key] = None
+
+            if cache[key] is None:
+                return None
+
+            path, path_time, path_length = cache[key]
+
+            actions.append(PlannedAction(relocation, approach, approach_time, path, path_time, path_length))
+
+            current_occupied = self.apply(current_occupied, relocation)
+            current_position = relocation.get_goal_position()
+            done = done | {index}
+
+        if park_position is not None:
+            return_move, return_time = self.get_idle_move(current_position, park_position)
+            return ActionPlan(actions, return_move, return_time)
+
+        return ActionPlan(actions)
+
+    def greedy_order(self, relocations, occupied, head_position):
+        """
+        Orders the relocations by repeatedly picking the feasible relocation with the closest start.
+
+        """
+        remaining = list(range(len(relocations)))
+        current_position = np.asarray(head_position, dtype=float)
+
+        order = []
+        while len(remaining) > 0:
+            feasible = [index for index in remaining if self.is_feasible(occupied, relocations[index])]
+
+            # No relocation can be executed, return the incomplete order so the plan is rejected
+            if len(feasible) == 0:
+                return order + remaining
+
+            index = min(feasible, key=lambda i: dist(current_position, relocations[i].get_start_position()))
+
+            order.append(index)
+            remaining.remove(index)
+
+            occupied = self.apply(occupied, relocations[index])
+            current_position = relocations[index].get_goal_position()
+
+        return order
+
@@ -0,0 +1,373 @@
+import time
+import numpy as np
+
+from .motion import MotionProfile
+from .segments import LinearSegment, iter_segments, sample_segments
+
+# CasADi is an optional dependency, only needed when trajectories are optimized
+# NOTE: It is imported by the first optimizer, importing it takes longer than the rest of the planning core
+ca = None
+
+
+def import_casadi():
+    """
+    Imports CasADi on first use.
+
+    """
+    global ca
+
+    if ca is None:
+        try:
+            import casadi
+        except ImportError:
+            raise ImportError("casadi is required to optimize trajectories. Install it with `pip install casadi`.")
+
+        ca = casadi
+
+    return ca
+
+# Position used for unused obstacle slots, far away from the board so the constraint is never active
+UNUSED_OBSTACLE_POSITION = 1e6
+
+# Distance in mm a step of an optimized trajectory may cut into an obstacle, the tolerance of the solver
+CLEARANCE_TOLERANCE = 1e-3
+
+
+def find_clearance_violation(positions, circles):
+    """
+    Finds the deepest distance that the line segments between consecutive positions cut into the circles.
+    Returns 0 if no segment intersects a circle.
+
+    """
+    if len(circles) == 0 or len(positions) < 2:
+        return 0.0
+
+    centers = np.array([circle.get_center() for circle in circles], dtype=float)
+    radii = np.array([circle.get_r() for circle in circles], dtype=float)
+
+    pos1 = positions[:-1]
+    direction = positions[1:] - pos1
+    length_squared = np.maximum(np.sum(direction**2, axis=1), 1e-12)
+
+    # The closest point of each segment to each circle center
+    t = np.einsum("scd,sd->sc", centers[None, :, :] - pos1[:, None, :], direction) / length_squared[:, None]
+    t = np.clip(t, 0, 1)
+
+    closest = pos1[:, None, :] + t[:, :, None] * direction[:, None, :]
+    distances = np.linalg.norm(centers[None, :, :] - closest, axis=2)
+
+    return max(float(np.max(radii[None, :] - distances)), 0.0)
+
+
+class Trajectory:
+    """
+    Class that represents a time parameterized trajectory.
+    Stores the positions and velocities at evenly spaced time steps.
+
+    NOTE: If the optimization failed the trajectory stores the raw astar path instead.
+
+    """
+
+    def __init__(self, path, positions=None, velocities=None, dt=None, solve_time=0.0, status=None):
+        self.path = path
+
+        self.positions = positions
+        self.velocities = velocities
+        self.dt = dt
+
+        self.solve_time = solve_time
+        self.status = status
+
+    def is_optimized(self):
+        return self.positions is not None
+
+    def get_path(self):
+        return self.path
+
+    def get_positions(self):
+        return self.positions
+
+    def get_velocities(self):
+        return self.velocities
+
+    def get_dt(self):
+        return self.dt
+
+    def get_time(self):
+        """
+        Returns the total time of the trajectory.
+
+        """
+        if not self.is_optimized():
+            return None
+
+        return self.dt * (len(self.positions) - 1)
+
+    def get_solve_time(self):
+        return self.solve_time
+
+    def get_status(self):
+        return self.status
+
+    def get_start(self):
+        if not self.is_optimized():
+            return self.path[0].get_position()
+
+        return self.positions[0]
+
+    def iter_segments(self, tolerance=1e-6):
+        """
+        Yields (segment, feedrate) pairs for the line segments between the trajectory positions.
+        The feedrate is the average speed over each time step in mm/min.
+        Collinear steps at the same feedrate are merged.
+
+        """
+        pending = None
+        pending_feedrate = None
+
+        for i in range(1, len(self.positions)):
+            segment = LinearSegment(self.positions[i - 1], self.positions[i])
+
+            length = segment.get_length()
+            if length <= tolerance:
+                continue
+
+            feedrate = length / self.dt * 60
+
+            if pending is not None and abs(feedrate - pending_feedrate) <= tolerance * pending_feedrate and pending.can_merge(segment, tolerance):
+                pending.merge(segment)
+                continue
+
+            if pending is not None:
+                yield pending, pending_feedrate
+
+            pending = segment
+            pending_feedrate = feedrate
+
+        if pending is not None:
+            yield pending, pending_feedrate
+
+
+class TrajectoryOptimizer:
+    """
+    Smooths astar paths into minimum time trajectories.
+
+    The trajectory is found with a direct multiple shooting problem on a double integrator, solved with IPOPT:
+    1. The astar path is resampled to warm start the positions, velocities and time step
+    2. The obstacle circles of the board are enforced at every time step, inflated so the straight steps between the samples also keep clear
+    3. The speed and acceleration are limited by the motion profile of a dragged piece
+    4. The trajectory stays within a corridor around the warm start so it cannot jump to a worse route around the pieces
+
+    The problem is built once with the start, goal and obstacles as parameters, so repeated solves only pay for the solve itself.
+    If the solve fails, exceeds the time budget or a step still cuts into an obstacle, the raw astar path is returned instead.
+    NOTE: All dimensions are in mm and all times are in seconds.
+
+    """
+
+    def __init__(self, motion_profile=None, n_steps=60, max_obstacles=32, max_solve_time=0.5, corridor=20):
+        import_casadi()
+
+        if motion_profile is None:
+            motion_profile = MotionProfile()
+        self.motion_profile = motion_profile
+
+        # The limits of a dragged piece
+        self.max_speed = min(motion_profile.max_speed, motion_profile.slip_speed)
+        self.max_accel = motion_profile.get_accel(magnet_on=True)
+
+        self.n_steps = n_steps
+        self.max_obstacles = max_obstacles
+        self.max_solve_time = max_solve_time
+
+        # Maximum distance from the warm start, keeps the trajectory in the same corridor between the pieces as the astar path
+        self.corridor = corridor
+
+        self.opti = None
+
+    def build(self):
+        """
+        Builds the optimization problem.
+        NOTE: This is called automatically by the first optimization.
+
+        """
+        N = self.n_steps
+
+        # The problem is solved in scaled units to keep it well conditioned
+        # Lengths are scaled so the speed and acceleration limits are both 1
+        # length_scale = v^2 / a, time_scale = v / a
+        self.length_scale = self.max_speed**2 / self.max_accel
+        self.time_scale = self.max_speed / self.max_accel
+
+        opti = ca.Opti()
+
+        # State variables
+        X = opti.variable(4, N + 1)
+
+        # Control variables
+        U = opti.variable(2, N)
+
+        dt = opti.variable()
+
+        # Parameters
+        start = opti.parameter(2)
+        goal = opti.parameter(2)
+
+        obstacles = opti.parameter(2, self.max_obstacles)
+        radii = opti.parameter(self.max_obstacles)
+
+        guess = opti.parameter(2, N + 1)
+
+        # Minimize the total time
+        opti.minimize(dt * N)
+
+        # Dynamic model (double integrator)
+        opti.subject_to(X[:2, 1:] == X[:2, :-1] + dt * X[2:, :-1])
+        opti.subject_to(X[2:, 1:] == X[2:, :-1] + dt * U)
+
+        # Speed and acceleration constraints
+        opti.subject_to(ca.sum1(X[2:, :]**2) <= 1)
+        opti.subject_to(ca.sum1(U**2) <= 1)
+
+        opti.subject_to(opti.bounded(1e-3, dt, 100))
+
+        # Obstacle constraints
+        # A step is at most dt long at the speed limit, a chord of length dt with both ends outside a radius of sqrt(r^2 + (dt / 2)^2) stays outside r
+        for j in range(self.max_obstacles):
+            opti.subject_to((X[0, 1:-1] - obstacles[0, j])**2 + (X[1, 1:-1] - obstacles[1, j])**2 >= radii[j]**2 + (dt / 2)**2)
+
+        # Corridor constraints
+        opti.subject_to(ca.sum1((X[:2, :] - guess)**2) <= (self.corridor / self.length_scale)**2)
+
+        # Boundary conditions, start and end at rest
+        opti.subject_to(X[:2, 0] == start)
+        opti.subject_to(X[2:, 0] == 0)
+
+        opti.subject_to(X[:2, -1] == goal)
+        opti.subject_to(X[2:, -1] == 0)
+
+        opti.solver("ipopt", {"print_time": False}, {"print_level": 0, "max_cpu_time": self.max_solve_time, "sb": "yes"})
+
+        self.opti = opti
+
+        self.X = X
+        self.U = U
+        self.dt = dt
+
+        self.start = start
+        self.goal = goal
+        self.obstacles = obstacles
+        self.radii = radii
+        self.guess = guess
+
+    def warm_start(self, path):
+        """
+        Generates the initial guess from an astar path.
+        The path is sampled in time along a trapezoidal velocity profile.
+        Returns the positions, velocities and time step.
+
+        """
+        segments = list(iter_segments(path))
+
+        length = sum(segment.get_length() for segment in segments)
+
+        v = self.max_speed
+        a = self.max_accel
+
+        # Check if the cruise speed can be reached
+        if v**2 / a > length:
+            v = np.sqrt(a * length)
+
+        accel_time = v / a
+        accel_distance = v**2 / (2 * a)
+        total_time = 2 * accel_time + (length - 2 * accel_distance) / v
+
+        dt = total_time / self.n_steps
+
+        # Distance and speed along the path at each time step
+        times = np.linspace(0, total_time, self.n_steps + 1)
+        distances = np.where(
+            times < accel_time,
+            0.5 * a * times**2,
+            np.where(
+                times < total_time - accel_time,
+                accel_distance + v * (times - accel_time),
+                length - 0.5 * a * (total_time - times)**2
+            )
+        )
+
+        positions = sample_segments(segments, distances)
+
+        velocities = np.gradient(positions, dt, axis=0)
+        velocities[0] = 0
+        velocities[-1] = 0
+
+        return positions, velocities, dt
+
+    def optimize(self, path, circles):
+        """
+        Optimizes an astar path around a list of obstacle circles.
+
+        """
+        # A path without any motion cannot be optimized
+        if len(path) < 2 or all(segment.get_length() == 0 for segment in iter_segments(path)):
+            return Trajectory(path, status="Empty Path")
+
+        if len(circles) > self.max_obstacles:
+            return Trajectory(path, status="Too Many Obstacles")
+
+        if self.opti is None:
+            self.build()
+
+        # Set the parameters
+        self.opti.set_value(self.start, path[0].get_position() / self.length_scale)
+        self.opti.set_value(self.goal, path[-1].get_position() / self.length_scale)
+
+        obstacles = np.full((2, self.max_obstacles), UNUSED_OBSTACLE_POSITION)
+        radii = np.zeros(self.max_obstacles)
+        for j, circle in enumerate(circles):
+            obstacles[:, j] = circle.get_center()
+            radii[j] = circle.get_r()
+
+        self.opti.set_value(self.obstacles, obstacles / self.length_scale)
+        self.opti.set_value(self.radii, radii / self.length_scale)
+
+        # Warm start from the astar path
+        positions, velocities, dt = self.warm_start(path)
+
+        velocity_scale = self.length_scale / self.time_scale
+
+        self.opti.set_value(self.guess, positions.T / self.length_scale)
+
+        self.opti.set_initial(self.X, np.vstack([positions.T / self.length_scale, velocities.T / velocity_scale]))
+        self.opti.set_initial(self.U, np.zeros((2, self.n_steps)))
+        self.opti.set_initial(self.dt, dt / self.time_scale)
+
+        start_time = time.perf_counter()
+
+        try:
+            solution = self.opti.solve()
+        except RuntimeError:
+            # The solve failed or hit the time budget, fall back to the raw path
+            status = self.opti.stats()["return_status"]
+            return Trajectory(path, solve_time=time.perf_counter() - start_time, status=status)
+
+        solve_time = time.perf_counter() - start_time
+
+        # Convert the solution back to mm and seconds
+        X = solution.value(self.X)
+
+        positions = X[:2, :].T * self.length_scale
+        velocities = X[2:, :].T * self.length_scale / self.time_scale
+        dt = solution.value(self.dt) * self.time_scale
+
+        # The first and last steps start on the unconstrained ends, so the steps are checked against the exact circles
+        if find_clearance_violation(positions, circles) > CLEARANCE_TOLERANCE:
+            return Trajectory(path, solve_time=solve_time, status="Obstacle Collision")
+
+        trajectory = Trajectory(path, positions, velocities, dt, solve_time, self.opti.stats()["return_status"])
+
+        # Only use the trajectory if it is faster than tracing the raw path
+        if trajectory.get_time() >= self.motion_profile.profile(iter_segments(path)).get_time():
+            return Trajectory(path, solve_time=solve_time, status="Not Improved")
+
+        return trajectory
@@ -0,0 +1,160 @@
+import chess
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.patches import Circle
+import numpy as np
+
+from .raster import get_renderer
+from .utils import v2v_angle
+
+# The debug plots of the planning core
+# NOTE: This module imports matplotlib and PIL, the plot methods of the planning classes only import it on first use
+
+# Number of points an arc is sampled with
+ARC_RESOLUTION = 32
+
+
+def sample_arcs(centers, radii, theta1, theta2, resolution=ARC_RESOLUTION):
+    """
+    Samples arcs going counterclockwise from theta1 to theta2 (radians) as polylines.
+    Returns an array of shape (arcs, resolution, 2) for a LineCollection.
+
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=float).reshape(-1, 1)
+    theta1 = np.asarray(theta1, dtype=float).reshape(-1, 1)
+    theta2 = np.asarray(theta2, dtype=float).reshape(-1, 1)
+
+    # Angles of the points of each arc
+    angles = theta1 + (theta2 - theta1) * np.linspace(0, 1, resolution)
+
+    return centers[:, None, :] + radii[:, :, None] * np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+
+
+def plot_circles(ax, centers, radii, **kwargs):
+    """
+    Plots unfilled circles as a single collection.
+
+    """
+    patches = [Circle(center, r) for center, r in zip(centers, radii)]
+    ax.add_collection(PatchCollection(patches, facecolor="none", **kwargs))
+
+
+def plot_graph(ax, graph, simplify=True):
+    """
+    Plots a graph on the given axes.
+
+    """
+    # Set square aspect ratio
+    ax.set_aspect("equal")
+
+    # Plot the circles
+    circles = list(graph.get_circles().values())
+    plot_circles(ax, [circle.get_center() for circle in circles], [circle.get_r() for circle in circles], edgecolor="black")
+
+    if simplify:
+        ax.autoscale_view()
+        return
+
+    # Plot the surfing edge lines
+    edges = graph.surfing_edges + graph.tangent_edges
+    if len(edges) > 0:
+        segments = np.array([[edge.get_first().get_position(), edge.get_second().get_position()] for edge in edges])
+        ax.add_collection(LineCollection(segments, colors="b"))
+
+    # Plot the hugging edge arcs
+    edges = graph.hugging_edges[::2]
+    if len(edges) > 0:
+        first = np.array([edge.get_first().get_position() for edge in edges])
+        second = np.array([edge.get_second().get_position() for edge in edges])
+        centers = np.array([edge.get_first().get_circle().get_center() for edge in edges])
+        radii = np.array([edge.get_first().get_circle().get_r() for edge in edges])
+
+        # For plotting we will first transform the angles to be in the range [0, 2pi)
+        arc_start = np.mod(np.arctan2(first[:, 1] - centers[:, 1], first[:, 0] - centers[:, 0]), 2 * np.pi)
+        arc_end = np.mod(np.arctan2(second[:, 1] - centers[:, 1], second[:, 0] - centers[:, 0]), 2 * np.pi)
+
+        arcs = sample_arcs(centers, radii, np.minimum(arc_start, arc_end), np.maximum(arc_start, arc_end))
+        ax.add_collection(LineCollection(arcs, colors="g"))
+
+        # Plot the start and end points
+        ax.plot(first[:, 0], first[:, 1], "r*", linestyle="none")
+        ax.plot(second[:, 0], second[:, 1], "g*", linestyle="none")
+
+    ax.autoscale_view()
+
+
+def plot_path(ax, path, piece_diameter=None):
+    """
+    Plots a path generated by astar on the given axes.
+
+    """
+    if len(path) == 0:
+        return
+
+    positions = np.array([node.get_position() for node in path], dtype=float)
+
+    # Split the path into surfing edges and hugging edges
+    segments = []
+    centers = []
+    radii = []
+    theta1 = []
+    theta2 = []
+
+    for node, next_node in zip(path[:-1], path[1:]):
+        if node.get_circle() == next_node.get_circle():
+            # Hugging Edge
+            circle = node.get_circle()
+
+            # Get the angle between the two nodes
+            arc_start = v2v_angle(circle.get_center(), node.get_position())
+            arc_end = v2v_angle(circle.get_center(), next_node.get_position())
+
+            centers.append(circle.get_center())
+            radii.append(circle.get_r())
+            theta1.append(min(arc_start, arc_end))
+            theta2.append(max(arc_start, arc_end))
+        else:
+            # Surfing Edge
+            segments.append([node.get_position(), next_node.get_position()])
+
+    if len(centers) > 0:
+        segments.extend(sample_arcs(centers, radii, theta1, theta2))
+
+    if len(segments) > 0:
+        ax.add_collection(LineCollection(segments, colors="orange", linewidths=4))
+
+    # Plot the piece at the nodes
+    if piece_diameter is not None:
+        plot_circles(ax, positions, [piece_diameter / 2] * len(positions), edgecolor="orange")
+
+    # Plot the star and end points in different colors
+    ax.plot(positions[0, 0], positions[0, 1], color="lightcoral", marker="o")
+    if len(path) > 1:
+        ax.plot(positions[-1, 0], positions[-1, 1], color="mediumpurple", marker="o")
+
+    ax.autoscale_view()
+
+
+def plot_background(ax, board):
+    """
+    Plots the squares of a PhysicalBoard as the background.
+
+    """
+    # The rendered positions are cached, replotting a position only draws the image
+    image = get_renderer().render(board.board.fen())
+
+    ax.imshow(image, extent=[0, board.width, 0, board.length])
+
+
+def plot_board(ax, board):
+    """
+    Plots the pieces of a PhysicalBoard.
+
+    """
+    squares = list(board.board.piece_map().keys())
+
+    # The BCS index of a square is (file, rank)
+    positions = board.square_positions[[chess.square_file(square) for square in squares], [chess.square_rank(square) for square in squares]]
+
+    # Plot a circle at the position of each piece
+    plot_circles(ax, positions, [board.piece_diameter / 2] * len(squares), edgecolor="green")
@@ -0,0 +1,87 @@
+import time
+
+
+class PrinterStatus():
+    """
+    A class to keep a local copy of the klipper objects subscribed through moonraker (printer.objects.subscribe).
+    Moonraker only sends the fields that changed, so the updates are merged into the copy.
+
+    NOTE: Moonraker keeps a single subscription per connection, so all of the objects should be subscribed through one PrinterStatus.
+    """
+
+    def __init__(self, moonraker, objects):
+        self.moonraker = moonraker
+
+        # The subscribed objects and their fields (None subscribes all fields)
+        self.objects = objects
+
+        self.status = {}
+
+        # Klipper's time of the last update and the local time it was received
+        self.eventtime = None
+        self.update_time = None
+
+        self.listeners = []
+
+        moonraker.subscribe("notify_status_update", self.update)
+
+    async def subscribe(self):
+        """
+        Subscribes to the objects and stores their current state.
+        NOTE: This has to be repeated after reconnecting.
+        """
+        result = await self.moonraker.request("printer.objects.subscribe", {"objects": self.objects})
+
+        self.status = {}
+        self.update(result["status"], result["eventtime"])
+
+    async def refresh(self, objects=None):
+        """
+        Queries the current state of the objects instead of waiting for the next update.
+        If no objects are given all of the subscribed objects are queried.
+        """
+        if objects is None:
+            objects = self.objects
+
+        result = await self.moonraker.request("printer.objects.query", {"objects": objects})
+
+        self.update(result["status"], result["eventtime"])
+
+    def update(self, status, eventtime):
+        """
+        Merges a status update into the local copy and notifies the listeners.
+        """
+        for name, fields in status.items():
+            self.status.setdefault(name, {}).update(fields)
+
+        self.eventtime = eventtime
+        self.update_time = time.monotonic()
+
+        for listener in list(self.listeners):
+            listener(self)
+
+    def get(self, name, field, default=None):
+        """
+        Get a field of a subscribed object.
+        """
+        return self.status.get(name, {}).get(field, default)
+
+    def get_age(self):
+        """
+        Get the time in seconds since the last update or None if no update has been received.
+        """
+        if self.update_time is None:
+            return None
+
+        return time.monotonic() - self.update_time
+
+    def add_listener(self, listener):
+        """
+        Calls the listener with this status after every update.
+        NOTE: The listener is called on the event loop of the moonraker client and should not block.
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
@@ -0,0 +1,106 @@
+import os
+from threading import Lock
+
+import numpy as np
+
+# A scan is stored as its time and its 64 bit occupancy bitboard (see matrix_scanner.board_to_bitboard)
+SCAN_DTYPE = np.dtype([("timestamp", "<f8"), ("occupancy", "<u8")])
+
+HISTORY_SIZE = 8192 # Scans, about 80 seconds of scanning at the full scan rate
+
+
+class ScanHistory():
+    """
+    A fixed size ring buffer of the most recent scans of the reed switch matrix.
+    The scans are stored in a preallocated numpy array, so recording a scan never allocates.
+
+    NOTE: The scanner thread records while other threads read or flush, the buffer is guarded by a lock.
+    """
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.scans = np.zeros(size, dtype=SCAN_DTYPE)
+
+        # The total number of scans recorded and the number of them written to a log
+        self.count = 0
+        self.flushed = 0
+
+        self.lock = Lock()
+
+    def record(self, timestamp, occupancy):
+        with self.lock:
+            index = self.count % len(self.scans)
+
+            self.scans[index]["timestamp"] = timestamp
+            self.scans[index]["occupancy"] = occupancy
+
+            self.count += 1
+
+    def get_scans(self, count=None):
+        """
+        Get a copy of the most recent scans (all scans in the buffer by default) in chronological order.
+        """
+        with self.lock:
+            return self.get_last(min(self.count, len(self.scans)) if count is None else count)
+
+    def get_last(self, count):
+        # NOTE: The lock has to be held
+        count = min(count, self.count, len(self.scans))
+
+        end = self.count % len(self.scans)
+        indicies = np.arange(end - count, end) % len(self.scans)
+
+        return self.scans[indicies]
+
+    def flush(self, log):
+        """
+        Appends the scans recorded since the last flush to a log.
+        Returns the number of scans that were overwritten before they could be flushed.
+        """
+        with self.lock:
+            pending = self.count - self.flushed
+            dropped = max(0, pending - len(self.scans))
+
+            scans = self.get_last(pending)
+            self.flushed = self.count
+
+        log.append(scans)
+
+        return dropped
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+            self.flushed = 0
+
+
+class ScanLog():
+    """
+    An append-only binary log of scans.
+    The file is a flat array of SCAN_DTYPE records without a header, so it can be memory mapped for analysis with load_scans.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, scans):
+        if len(scans) == 0:
+            return
+
+        with open(self.path, "ab") as file:
+            file.write(np.ascontiguousarray(scans, dtype=SCAN_DTYPE).tobytes())
+
+    def get_count(self):
+        if not os.path.exists(self.path):
+            return 0
+
+        return os.path.getsize(self.path) // SCAN_DTYPE.itemsize
+
+
+def load_scans(path):
+    """
+    Memory maps the scans of a log (read only).
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=SCAN_DTYPE)
+
+    return np.memmap(path, dtype=SCAN_DTYPE, mode="r")
@@ -12,8 +12,18 @@ var gameState = GameState.IDLE;
 // Socket.io setup
 var socket = io();
 
+// The table this client plays on, e.g. /?board=table-2
+var boardId = new URLSearchParams(window.location.search).get("board") || "default";
+
+// Join the room of the table on every (re)connect, the server replies with the current position and occupancy
+socket.on("connect", function() {
+    occupancySequence = 0;
+    geometrySequence = 0;
+    socket.emit("join", {board: boardId});
+});
+
 function onDrop(source, target, piece, newPos, oldPos, orientation) {
-    socket.emit("move", source + target);
+    socket.emit("move", {board: boardId, move: source + target});
 }
 
 // Setup and config for chessboard.js
@@ -28,10 +38,29 @@ var board = Chessboard("board", {
 socket.on("update", function(data) {
     console.log(data);
     board.position(data);
+    update_image(data);
+});
+
+// Job events of the server, every start, end and move runs as a job
+["job_queued", "job_started", "job_progress", "job_done", "job_failed", "job_stale"].forEach(function(event) {
+    socket.on(event, function(job) {
+        console.log(event, job.id, job.kind, Math.round(job.progress * 100) + "%", job.error || "");
+    });
 });
 
-socket.on("update_binary_board", function(data) {
-    update_binary_board(data);
+// Occupancy feed of the reed switches, only sent when the occupancy changes
+var occupancySequence = 0;
+var occupancy = [0, 0]; // Low (a1 - h4) and high (a5 - h8) 32 bits of the bitboard
+
+socket.on("occupancy", function(data) {
+    update_occupancy(data);
+});
+
+// Geometry of the planned turns, sent once per plan
+var geometrySequence = 0;
+
+socket.on("geometry", function(data) {
+    draw_geometry(data);
 });
 
 // var source = new EventSource("/game_state");
@@ -51,39 +80,159 @@ socket.on("update_binary_board", function(data) {
 // Publishers for buttons
 // Start game button publisher
 document.getElementById("startBtn").onclick = function() {
-    socket.emit("start");
+    socket.emit("start", {board: boardId});
 }
 
 // End game button publisher
 document.getElementById("endBtn").onclick = function() {
-    socket.emit("end");
+    socket.emit("end", {board: boardId});
 }
 
-function update_binary_board(data) {
-    // Load the data json
-    var data = JSON.parse(data);
+// Rendered position in the visualize tab, only reloaded when the pieces moved
+var imagePlacement = null;
+
+function update_image(fen) {
+    var placement = fen.split(" ")[0];
+
+    if (placement == imagePlacement) {
+        return;
+    }
+    imagePlacement = placement;
+
+    // The server answers with a 304 if the browser already has the image of the position
+    document.getElementById("boardImage").src = "/boards/" + encodeURIComponent(boardId) + "/image.png?placement=" + encodeURIComponent(placement);
+}
+
+function update_occupancy(data) {
+    // Frame: sequence number (uint32) followed by the occupancy bitboard (uint64), little-endian
+    var view = new DataView(data);
+
+    var sequence = view.getUint32(0, true);
 
-    // Get all of the squares
-    var raw_squares = document.getElementsByClassName("visualizer-node");
+    // Drop frames that arrive after a newer one, the sequence is reset when the client joins
+    if (sequence <= occupancySequence) {
+        return;
+    }
+    occupancySequence = sequence;
+
+    var next = [view.getUint32(4, true), view.getUint32(8, true)];
 
-    // Loop through all of the squares
-    for (var i = 0; i < raw_squares.length; i++) {
-        // Get the square
-        var square = raw_squares[i];
+    // Only patch the squares that changed
+    for (var half = 0; half < 2; half++) {
+        var changed = (occupancy[half] ^ next[half]) >>> 0;
 
-        // Get the square's id
-        var squareId = square.id;
+        while (changed != 0) {
+            // Lowest changed bit
+            var bit = 31 - Math.clz32(changed & -changed);
+            changed = (changed & (changed - 1)) >>> 0;
 
-        // Get the square's value
-        var squareValue = data[squareId.split("-")[1]];
+            var square = half * 32 + bit;
+            var file = square % 8;
+            var rank = Math.floor(square / 8);
 
-        // Set the square's color
-        if (squareValue == 1) {
-            square.className = "btn btn-primary visualizer-node m-6";
-        } else {
-            square.className = "btn btn-secondary visualizer-node m-6";
+            // Visualizer nodes are square-<column><row> with the columns from file a and the rows from rank 8
+            var node = document.getElementById("square-" + file.toString() + (7 - rank).toString());
+
+            if ((next[half] >>> bit) & 1) {
+                node.className = "btn btn-primary visualizer-node m-6";
+            } else {
+                node.className = "btn btn-secondary visualizer-node m-6";
+            }
         }
     }
+
+    occupancy = next;
+}
+
+// Section kinds of a geometry frame and the number of float32 values per item
+const GeometryKind = Object.freeze({
+    "CIRCLES": 0, // cx, cy, r
+    "LINES": 1, // x1, y1, x2, y2
+    "ARCS": 2, // cx, cy, r, start angle, signed sweep
+    "POLYLINE": 3 // x, y of each point
+});
+const KIND_STRIDES = [3, 4, 5, 2];
+
+// Style of each layer: obstacles, graph, approach moves, paths
+const LAYER_STYLES = [
+    {color: "rgba(108, 117, 125, 0.8)", width: 1},
+    {color: "rgba(13, 110, 253, 0.25)", width: 0.5},
+    {color: "rgba(108, 117, 125, 0.9)", width: 1, dash: [4, 4]},
+    {color: "rgba(253, 126, 20, 0.9)", width: 4}
+];
+
+function draw_geometry(data) {
+    // Frame: sequence (uint32), section count (uint16), reserved (uint16), board width and length in mm (float32), little-endian
+    var view = new DataView(data);
+
+    var sequence = view.getUint32(0, true);
+
+    // Drop frames that arrive after a newer one, the sequence is reset when the client joins
+    if (sequence <= geometrySequence) {
+        return;
+    }
+    geometrySequence = sequence;
+
+    var count = view.getUint16(4, true);
+    var width = view.getFloat32(8, true);
+    var length = view.getFloat32(12, true);
+
+    // Cover the chessboard, the squares fill the whole board
+    var canvas = document.getElementById("geometryCanvas");
+    var boardNode = document.getElementById("board");
+    canvas.width = boardNode.clientWidth;
+    canvas.height = boardNode.clientHeight;
+
+    var context = canvas.getContext("2d");
+    context.setTransform(1, 0, 0, 1, 0, 0);
+    context.clearRect(0, 0, canvas.width, canvas.height);
+
+    // Board coordinates in mm with the origin at a1 and y pointing up
+    var scale = canvas.width / width;
+    context.setTransform(scale, 0, 0, -canvas.height / length, 0, canvas.height);
+
+    var offset = 16;
+    for (var i = 0; i < count; i++) {
+        var kind = view.getUint8(offset);
+        var style = LAYER_STYLES[view.getUint8(offset + 1)];
+        var items = view.getUint16(offset + 2, true);
+        offset += 4;
+
+        // Every section starts on a multiple of 4 bytes, so the values are viewed without copying
+        var stride = KIND_STRIDES[kind];
+        var values = new Float32Array(data, offset, items * stride);
+        offset += values.byteLength;
+
+        context.strokeStyle = style.color;
+        context.lineWidth = style.width / scale;
+        context.setLineDash((style.dash || []).map(function(dash) { return dash / scale; }));
+
+        context.beginPath();
+
+        for (var j = 0; j < values.length; j += stride) {
+            if (kind == GeometryKind.CIRCLES) {
+                context.moveTo(values[j] + values[j + 2], values[j + 1]);
+                context.arc(values[j], values[j + 1], values[j + 2], 0, 2 * Math.PI);
+            } else if (kind == GeometryKind.LINES) {
+                context.moveTo(values[j], values[j + 1]);
+                context.lineTo(values[j + 2], values[j + 3]);
+            } else if (kind == GeometryKind.ARCS) {
+                var start = values[j + 3];
+                var end = start + values[j + 4];
+
+                context.moveTo(values[j] + values[j + 2] * Math.cos(start), values[j + 1] + values[j + 2] * Math.sin(start));
+                context.arc(values[j], values[j + 1], values[j + 2], start, end, end < start);
+            } else if (kind == GeometryKind.POLYLINE) {
+                if (j == 0) {
+                    context.moveTo(values[j], values[j + 1]);
+                } else {
+                    context.lineTo(values[j], values[j + 1]);
+                }
+            }
+        }
+
+        context.stroke();
+    }
 }
 
 // $('#startBtn').on("click", function() {
@@ -16,10 +16,13 @@ setup(
         "libsass",
         "chess",
         "stockfish",
-        "cairosvg",
-        "jsonrpc",
+        "Pillow",
+        "websockets",
         "simple-websocket",
         "gpiozero",
         "pybind11[global]"
     ],
+    extras_require={
+        "optimization": ["casadi"],
+    },
 )
\ No newline at end of file